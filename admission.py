@@ -0,0 +1,242 @@
+"""
+Admission control by workload class.
+
+Every request is mapped to a workload class by method and path (ROUTES):
+auth, staff-writes, dashboards, admin-reports, exports or long-poll. Each class has
+its own concurrency limit per worker process; requests over the limit
+wait in a bounded queue for up to queue_timeout seconds and are shed
+with 503 + Retry-After when the queue is full or the wait runs out.
+Unclassified routes are admitted as before.
+
+Classes with a non-zero "pool" also get their own DB connection pool
+(database.partition), so a burst of reports can hold at most its own
+connections and never the ones staff writes need. The rest share the
+default pool. A partition has no overflow, so such a class never admits
+more requests than it has connections: its concurrency is capped at
+its pool size, and requests beyond that wait in the admission queue
+rather than on the pool.
+
+Override per class with
+WORKLOAD_CLASSES='{"admin-reports": {"concurrency": 2, "queue": 4}}' and
+add routes with WORKLOAD_ROUTES='{"GET /admin/sbus": "dashboards"}'.
+GET /admin/workloads shows the configuration and live counters.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from fnmatch import translate
+from functools import lru_cache
+
+import anyio.to_thread
+import orjson
+
+import database
+import deadlines
+
+# ================= CONFIG =================
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+
+# concurrency: requests running at once; queue: requests allowed to wait;
+# queue_timeout: seconds one may wait; pool: dedicated DB connections (0 = shared pool)
+DEFAULT_CLASSES = {
+    "auth": {"concurrency": 8, "queue": 64, "queue_timeout": 5, "pool": 0},
+    "staff-writes": {"concurrency": 8, "queue": 128, "queue_timeout": 10, "pool": 8},
+    "dashboards": {"concurrency": 4, "queue": 32, "queue_timeout": 5, "pool": 4},
+    "admin-reports": {"concurrency": 4, "queue": 8, "queue_timeout": 15, "pool": 4},
+    "exports": {"concurrency": 2, "queue": 4, "queue_timeout": 30, "pool": 2},
+    # Change-feed readers; they give their connection back while waiting
+    "long-poll": {"concurrency": 8, "queue": 16, "queue_timeout": 5, "pool": 8},
+}
+
+# "METHOD path" pattern (* matches any id) -> class; first match wins
+DEFAULT_ROUTES = {
+    "POST /login": "auth",
+    "POST /token/refresh": "auth",
+    "POST /staff/change-password": "auth",
+    "POST /admin/staff/*/reset-password": "auth",
+    "POST /staff/sales": "staff-writes",
+    "POST /staff/expenses": "staff-writes",
+    "GET /staff/my-sbu": "dashboards",
+    "GET /staff/my-sbu/report": "dashboards",
+    "GET /staff/expenses/history": "dashboards",
+    "GET /staff/audit-logs": "dashboards",
+    "GET /admin/sbu-report": "admin-reports",
+    "GET /admin/sbu-report/range": "admin-reports",
+    "GET /admin/department-report": "admin-reports",
+    "GET /admin/company-report": "admin-reports",
+    "GET /admin/analytics/*": "admin-reports",
+    "GET /admin/staff/*/sbu-report": "admin-reports",
+    "GET /admin/staff/*/report/range": "admin-reports",
+    "GET /admin/audit-logs": "admin-reports",
+    "GET /admin/alerts": "admin-reports",
+    "POST /admin/import/*": "exports",
+    "GET /admin/jobs/*/result": "exports",
+    "POST /admin/edge/push": "exports",
+    "GET /admin/changes": "long-poll",
+}
+
+# Threads kept free for unclassified routes and background work
+THREADPOOL_RESERVE = 8
+
+# Retry-After sent with a 503
+RETRY_AFTER_SECONDS = 5
+
+
+def _load_classes() -> dict[str, dict]:
+    classes = {name: dict(spec) for name, spec in DEFAULT_CLASSES.items()}
+    for name, spec in json.loads(os.getenv("WORKLOAD_CLASSES", "{}")).items():
+        classes.setdefault(name, {"concurrency": 4, "queue": 8, "queue_timeout": 10, "pool": 0}).update(spec)
+    for spec in classes.values():
+        if spec["pool"]:
+            # One connection per admitted request; the rest queue here
+            spec["concurrency"] = min(spec["concurrency"], spec["pool"])
+    return classes
+
+
+def _load_routes() -> dict[str, str]:
+    # Overrides are checked before the defaults
+    routes = json.loads(os.getenv("WORKLOAD_ROUTES", "{}"))
+    for pattern, name in DEFAULT_ROUTES.items():
+        routes.setdefault(pattern, name)
+    return routes
+
+
+CLASSES = _load_classes()
+ROUTES = _load_routes()
+_PATTERNS = [(re.compile(translate(pattern)), name) for pattern, name in ROUTES.items()]
+
+
+@lru_cache(maxsize=4096)
+def classify(method: str, path: str) -> str | None:
+    route = f"{method} {path}"
+    for pattern, name in _PATTERNS:
+        if pattern.match(route):
+            return name
+    return None
+
+
+# ================= GATES =================
+class WorkloadGate:
+    """Concurrency limit with a bounded, time-limited wait queue (one per class per worker)."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float, pool: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.pool = pool
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def enter(self) -> bool:
+        if self._slots.locked():
+            if self.waiting >= self.queue:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def leave(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def status(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "queue_timeout": self.queue_timeout,
+            "pool": self.pool,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "pool_status": database.pool_status(self.name if self.pool else None),
+        }
+
+
+gates = {name: WorkloadGate(name, **spec) for name, spec in CLASSES.items()}
+
+for _name, _spec in CLASSES.items():
+    if _spec["pool"]:
+        database.partition(_name, _spec["pool"])
+
+
+def size_threadpool():
+    """Make the threadpool large enough that every class can reach its limit at once."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    needed = sum(spec["concurrency"] for spec in CLASSES.values()) + THREADPOOL_RESERVE
+    limiter.total_tokens = max(limiter.total_tokens, needed)
+
+
+def status() -> dict:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "threadpool": anyio.to_thread.current_default_thread_limiter().total_tokens,
+        "classes": {name: gate.status() for name, gate in gates.items()},
+        "routes": ROUTES,
+    }
+
+
+# ================= ASGI MIDDLEWARE =================
+_SHED_BODY = orjson.dumps({"detail": "Server busy, please retry"})
+
+
+class AdmissionMiddleware:
+    """
+    Holds each classified request in its class gate for the whole request
+    and tags it with its class, which selects the DB pool partition.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            return await self.app(scope, receive, send)
+
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        gate = gates[name]
+        queued_at = time.monotonic()
+        if not await gate.enter():
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _SHED_BODY})
+            return
+
+        # Time spent queued does not count against the query deadline
+        budget = deadlines.current_budget.get()
+        if budget is not None:
+            budget.deadline += time.monotonic() - queued_at
+
+        token = database.current_workload.set(name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            database.current_workload.reset(token)
+            gate.leave()
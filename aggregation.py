@@ -0,0 +1,148 @@
+"""
+Aggregation engine for the report endpoints.
+
+Sales and expenses in a scope and date range are flattened into one
+UNION ALL of fact rows (kind, sbu_id, staff_id, day, category, amount)
+and aggregated with conditional SUMs, so every measure for every group
+comes back from a single statement. Cancelled rows are always excluded.
+
+    aggregate(db, "sbu", sbu_id, start, end)                     # one total row
+    aggregate(db, "sbu", sbu_id, start, end, group_by="staff")   # + SBU members with no activity
+    aggregate(db, "staff", user_id, start, end, group_by="day")
+    aggregate(db, "portfolio", None, start, end, group_by="sbu")
+    aggregate(db, "portfolio", None, start, end, group_by="sbu_staff")  # (sbu_id, key) pairs
+"""
+from datetime import date
+
+from sqlalchemy import Date, Integer, String, case, func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from archive import sales_source, expenses_source
+from models import User
+
+SCOPES = ("sbu", "staff", "portfolio")
+GROUP_BY = (None, "day", "category", "staff", "sbu", "sbu_staff")
+
+
+def _scope_filter(model, scope: str, scope_id: str | None):
+    if scope == "sbu":
+        return [model.sbu_id == scope_id]
+    if scope == "staff":
+        return [model.created_by == scope_id]
+    return []
+
+
+def _facts(scope: str, scope_id: str | None, start: date, end: date, with_members: bool):
+    Sales = sales_source(start)
+    Expenses = expenses_source(start)
+
+    parts = [
+        select(
+            literal("sale").label("kind"),
+            Sales.sbu_id.label("sbu_id"),
+            Sales.created_by.label("staff_id"),
+            Sales.date.label("day"),
+            literal(None, String).label("category"),
+            Sales.amount.label("amount")
+        ).where(
+            Sales.date.between(start, end),
+            Sales.is_cancelled == False,
+            *_scope_filter(Sales, scope, scope_id)
+        ),
+        select(
+            literal("expense"),
+            Expenses.sbu_id,
+            Expenses.created_by,
+            Expenses.effective_from,
+            Expenses.category,
+            Expenses.amount
+        ).where(
+            Expenses.effective_from.between(start, end),
+            Expenses.is_cancelled == False,
+            *_scope_filter(Expenses, scope, scope_id)
+        ),
+    ]
+
+    # Zero-activity rows so every member of the SBU shows up in a staff breakdown
+    if with_members:
+        parts.append(
+            select(
+                literal("member"),
+                User.sbu_id,
+                User.id,
+                literal(None, Date),
+                literal(None, String),
+                literal(0, Integer)
+            ).where(User.sbu_id == scope_id)
+        )
+
+    return union_all(*parts).subquery("facts")
+
+
+def aggregate(
+    db: Session,
+    scope: str,
+    scope_id: str | None,
+    start: date,
+    end: date,
+    group_by: str | None = None
+) -> list[dict]:
+    """
+    Rows of {key, sales, expenses} (plus staff_name / is_member when
+    grouping by staff, sbu_id / staff_name for sbu_staff) for the scope
+    and inclusive date range.
+    """
+    if scope not in SCOPES or group_by not in GROUP_BY:
+        raise ValueError(f"Unsupported aggregation: {scope} / {group_by}")
+
+    with_members = scope == "sbu" and group_by == "staff"
+    facts = _facts(scope, scope_id, start, end, with_members)
+
+    measures = [
+        func.coalesce(func.sum(case((facts.c.kind == "sale", facts.c.amount), else_=0)), 0).label("sales"),
+        func.coalesce(func.sum(case((facts.c.kind == "expense", facts.c.amount), else_=0)), 0).label("expenses"),
+    ]
+
+    if group_by is None:
+        stmt = select(*measures).select_from(facts)
+    elif group_by == "staff":
+        stmt = (
+            select(
+                facts.c.staff_id.label("key"),
+                User.full_name.label("staff_name"),
+                func.max(case((facts.c.kind == "member", 1), else_=0)).label("is_member"),
+                *measures
+            )
+            .select_from(facts.outerjoin(User, User.id == facts.c.staff_id))
+            .group_by(facts.c.staff_id, User.full_name)
+        )
+    elif group_by == "sbu_staff":
+        stmt = (
+            select(
+                facts.c.sbu_id.label("sbu_id"),
+                facts.c.staff_id.label("key"),
+                User.full_name.label("staff_name"),
+                *measures
+            )
+            .select_from(facts.outerjoin(User, User.id == facts.c.staff_id))
+            .group_by(facts.c.sbu_id, facts.c.staff_id, User.full_name)
+        )
+    else:
+        key = {"day": facts.c.day, "category": facts.c.category, "sbu": facts.c.sbu_id}[group_by]
+        stmt = select(key.label("key"), *measures).group_by(key).order_by(key)
+
+    rows = []
+    for row in db.execute(stmt).mappings():
+        row = dict(row)
+        row["sales"] = int(row["sales"])
+        row["expenses"] = int(row["expenses"])
+        rows.append(row)
+    return rows
+
+
+def totals(rows: list[dict]) -> tuple[int, int]:
+    """(sales, expenses) summed over aggregate() rows."""
+    return (
+        sum(r["sales"] for r in rows),
+        sum(r["expenses"] for r in rows)
+    )
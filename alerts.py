@@ -0,0 +1,154 @@
+import threading
+from datetime import date
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from bus import bus
+from catalog import sbu_catalog
+from database import SessionLocal
+from keys import new_id
+from models import Sale, Expense, AlertThreshold, BudgetAlert
+
+# ================= CONFIG =================
+DEFAULT_EXCELLENT_PERCENT = 100
+DEFAULT_WARNING_PERCENT = 80
+THRESHOLD_CHANNEL = "alert_thresholds"
+
+
+# ================= THRESHOLDS =================
+_thresholds: dict[str, tuple[int, int]] = {}
+_stale = True
+_lock = threading.Lock()
+
+
+def _invalidate(payload: str = ""):
+    global _stale
+    _stale = True
+
+
+bus.subscribe(THRESHOLD_CHANNEL, _invalidate)
+
+
+def thresholds_for(db: Session, sbu_id: str) -> tuple[int, int]:
+    """(excellent, warning) percent thresholds for an SBU."""
+    global _thresholds, _stale
+
+    if _stale:
+        with _lock:
+            _thresholds = {
+                t.sbu_id: (t.excellent_percent, t.warning_percent)
+                for t in db.query(AlertThreshold).all()
+            }
+            _stale = False
+
+    return _thresholds.get(sbu_id, (DEFAULT_EXCELLENT_PERCENT, DEFAULT_WARNING_PERCENT))
+
+
+def classify(db: Session, sbu_id: str, performance_percent: float) -> str:
+    excellent, warning = thresholds_for(db, sbu_id)
+    return (
+        "Excellent"
+        if performance_percent >= excellent
+        else "warning"
+        if performance_percent >= warning
+        else "Critical"
+    )
+
+
+# ================= EVALUATION =================
+def evaluate(db: Session, sbu_id: str, day: date):
+    """Recompute one SBU's budget performance for one day and upsert its alert."""
+    sbu = sbu_catalog.get(db, sbu_id)
+    if not sbu:
+        return
+
+    sales = (
+        db.query(func.coalesce(func.sum(Sale.amount), 0))
+        .filter(Sale.sbu_id == sbu_id, Sale.date == day, Sale.is_cancelled == False)
+        .scalar()
+    )
+    expenses = (
+        db.query(func.coalesce(func.sum(Expense.amount), 0))
+        .filter(Expense.sbu_id == sbu_id, Expense.effective_from == day, Expense.is_cancelled == False)
+        .scalar()
+    )
+
+    performance = (
+        round((sales / sbu.daily_budget) * 100, 2)
+        if sbu.daily_budget and sbu.daily_budget > 0
+        else 0
+    )
+
+    alert = (
+        db.query(BudgetAlert)
+        .filter(BudgetAlert.sbu_id == sbu_id, BudgetAlert.alert_date == day)
+        .first()
+    )
+    if not alert:
+        alert = BudgetAlert(id=new_id(), sbu_id=sbu_id, alert_date=day)
+        db.add(alert)
+
+    alert.status = classify(db, sbu_id, performance)
+    alert.performance_percent = performance
+    alert.sales = sales
+    alert.expenses = expenses
+    alert.daily_budget = sbu.daily_budget or 0
+
+    db.commit()
+
+
+class AlertEngine:
+    """
+    Re-evaluates budget alerts off the request path.
+
+    Write handlers submit the (SBU, day) they touched; a single worker
+    thread drains the pending set, so a burst of writes to one SBU
+    collapses into one evaluation.
+    """
+
+    def __init__(self):
+        self._pending: set[tuple[str, date]] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, sbu_id: str | None, day: date):
+        if not sbu_id:
+            return
+        with self._lock:
+            self._pending.add((sbu_id, day))
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+
+            with self._lock:
+                batch, self._pending = self._pending, set()
+
+            for sbu_id, day in batch:
+                db = SessionLocal()
+                try:
+                    evaluate(db, sbu_id, day)
+                except Exception as e:
+                    db.rollback()
+                    print("Alert evaluation failed:", sbu_id, day, e)
+                finally:
+                    db.close()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+alert_engine = AlertEngine()
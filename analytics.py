@@ -0,0 +1,163 @@
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from archive import sales_source, expenses_source
+from catalog import sbu_catalog
+
+
+# ================= SERIES =================
+class DailySeries:
+    """Daily sales / expense totals as [sbu x day] arrays."""
+
+    def __init__(self, sbus, start: date, days: int):
+        self.sbus = sbus
+        self.start = start
+        self.days = days
+        self.index = {sbu.id: i for i, sbu in enumerate(sbus)}
+        self.sales = np.zeros((len(sbus), days), dtype=np.int64)
+        self.expenses = np.zeros((len(sbus), days), dtype=np.int64)
+        self.budget = np.array([sbu.daily_budget or 0 for sbu in sbus], dtype=np.float64)
+
+    @property
+    def dates(self) -> list[date]:
+        return [self.start + timedelta(days=i) for i in range(self.days)]
+
+
+def load_daily_series(db: Session, start: date, end: date) -> DailySeries:
+    """Pull every active SBU's daily sales and expenses in one query."""
+    sbus = [sbu for sbu in sbu_catalog.all(db) if sbu.is_active]
+    series = DailySeries(sbus, start, (end - start).days + 1)
+
+    Sales = sales_source(start)
+    Expenses = expenses_source(start)
+
+    sales = (
+        select(
+            Sales.sbu_id,
+            Sales.date.label("day"),
+            literal(0).label("kind"),
+            func.sum(Sales.amount).label("amount")
+        )
+        .where(Sales.date.between(start, end), Sales.is_cancelled == False)
+        .group_by(Sales.sbu_id, Sales.date)
+    )
+    expenses = (
+        select(
+            Expenses.sbu_id,
+            Expenses.effective_from.label("day"),
+            literal(1).label("kind"),
+            func.sum(Expenses.amount).label("amount")
+        )
+        .where(Expenses.effective_from.between(start, end), Expenses.is_cancelled == False)
+        .group_by(Expenses.sbu_id, Expenses.effective_from)
+    )
+
+    rows = db.execute(union_all(sales, expenses)).all()
+    rows = [r for r in rows if r[0] in series.index]
+    if not rows:
+        return series
+
+    sbu_idx = np.fromiter((series.index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+    day_idx = np.fromiter(((r[1] - start).days for r in rows), dtype=np.int64, count=len(rows))
+    kind = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+    amount = np.fromiter((int(r[3]) for r in rows), dtype=np.int64, count=len(rows))
+
+    is_sale = kind == 0
+    np.add.at(series.sales, (sbu_idx[is_sale], day_idx[is_sale]), amount[is_sale])
+    np.add.at(series.expenses, (sbu_idx[~is_sale], day_idx[~is_sale]), amount[~is_sale])
+    return series
+
+
+# ================= VECTOR OPS =================
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean along the day axis; the first days average what exists."""
+    csum = np.cumsum(values, axis=1, dtype=np.float64)
+    shifted = np.zeros_like(csum)
+    shifted[:, window:] = csum[:, :-window]
+    counts = np.minimum(np.arange(1, values.shape[1] + 1), window)
+    return (csum - shifted) / counts
+
+
+def growth(values: np.ndarray, span: int) -> np.ndarray:
+    """Percent change of the last `span` days over the `span` days before."""
+    current = values[:, -span:].sum(axis=1).astype(np.float64)
+    previous = values[:, -2 * span:-span].sum(axis=1).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(previous > 0, (current - previous) / previous * 100, 0.0)
+    return np.round(pct, 2)
+
+
+def _round(values: np.ndarray) -> list:
+    return np.round(values, 2).tolist()
+
+
+# ================= REPORTS =================
+def trends(db: Session, end: date, days: int, window: int) -> dict:
+    # Every returned day needs a full `window` of history behind it, and
+    # month-over-month needs 60 days
+    history = max(days + window - 1, 60)
+    series = load_daily_series(db, end - timedelta(days=history - 1), end)
+
+    # The last `days` points; the partial-window warm-up before them is dropped
+    sales_avg = rolling_mean(series.sales, window)[:, -days:]
+    expense_avg = rolling_mean(series.expenses, window)[:, -days:]
+    wow = growth(series.sales, 7)
+    mom = growth(series.sales, 30)
+
+    return {
+        "window": window,
+        "dates": [d.isoformat() for d in series.dates[-days:]],
+        "sbus": [
+            {
+                "sbu_id": sbu.id,
+                "sbu_name": sbu.name,
+                "sales_rolling_avg": _round(sales_avg[i]),
+                "expenses_rolling_avg": _round(expense_avg[i]),
+                "week_over_week_percent": float(wow[i]),
+                "month_over_month_percent": float(mom[i])
+            }
+            for i, sbu in enumerate(series.sbus)
+        ]
+    }
+
+
+def forecast(db: Session, start: date, horizon: int, history_weeks: int) -> dict:
+    """
+    Seasonal (day-of-week) forecast: each future day is the mean of the
+    same weekday over the last `history_weeks` weeks.
+    """
+    history_days = history_weeks * 7
+    series = load_daily_series(db, start - timedelta(days=history_days), start - timedelta(days=1))
+
+    # [sbu x week x weekday-slot]; slot k is the weekday of history day k
+    weekly = series.sales.reshape(len(series.sbus), history_weeks, 7)
+    by_slot = weekly.mean(axis=1)
+
+    # Future day d falls on the same slot as history day (d mod 7)
+    slots = np.arange(horizon) % 7
+    projected = by_slot[:, slots]
+
+    totals = projected.sum(axis=1)
+    targets = series.budget * horizon
+    with np.errstate(divide="ignore", invalid="ignore"):
+        performance = np.where(targets > 0, totals / targets * 100, 0.0)
+
+    return {
+        "from": start,
+        "to": start + timedelta(days=horizon - 1),
+        "history_weeks": history_weeks,
+        "sbus": [
+            {
+                "sbu_id": sbu.id,
+                "sbu_name": sbu.name,
+                "daily_forecast": _round(projected[i]),
+                "forecast_total": round(float(totals[i]), 2),
+                "budget_total": int(targets[i]),
+                "forecast_performance_percent": round(float(performance[i]), 2)
+            }
+            for i, sbu in enumerate(series.sbus)
+        ]
+    }
@@ -0,0 +1,314 @@
+"""
+Time partitioning and archival for sales, expenses and audit_logs.
+
+    python archive.py partition             # one-off, MySQL: monthly RANGE COLUMNS partitions
+    python archive.py extend --months 3     # add upcoming monthly partitions (run from cron)
+    python archive.py archive --fiscal-year 2024
+
+`partition` drops the foreign keys on the three tables and widens their
+primary keys to (id, <date column>), as MySQL requires for partitioned
+InnoDB tables.
+
+`archive` moves every row up to the end of the given closed fiscal year
+into the compressed *_archive tables and records the cutoff in
+archive_watermarks. Report queries read from sales_source() /
+expenses_source(), which only union the archive in when the requested
+range starts before that cutoff.
+"""
+import argparse
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, insert, delete, func, union_all, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
+
+from bus import bus
+from database import Base, get_engine
+from models import (
+    Sale,
+    Expense,
+    AuditLog,
+    SaleArchive,
+    ExpenseArchive,
+    AuditLogArchive,
+    ArchiveWatermark
+)
+
+# ================= CONFIG =================
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "1"))
+ARCHIVE_CHANNEL = "archive"
+
+# table -> (live model, archive model, partition / range column)
+ARCHIVED_TABLES = {
+    "sales": (Sale, SaleArchive, "date"),
+    "expenses": (Expense, ExpenseArchive, "effective_from"),
+    "audit_logs": (AuditLog, AuditLogArchive, "created_at"),
+}
+
+
+# ================= WATERMARKS =================
+_watermarks: dict[str, date] = {}
+_stale = True
+_lock = threading.Lock()
+
+
+def _invalidate(payload: str = ""):
+    global _stale
+    _stale = True
+
+
+bus.subscribe(ARCHIVE_CHANNEL, _invalidate)
+
+
+def archived_before(table: str) -> date:
+    """Rows dated before this live in the archive table."""
+    global _watermarks, _stale
+
+    if _stale:
+        with _lock:
+            try:
+                with get_engine().connect() as conn:
+                    rows = conn.execute(
+                        select(ArchiveWatermark.table_name, ArchiveWatermark.archived_before)
+                    ).all()
+                _watermarks = dict(rows)
+            except SQLAlchemyError:
+                # Nothing archived yet on this database
+                _watermarks = {}
+            _stale = False
+
+    return _watermarks.get(table, date.min)
+
+
+# ================= REPORT SOURCES =================
+def _source(table: str, start: date | None):
+    live, archive, column = ARCHIVED_TABLES[table]
+    cutoff = archived_before(table)
+
+    if cutoff == date.min or (start is not None and start >= cutoff):
+        # Nothing archived yet, or the range starts after the cutoff
+        return live
+
+    # Split on the cutoff so rows not yet purged from the live table
+    # after an archive run are never counted twice
+    union = union_all(
+        select(*[live.__table__.c[c.name] for c in archive.__table__.columns])
+        .where(live.__table__.c[column] >= cutoff),
+        select(*archive.__table__.columns)
+        .where(archive.__table__.c[column] < cutoff)
+    ).subquery(f"{table}_all")
+
+    return aliased(live, union)
+
+
+def sales_source(start: date | None):
+    """Sale, or Sale over live + archived rows when `start` reaches the archive."""
+    return _source("sales", start)
+
+
+def expenses_source(start: date | None):
+    """Expense, or Expense over live + archived rows when `start` reaches the archive."""
+    return _source("expenses", start)
+
+
+# ================= PARTITIONS =================
+def _month_start(d) -> date:
+    if isinstance(d, datetime):
+        d = d.date()
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_defs(first: date, last: date) -> list[str]:
+    defs = []
+    month = first
+    while month <= last:
+        defs.append(
+            f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{_next_month(month).isoformat()}')"
+        )
+        month = _next_month(month)
+    return defs
+
+
+def _partitions(conn, table: str) -> list[str]:
+    return [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t "
+                "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+            ),
+            {"t": table}
+        )
+    ]
+
+
+def _foreign_keys(conn, table: str) -> list[str]:
+    return [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+                "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+            ),
+            {"t": table}
+        )
+    ]
+
+
+def _require_mysql(engine):
+    if engine.dialect.name != "mysql":
+        raise SystemExit("Partitioning is only supported on MySQL")
+
+
+def partition(months_ahead: int):
+    engine = get_engine()
+    _require_mysql(engine)
+    last = _month_start(date.today())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+
+    with engine.begin() as conn:
+        for table, (live, _, column) in ARCHIVED_TABLES.items():
+            if _partitions(conn, table):
+                print(f"{table}: already partitioned")
+                continue
+
+            oldest = conn.execute(select(func.min(live.__table__.c[column]))).scalar()
+            first = _month_start(oldest or date.today())
+
+            for fk in _foreign_keys(conn, table):
+                conn.exec_driver_sql(f"ALTER TABLE `{table}` DROP FOREIGN KEY `{fk}`")
+            conn.exec_driver_sql(
+                f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (id, `{column}`)"
+            )
+
+            defs = _partition_defs(first, last) + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]
+            conn.exec_driver_sql(
+                f"ALTER TABLE `{table}` PARTITION BY RANGE COLUMNS(`{column}`) ({', '.join(defs)})"
+            )
+            print(f"{table}: {len(defs)} partitions")
+
+
+def extend(months_ahead: int):
+    engine = get_engine()
+    _require_mysql(engine)
+    last = _month_start(date.today())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+
+    with engine.begin() as conn:
+        for table in ARCHIVED_TABLES:
+            existing = [p for p in _partitions(conn, table) if p != "pmax"]
+            if not existing:
+                print(f"{table}: not partitioned, run `partition` first")
+                continue
+
+            newest = datetime.strptime(existing[-1], "p%Y%m").date()
+            first = _next_month(newest)
+            if first > last:
+                continue
+
+            defs = _partition_defs(first, last) + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]
+            conn.exec_driver_sql(
+                f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ({', '.join(defs)})"
+            )
+            print(f"{table}: added {len(defs) - 1} partitions")
+
+
+# ================= ARCHIVAL =================
+def fiscal_year_end(fiscal_year: int) -> date:
+    """Exclusive end of the fiscal year that starts in `fiscal_year`."""
+    return date(fiscal_year + 1, FISCAL_YEAR_START_MONTH, 1)
+
+
+def archive(fiscal_year: int):
+    engine = get_engine()
+    cutoff = fiscal_year_end(fiscal_year)
+
+    today = date.today()
+    current_fy_start = date(
+        today.year if today.month >= FISCAL_YEAR_START_MONTH else today.year - 1,
+        FISCAL_YEAR_START_MONTH,
+        1
+    )
+    if cutoff > current_fy_start:
+        raise SystemExit(f"Fiscal year {fiscal_year} is not closed yet")
+
+    Base.metadata.create_all(
+        engine,
+        tables=[m.__table__ for _, m, _ in ARCHIVED_TABLES.values()] + [ArchiveWatermark.__table__]
+    )
+
+    for table, (live, archived, column) in ARCHIVED_TABLES.items():
+        live_col = live.__table__.c[column]
+        archive_col = archived.__table__.c[column]
+        names = [c.name for c in archived.__table__.columns]
+
+        # Copy and move the watermark in one transaction: readers switch
+        # to the archive for these dates exactly when the rows land there
+        with engine.begin() as conn:
+            previous = conn.execute(
+                select(ArchiveWatermark.archived_before).where(ArchiveWatermark.table_name == table)
+            ).scalar() or date.min
+            if previous >= cutoff:
+                print(f"{table}: already archived before {previous}")
+                continue
+
+            conn.execute(
+                delete(archived.__table__).where(archive_col >= previous, archive_col < cutoff)
+            )
+            moved = conn.execute(
+                insert(archived.__table__).from_select(
+                    names,
+                    select(*[live.__table__.c[n] for n in names])
+                    .where(live_col >= previous, live_col < cutoff)
+                )
+            ).rowcount
+
+            conn.execute(delete(ArchiveWatermark.__table__).where(ArchiveWatermark.table_name == table))
+            conn.execute(insert(ArchiveWatermark.__table__).values(table_name=table, archived_before=cutoff))
+
+        # Purge the live copies; whole partitions are dropped, not deleted
+        with engine.begin() as conn:
+            partitions = _partitions(conn, table) if engine.dialect.name == "mysql" else []
+            closed = [
+                p for p in partitions
+                if p != "pmax" and _next_month(datetime.strptime(p, "p%Y%m").date()) <= cutoff
+            ]
+            if closed:
+                conn.exec_driver_sql(f"ALTER TABLE `{table}` DROP PARTITION {', '.join(closed)}")
+            conn.execute(delete(live.__table__).where(live_col < cutoff))
+
+        print(f"{table}: archived {moved} rows before {cutoff}")
+
+    bus.publish(ARCHIVE_CHANNEL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("partition")
+    p.add_argument("--months", type=int, default=3, help="months of partitions ahead of today")
+
+    p = sub.add_parser("extend")
+    p.add_argument("--months", type=int, default=3, help="months of partitions ahead of today")
+
+    p = sub.add_parser("archive")
+    p.add_argument("--fiscal-year", type=int, required=True, help="archive this and all earlier fiscal years")
+
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        partition(args.months)
+    elif args.command == "extend":
+        extend(args.months)
+    else:
+        archive(args.fiscal_year)
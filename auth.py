@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from fastapi import Header
@@ -15,20 +14,26 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 # ================= SECURITY =================
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib/bcrypt and jose are imported on first use, not at app import
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 # ================= PASSWORD =================
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password[:72])
+    return pwd_context().hash(password[:72])
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     print("PASSWORD LENGTH:", len(plain_password))
-    return pwd_context.verify(plain_password[:72], hashed_password)
+    return pwd_context().verify(plain_password[:72], hashed_password)
 
 # ================= TOKEN =================
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
+    from jose import jwt
+
     to_encode = data.copy()
 
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -47,6 +52,8 @@ def get_current_user(
             detail="Not authenticated"
         )
 
+    from jose import JWTError, jwt
+
     token = authorization.split(" ")[1]
 
     try:
@@ -0,0 +1,60 @@
+"""
+Cold-start benchmark.
+
+Imports the app in fresh interpreters and reports the median import
+time of main, plus the first OpenAPI schema build with and without the
+build-time cache (openapi.json).
+
+    python benchmarks/bench_import.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+RUNS = 7
+
+IMPORT = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+OPENAPI = "import main, time; t = time.perf_counter(); main.app.openapi(); print(time.perf_counter() - t)"
+
+
+def measure(code, env):
+    samples = []
+    for _ in range(RUNS):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(out.strip().splitlines()[-1]))
+    return statistics.median(samples) * 1000
+
+
+def slowest_imports(env, n=10):
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in err.splitlines()[1:]:
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace(":", "|", 1).split("|"))
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:n]
+
+
+if __name__ == "__main__":
+    env = {**os.environ, "DATABASE_URL": os.getenv("DATABASE_URL", "sqlite://")}
+    cache = os.path.join(ROOT, "openapi.json")
+
+    print(f"import main           {measure(IMPORT, env):8.1f} ms")
+
+    if os.path.exists(cache):
+        os.remove(cache)
+    print(f"openapi (no cache)    {measure(OPENAPI, env):8.1f} ms")
+
+    subprocess.run([sys.executable, "-c", "import main; main.write_openapi_cache()"], cwd=ROOT, env=env, check=True)
+    print(f"openapi (cached)      {measure(OPENAPI, env):8.1f} ms")
+
+    print("\nslowest imports (cumulative):")
+    for cumulative_us, name in slowest_imports(env):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
@@ -0,0 +1,92 @@
+"""
+Response serialization benchmark.
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json) with
+the orjson / pydantic-core path in responses.py on large payloads
+shaped like /staff/expenses/history, /admin/audit-logs and
+/admin/sbu-report.
+
+    python benchmarks/bench_json.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+
+from responses import dumps, model_response
+from schemas import SBUReportWithStaffSchema
+
+
+def expense_history(days=3650):
+    today = date.today()
+    return {
+        (today - timedelta(days=i)).isoformat(): {
+            "consumables": i,
+            "general_expenses": i * 2,
+            "utilities": i * 3,
+            "miscellaneous": i * 4
+        }
+        for i in range(days)
+    }
+
+
+def audit_logs(n=5000):
+    now = datetime.utcnow()
+    return [
+        {"staff": f"Staff {i}", "action": f"Recorded sale ₦{i}", "time": now}
+        for i in range(n)
+    ]
+
+
+def sbu_report(staff=2000):
+    return {
+        "period": "monthly",
+        "total_sales": 1_000_000,
+        "total_expenses": 400_000,
+        "net_profit": 600_000,
+        "performance_percent": 87.5,
+        "staff_breakdown": [
+            {
+                "staff_id": str(i),
+                "staff_name": f"Staff {i}",
+                "total_sales": i * 100,
+                "total_expenses": i * 40,
+                "net_profit": i * 60
+            }
+            for i in range(staff)
+        ]
+    }
+
+
+def before(payload):
+    return json.dumps(jsonable_encoder(payload)).encode()
+
+
+def before_model(payload):
+    obj = SBUReportWithStaffSchema.model_validate(payload)
+    return json.dumps(jsonable_encoder(obj)).encode()
+
+
+def report(name, old, new, number=20):
+    t_old = timeit.timeit(old, number=number) / number
+    t_new = timeit.timeit(new, number=number) / number
+    print(f"{name:<20} before {t_old * 1000:8.2f} ms   after {t_new * 1000:8.2f} ms   x{t_old / t_new:5.1f}")
+
+
+if __name__ == "__main__":
+    history = expense_history()
+    logs = audit_logs()
+    sbu = sbu_report()
+
+    report("expense history", lambda: before(history), lambda: dumps(history))
+    report("audit logs", lambda: before(logs), lambda: dumps(logs))
+    report(
+        "sbu report model",
+        lambda: before_model(sbu),
+        lambda: model_response(SBUReportWithStaffSchema, sbu).body
+    )
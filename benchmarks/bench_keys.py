@@ -0,0 +1,117 @@
+"""
+Primary key benchmark.
+
+Inserts the same sales-shaped rows into two scratch tables, one keyed by
+random UUIDv4 strings in CHAR(36) and one by keys.new_id() in UUIDKey
+(BINARY(16) on MySQL), and reports insert throughput and on-disk data /
+index size for each.
+
+    BENCH_DATABASE_URL=mysql+pymysql://... python benchmarks/bench_keys.py --rows 200000
+
+Without BENCH_DATABASE_URL it runs against a throwaway SQLite file, which
+only shows the key-ordering effect, not InnoDB page splits.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import Column, Date, Index, Integer, MetaData, String, Table, create_engine, insert, text
+
+from keys import UUIDKey, new_id
+
+
+def scratch_tables(metadata: MetaData) -> dict[str, tuple[Table, callable]]:
+    def table(name, key_type):
+        return Table(
+            name, metadata,
+            Column("id", key_type, primary_key=True),
+            Column("sbu_id", key_type, nullable=False),
+            Column("created_by", key_type),
+            Column("amount", Integer, nullable=False),
+            Column("date", Date, nullable=False),
+            Index(f"ix_{name}_sbu_date", "sbu_id", "date"),
+            Index(f"ix_{name}_created_by", "created_by"),
+        )
+
+    return {
+        "uuid4 CHAR(36)": (table("bench_keys_uuid4", String(36)), lambda: str(uuid.uuid4())),
+        "uuid7 UUIDKey": (table("bench_keys_uuid7", UUIDKey), new_id),
+    }
+
+
+def size_of(conn, table: str) -> str:
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"ANALYZE TABLE `{table}`"))
+        data, index = conn.execute(
+            text(
+                "SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+            ),
+            {"t": table}
+        ).one()
+        return f"data {data / 2**20:.1f} MiB, indexes {index / 2**20:.1f} MiB"
+
+    if conn.dialect.name == "sqlite":
+        pages = conn.execute(
+            text(
+                "SELECT count(*) FROM dbstat d JOIN sqlite_master m ON m.name = d.name "
+                "WHERE m.tbl_name = :t"
+            ),
+            {"t": table}
+        ).scalar()
+        return f"{pages} pages"
+    return "n/a"
+
+
+def run(url: str, rows: int, batch: int):
+    engine = create_engine(url)
+    metadata = MetaData()
+    tables = scratch_tables(metadata)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    sbus = [str(uuid.uuid4()) for _ in range(50)]
+    staff = [str(uuid.uuid4()) for _ in range(500)]
+    start = date.today() - timedelta(days=365)
+
+    try:
+        for label, (table, make_id) in tables.items():
+            elapsed = 0.0
+            for i in range(0, rows, batch):
+                values = [
+                    {
+                        "id": make_id(),
+                        "sbu_id": random.choice(sbus),
+                        "created_by": random.choice(staff),
+                        "amount": random.randint(100, 100_000),
+                        "date": start + timedelta(days=(i + j) * 365 // rows)
+                    }
+                    for j in range(min(batch, rows - i))
+                ]
+                t = time.perf_counter()
+                with engine.begin() as conn:
+                    conn.execute(insert(table), values)
+                elapsed += time.perf_counter() - t
+
+            with engine.connect() as conn:
+                size = size_of(conn, table.name)
+            print(f"{label:16} {rows / elapsed:10,.0f} rows/s   {size}")
+    finally:
+        metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench_keys.db"
+    run(url, args.rows, args.batch)
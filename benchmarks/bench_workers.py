@@ -0,0 +1,97 @@
+"""
+Worker scaling benchmark.
+
+Starts serve.py with 1, 2, 4 ... workers (up to the available cores)
+and measures requests/second on /login and /staff/my-sbu.
+
+    DATABASE_URL=... SECRET_KEY=... \\
+        python benchmarks/bench_workers.py --username staff1 --password secret
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from serve import available_cores
+
+
+def call(url, body=None, token=None):
+    req = urllib.request.Request(url, data=body, method="POST" if body else "GET")
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+def wait_ready(base, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base}/docs")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def throughput(fn, requests, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda _: fn(), range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def run(workers, args):
+    port = str(args.port)
+    base = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "WEB_WORKERS": str(workers), "PORT": port, "HOST": "127.0.0.1"}
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(base)
+        creds = json.dumps({"username": args.username, "password": args.password}).encode()
+        token = call(f"{base}/login", creds)["access_token"]
+        concurrency = workers * 4
+
+        login_rps = throughput(lambda: call(f"{base}/login", creds), args.requests // 4, concurrency)
+        dash_rps = throughput(lambda: call(f"{base}/staff/my-sbu", token=token), args.requests, concurrency)
+        return login_rps, dash_rps
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    counts, n = [], 1
+    while n <= available_cores():
+        counts.append(n)
+        n *= 2
+
+    baseline = None
+    for workers in counts:
+        login_rps, dash_rps = run(workers, args)
+        baseline = baseline or (login_rps, dash_rps)
+        print(
+            f"workers={workers:<3} login {login_rps:8.1f} req/s (x{login_rps / baseline[0]:4.1f})"
+            f"   my-sbu {dash_rps:8.1f} req/s (x{dash_rps / baseline[1]:4.1f})"
+        )
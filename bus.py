@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+
+# ================= CONFIG =================
+# One SQLite file per host, shared by every worker process
+BUS_PATH = os.getenv(
+    "APP_BUS_PATH",
+    os.path.join(tempfile.gettempdir(), "drphysiq_bus.sqlite3")
+)
+BUS_POLL_SECONDS = float(os.getenv("APP_BUS_POLL_SECONDS", "0.5"))
+BUS_RETENTION_SECONDS = 3600
+
+
+# ================= BUS =================
+class EventBus:
+    """
+    Cross-process pub/sub over a SQLite WAL journal.
+
+    publish() appends a row and dispatches to local subscribers straight
+    away; a daemon thread in every worker tails the table and dispatches
+    rows written by the other workers.
+    """
+
+    def __init__(self, path: str = BUS_PATH):
+        self.path = path
+        self._handlers: dict[str, list[Callable[[str], None]]] = defaultdict(list)
+        self._last_id = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " pid INTEGER NOT NULL,"
+            " channel TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        return conn
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]):
+        self._handlers[channel].append(handler)
+
+    def _dispatch(self, channel: str, payload: str):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                print("Bus handler failed:", channel, e)
+
+    def publish(self, channel: str, payload: str = ""):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO events (pid, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                (os.getpid(), channel, payload, now)
+            )
+            conn.execute(
+                "DELETE FROM events WHERE created_at < ?",
+                (now - BUS_RETENTION_SECONDS,)
+            )
+        finally:
+            conn.close()
+        self._dispatch(channel, payload)
+
+    def _poll(self):
+        conn = None
+        try:
+            while not self._stop.wait(BUS_POLL_SECONDS):
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    rows = conn.execute(
+                        "SELECT id, pid, channel, payload FROM events WHERE id > ? ORDER BY id",
+                        (self._last_id,)
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    # Locked or I/O error: reconnect on the next tick, never stop tailing
+                    print("Event bus poll failed:", e)
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    continue
+
+                for event_id, pid, channel, payload in rows:
+                    self._last_id = event_id
+                    if pid != os.getpid():
+                        self._dispatch(channel, payload)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def start(self):
+        """Start tailing; call once per worker, after fork."""
+        if self._thread and self._thread.is_alive():
+            return
+        conn = self._connect()
+        try:
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+bus = EventBus()
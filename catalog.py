@@ -0,0 +1,89 @@
+import threading
+
+from sqlalchemy.orm import Session
+
+from bus import bus
+from models import SBU
+
+
+CATALOG_CHANNEL = "sbu_catalog"
+
+
+# ================= ENTRY =================
+class SBUEntry:
+    """Read-only snapshot of the SBU columns the report handlers need."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "department",
+        "daily_budget",
+        "personnel_cost",
+        "rent",
+        "electricity",
+        "is_active",
+    )
+
+    def __init__(self, sbu: SBU):
+        self.id = sbu.id
+        self.name = sbu.name
+        self.department = sbu.department
+        self.daily_budget = sbu.daily_budget
+        self.personnel_cost = sbu.personnel_cost or 0
+        self.rent = sbu.rent or 0
+        self.electricity = sbu.electricity or 0
+        self.is_active = sbu.is_active is not False
+
+
+# ================= CATALOG =================
+class SBUCatalog:
+    """
+    Process-wide SBU lookup table.
+
+    Loaded once at startup and reloaded lazily after an invalidation
+    arrives on the event bus, so a write in any worker refreshes every
+    other worker's copy without a query per request.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, SBUEntry] = {}
+        self._stale = True
+        self._lock = threading.Lock()
+        bus.subscribe(CATALOG_CHANNEL, self.invalidate)
+
+    def invalidate(self, payload: str = ""):
+        self._stale = True
+
+    def load(self, db: Session):
+        with self._lock:
+            self._stale = False
+            self._entries = {sbu.id: SBUEntry(sbu) for sbu in db.query(SBU).all()}
+
+    def bump(self, db: Session):
+        """Announce a committed SBU write to every worker."""
+        bus.publish(CATALOG_CHANNEL)
+        self.load(db)
+
+    def get(self, db: Session, sbu_id: str | None) -> SBUEntry | None:
+        if not sbu_id:
+            return None
+
+        if self._stale:
+            self.load(db)
+
+        entry = self._entries.get(sbu_id)
+        if entry is None:
+            # Created by a worker that has not bumped yet
+            sbu = db.query(SBU).filter(SBU.id == sbu_id).first()
+            if sbu:
+                entry = SBUEntry(sbu)
+                self._entries[sbu_id] = entry
+        return entry
+
+    def all(self, db: Session) -> list[SBUEntry]:
+        if self._stale:
+            self.load(db)
+        return list(self._entries.values())
+
+
+sbu_catalog = SBUCatalog()
@@ -0,0 +1,252 @@
+"""
+In-memory report cube for recent history.
+
+Holds the last CUBE_MONTHS months as one int64 array indexed
+[sbu x day x measure], built from a single grouped query at startup.
+Sale and expense writes publish their deltas on the event bus after
+commit, tagged with the outbox seq of that commit, so the cube in every
+worker stays current without re-reading the database; a build records
+the last seq its query saw and ignores deltas at or below it. A periodic
+rebuild (CUBE_REBUILD_SECONDS, and at every day rollover) reconciles any
+drift.
+
+Range and portfolio totals inside the window are array
+slices; callers fall back to SQL when a range is not covered (None).
+Set CUBE_MONTHS=0 to disable.
+"""
+import asyncio
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import case, func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from archive import sales_source, expenses_source
+from bus import bus
+from catalog import sbu_catalog
+from database import SessionLocal
+from models import EXPENSE_CATEGORIES, ChangeSequence
+
+# ================= CONFIG =================
+CUBE_MONTHS = int(os.getenv("CUBE_MONTHS", "3"))
+CUBE_REBUILD_SECONDS = int(os.getenv("CUBE_REBUILD_SECONDS", "900"))
+# Days after today kept in the cube for post-dated entries
+CUBE_AHEAD_DAYS = 7
+CUBE_CHANNEL = "cube"
+
+# Legacy rows with a category outside EXPENSE_CATEGORIES count as "other"
+MEASURES = ("sales", *EXPENSE_CATEGORIES, "other_expenses", "cancelled_sales", "cancelled_expenses")
+M = {name: i for i, name in enumerate(MEASURES)}
+EXPENSE_SLICE = slice(M[EXPENSE_CATEGORIES[0]], M["other_expenses"] + 1)
+
+
+def _measure(name: str) -> int:
+    return M.get(name, M["other_expenses"])
+
+
+def _window(today: date) -> tuple[date, date]:
+    month = today.replace(day=1)
+    for _ in range(max(CUBE_MONTHS - 1, 0)):
+        month = (month - timedelta(days=1)).replace(day=1)
+    return month, today + timedelta(days=CUBE_AHEAD_DAYS)
+
+
+def _add(index: dict[str, int], data: np.ndarray, start: date, end: date,
+         sbu_id: str, day: date, deltas: dict[str, int]) -> np.ndarray:
+    """Add one write's deltas to `data`; returns the array, grown if the SBU is new."""
+    if not (start <= day <= end):
+        return data
+    if sbu_id not in index:
+        # SBU created after the last build: grow by one row
+        index[sbu_id] = len(index)
+        data = np.concatenate([data, np.zeros((1, *data.shape[1:]), dtype=np.int64)])
+    row = data[index[sbu_id], (day - start).days]
+    for measure, amount in deltas.items():
+        row[_measure(measure)] += amount
+    return data
+
+
+# ================= CUBE =================
+class ReportCube:
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.built_on = None
+        # Last outbox seq the current data already includes
+        self.built_seq = 0
+        self.index: dict[str, int] = {}
+        self.data = np.zeros((0, 0, len(MEASURES)), dtype=np.int64)
+        # Deltas received while a build runs, replayed onto its result
+        self._pending: list[tuple[str, date, dict[str, int], int | None]] | None = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    # ---------- build ----------
+    def build(self, db: Session):
+        """Rebuild the whole window from one grouped query."""
+        today = date.today()
+        start, end = _window(today)
+
+        with self._build_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                self._build(db, today, start, end)
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def _build(self, db: Session, today: date, start: date, end: date):
+        Sales = sales_source(start)
+        Expenses = expenses_source(start)
+
+        sales = (
+            select(
+                Sales.sbu_id,
+                Sales.date.label("day"),
+                case((Sales.is_cancelled == True, literal("cancelled_sales")), else_=literal("sales")).label("measure"),
+                func.sum(Sales.amount)
+            )
+            .where(Sales.date.between(start, end))
+            .group_by(Sales.sbu_id, Sales.date, Sales.is_cancelled)
+        )
+        expenses = (
+            select(
+                Expenses.sbu_id,
+                Expenses.effective_from,
+                case((Expenses.is_cancelled == True, literal("cancelled_expenses")), else_=Expenses.category),
+                func.sum(Expenses.amount)
+            )
+            .where(Expenses.effective_from.between(start, end))
+            .group_by(Expenses.sbu_id, Expenses.effective_from, Expenses.is_cancelled, Expenses.category)
+        )
+        # The seq counter rides in the same statement, so it comes from the
+        # same snapshot as the sums
+        seq = select(literal(None), literal(None), literal(None), ChangeSequence.last_seq).where(ChangeSequence.id == 1)
+        rows = db.execute(union_all(sales, expenses, seq)).all()
+        marker = [r for r in rows if r[0] is None]
+        rows = [r for r in rows if r[0] is not None]
+        built_seq = int(marker[0][3]) if marker else 0
+
+        index = {sbu.id: i for i, sbu in enumerate(sbu_catalog.all(db))}
+        for r in rows:
+            index.setdefault(r[0], len(index))
+
+        data = np.zeros((len(index), (end - start).days + 1, len(MEASURES)), dtype=np.int64)
+        if rows:
+            np.add.at(
+                data,
+                (
+                    np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows)),
+                    np.fromiter(((r[1] - start).days for r in rows), dtype=np.int64, count=len(rows)),
+                    np.fromiter((_measure(r[2]) for r in rows), dtype=np.int64, count=len(rows)),
+                ),
+                np.fromiter((int(r[3]) for r in rows), dtype=np.int64, count=len(rows))
+            )
+
+        with self._lock:
+            # Replay only writes committed after the query's snapshot
+            for sbu_id, day, deltas, delta_seq in self._pending:
+                if delta_seq is None or delta_seq > built_seq:
+                    data = _add(index, data, start, end, sbu_id, day, deltas)
+            self.start, self.end, self.built_on, self.built_seq = start, end, today, built_seq
+            self.index, self.data = index, data
+
+    # ---------- deltas ----------
+    def apply(self, sbu_id: str, day: date, deltas: dict[str, int], seq: int | None = None):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((sbu_id, day, deltas, seq))
+            if seq is not None and seq <= self.built_seq:
+                # Already read by the build that produced the current data
+                return
+            if self.start is not None:
+                self.data = _add(self.index, self.data, self.start, self.end, sbu_id, day, deltas)
+
+    def _on_delta(self, payload: str):
+        event = orjson.loads(payload)
+        self.apply(event["sbu_id"], date.fromisoformat(event["day"]), event["deltas"], event.get("seq"))
+
+    def publish(self, sbu_id: str, day: date, deltas: dict[str, int], seq: int | None = None):
+        """Broadcast a committed write to the cube in every worker (this one included).
+
+        `seq` is the outbox seq of the write's commit (outbox.committed_seq).
+        """
+        if CUBE_MONTHS and any(deltas.values()):
+            event = {"sbu_id": sbu_id, "day": day, "deltas": deltas, "seq": seq}
+            bus.publish(CUBE_CHANNEL, orjson.dumps(event).decode())
+
+    # ---------- queries ----------
+    def covers(self, start: date, end: date) -> bool:
+        return (
+            self.start is not None
+            and self.built_on == date.today()
+            and self.start <= start <= end <= self.end
+        )
+
+    def _days(self, start: date, end: date) -> slice:
+        return slice((start - self.start).days, (end - self.start).days + 1)
+
+    def totals(self, sbu_id: str, start: date, end: date) -> np.ndarray | None:
+        """[measure] totals of one SBU over start..end, or None if not covered."""
+        with self._lock:
+            if not self.covers(start, end):
+                return None
+            i = self.index.get(sbu_id)
+            if i is None:
+                return np.zeros(len(MEASURES), dtype=np.int64)
+            return self.data[i, self._days(start, end)].sum(axis=0)
+
+    def portfolio(self, start: date, end: date) -> dict[str, np.ndarray] | None:
+        """sbu_id -> [measure] totals for every SBU, or None if not covered."""
+        with self._lock:
+            if not self.covers(start, end):
+                return None
+            sums = self.data[:, self._days(start, end)].sum(axis=1)
+            return {sbu_id: sums[i] for sbu_id, i in self.index.items()}
+
+
+def sales_of(totals: np.ndarray) -> int:
+    return int(totals[M["sales"]])
+
+
+def expenses_of(totals: np.ndarray) -> int:
+    return int(totals[EXPENSE_SLICE].sum())
+
+
+report_cube = ReportCube()
+bus.subscribe(CUBE_CHANNEL, report_cube._on_delta)
+
+
+# ================= MAINTENANCE =================
+def _rebuild():
+    db = SessionLocal()
+    try:
+        report_cube.build(db)
+    finally:
+        db.close()
+
+
+def load():
+    if CUBE_MONTHS:
+        _rebuild()
+
+
+async def maintain_loop():
+    """Periodic rebuild, plus one right after midnight so the window rolls over."""
+    last_build = time.monotonic()
+    while True:
+        await asyncio.sleep(60)
+        rolled_over = report_cube.built_on != date.today()
+        if not rolled_over and time.monotonic() - last_build < CUBE_REBUILD_SECONDS:
+            continue
+        try:
+            await run_in_threadpool(_rebuild)
+            last_build = time.monotonic()
+        except Exception as e:
+            print("Report cube rebuild failed:", e)
@@ -1,24 +1,120 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from typing import Callable
+import contextvars
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is not set")
+Base = declarative_base()
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-)
+_engine = None
+# Workload class -> (dedicated pool size, engine once created); see admission.py
+_partitions: dict[str, list] = {}
+# Workload class of the current request, set by admission control
+current_workload: contextvars.ContextVar[str | None] = contextvars.ContextVar("workload", default=None)
+# Objects stay readable after commit without a refresh SELECT; every
+# request gets its own short-lived session, so nothing goes stale.
+_session_factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+
+
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL lets readers run alongside the single writer (edge installs run
+    # the whole app on one SQLite file); wait for the lock instead of failing
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+    dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+    dbapi_conn.execute("PRAGMA busy_timeout=5000")
+
+
+def _create_engine(**pool_options):
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is not set")
+
+    engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        **pool_options
+    )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+# The engine (and with it the DB driver import) is created on first use,
+# so importing the app stays cheap for cold starts and build-time tooling.
+def get_engine():
+    global _engine
+
+    if _engine is None:
+        _engine = _create_engine()
+
+    return _engine
+
+
+def partition(workload: str, pool_size: int):
+    """Give a workload class its own fixed-size connection pool."""
+    _partitions[workload] = [pool_size, None]
+
+
+def _partition_engine(workload: str):
+    entry = _partitions[workload]
+    if entry[1] is None:
+        # No overflow: the class never holds more than its share
+        entry[1] = _create_engine(pool_size=entry[0], max_overflow=0)
+    return entry[1]
+
+
+def engines():
+    """Every engine created so far (default pool and partitions)."""
+    created = [entry[1] for entry in _partitions.values() if entry[1] is not None]
+    return ([_engine] if _engine is not None else []) + created
+
+
+def pool_status(workload: str | None = None) -> str | None:
+    if workload in _partitions:
+        engine = _partitions[workload][1]
+    else:
+        engine = _engine
+    return engine.pool.status() if engine is not None else None
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(name)
+
+
+def SessionLocal() -> Session:
+    workload = current_workload.get()
+    if workload in _partitions:
+        return _session_factory(bind=_partition_engine(workload))
+    return _session_factory(bind=get_engine())
+
+
+# ================= UNIT OF WORK =================
+def after_commit(db: Session, hook: Callable[[], None]):
+    """Run `hook` once the request's transaction has committed."""
+    db.info.setdefault("after_commit", []).append(hook)
+
+
+def commit(db: Session):
+    """Commit the request's single transaction, then run its post-commit hooks."""
+    db.commit()
+    for hook in db.info.pop("after_commit", []):
+        try:
+            hook()
+        except Exception as e:
+            print("Post-commit hook failed:", e)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
+        db.info.pop("after_commit", None)
         db.close()
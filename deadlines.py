@@ -0,0 +1,196 @@
+"""
+Statement deadlines and cancellation for report routes.
+
+Routes listed in DEADLINES get a per-request time budget. Every SELECT the
+request runs is capped at the time left: on MySQL through a
+MAX_EXECUTION_TIME optimizer hint, on SQLite through a progress handler
+that aborts the statement. If the client disconnects first, the running
+statement is killed (KILL QUERY on MySQL) so it stops holding a pooled
+connection.
+
+A statement stopped by its deadline raises QueryDeadlineExceeded (504
+with Retry-After); one stopped because the client left raises
+QueryCancelled.
+
+Override the table with QUERY_DEADLINES='{"GET /admin/sbu-report/range": 5}'.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+import database
+
+# ================= CONFIG =================
+QUERY_DEADLINES_ENABLED = os.getenv("QUERY_DEADLINES_ENABLED", "1") == "1"
+
+# "METHOD path" -> seconds the request's queries may take in total
+DEFAULT_DEADLINES = {
+    "GET /admin/sbu-report": 15,
+    "GET /admin/sbu-report/range": 15,
+    "GET /admin/department-report": 20,
+    "GET /admin/company-report": 30,
+    "GET /admin/analytics/trends": 20,
+    "GET /admin/analytics/forecast": 20,
+    "GET /admin/audit-logs": 10,
+    "GET /staff/expenses/history": 10,
+}
+DEADLINES = {**DEFAULT_DEADLINES, **json.loads(os.getenv("QUERY_DEADLINES", "{}"))}
+
+# Retry-After sent with a 504
+RETRY_AFTER_SECONDS = 30
+
+
+class QueryDeadlineExceeded(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+# ================= REQUEST CONTEXT =================
+class QueryBudget:
+    """Deadline and cancel flag shared by a request and its threadpool work."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._running = None     # MySQL connection id of the statement in flight
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled()
+        if self.remaining() <= 0:
+            raise QueryDeadlineExceeded()
+
+    def cancel(self):
+        """Stop the request's statement; blocking, so call from a worker thread."""
+        with self._lock:
+            self.cancelled = True
+            running = self._running
+        if running:
+            # Not the request's own engine: a workload partition may have
+            # no connection left to send the KILL on
+            with database.get_engine().connect() as conn:
+                conn.execute(text(f"KILL QUERY {int(running)}"))
+
+
+current_budget: contextvars.ContextVar[QueryBudget | None] = contextvars.ContextVar("query_budget", default=None)
+
+
+# ================= DRIVER HOOKS =================
+def _mysql_connection_id(dbapi_conn) -> int | None:
+    thread_id = getattr(dbapi_conn, "thread_id", None)
+    return thread_id() if callable(thread_id) else None
+
+
+@event.listens_for(Engine, "before_cursor_execute", retval=True)
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = current_budget.get()
+    if budget is None:
+        return statement, parameters
+
+    budget.check()
+    dialect = conn.dialect.name
+    dbapi_conn = conn.connection.dbapi_connection
+
+    if dialect == "mysql":
+        stripped = statement.lstrip()
+        if stripped[:6].upper() == "SELECT":
+            ms = max(1, int(budget.remaining() * 1000))
+            statement = f"SELECT /*+ MAX_EXECUTION_TIME({ms}) */{stripped[6:]}"
+        with budget._lock:
+            connection_id = _mysql_connection_id(dbapi_conn)
+            if connection_id is not None:
+                budget._running = connection_id
+
+    elif dialect == "sqlite":
+        # Checked every N VM instructions; non-zero aborts the statement
+        dbapi_conn.set_progress_handler(
+            lambda: 1 if budget.cancelled or budget.remaining() <= 0 else 0,
+            10000
+        )
+
+    return statement, parameters
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = current_budget.get()
+    if budget is None:
+        return
+
+    with budget._lock:
+        budget._running = None
+    if conn.dialect.name == "sqlite":
+        conn.connection.dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, "handle_error")
+def _translate_error(context):
+    budget = current_budget.get()
+    if budget is None:
+        return
+
+    with budget._lock:
+        budget._running = None
+    if context.engine and context.engine.dialect.name == "sqlite" and context.connection is not None:
+        context.connection.connection.dbapi_connection.set_progress_handler(None, 0)
+
+    # Only rewrite errors caused by our own interruption
+    if budget.cancelled:
+        raise QueryCancelled() from context.original_exception
+    if budget.remaining() <= 0:
+        raise QueryDeadlineExceeded() from context.original_exception
+
+
+# ================= ASGI MIDDLEWARE =================
+class DeadlineMiddleware:
+    """
+    Sets the query budget for routes in DEADLINES and cancels it when the
+    client disconnects. It owns `receive` for those requests and forwards
+    messages to the app, so it sees http.disconnect even while the
+    handler is busy in the threadpool.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_DEADLINES_ENABLED:
+            return await self.app(scope, receive, send)
+
+        seconds = DEADLINES.get(f"{scope['method']} {scope['path']}")
+        if not seconds:
+            return await self.app(scope, receive, send)
+
+        budget = QueryBudget(seconds)
+        messages: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        async def pump():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not budget.cancelled:
+                        await loop.run_in_executor(None, budget.cancel)
+                    return
+
+        token = current_budget.set(budget)
+        watcher = asyncio.create_task(pump())
+        try:
+            await self.app(scope, messages.get, send)
+        finally:
+            watcher.cancel()
+            current_budget.reset(token)
@@ -0,0 +1,161 @@
+"""
+Effective-dated fixed costs.
+
+Each SBU's personnel_cost, rent and electricity are daily amounts with a
+validity interval in the fixed_costs table, so changing a cost only
+affects reports from its valid_from date on. A cost type with no rows
+yet falls back to the SBU column for all dates, which is what reports
+used before the schedule existed; the first change seeds a row holding
+that old value for the past. From then on the schedule is the only
+source: the column keeps its pre-schedule value and is not read again,
+so ask the index (on()) for today's amounts.
+
+The schedule is held in memory per SBU and cost type as a step function
+with prefix sums: the fixed cost of any range is two binary searches,
+however many years or changes it spans. Writes invalidate every worker's
+copy over the event bus.
+"""
+import threading
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from sqlalchemy.orm import Session
+
+from bus import bus
+from catalog import SBUEntry
+from database import after_commit
+from keys import new_id
+from models import SBU, FixedCost
+
+COST_TYPES = ("personnel_cost", "rent", "electricity")
+FIXED_COST_CHANNEL = "fixed_costs"
+# Earliest date MySQL's DATE type supports; seeds cover everything from here
+BEGINNING = date(1000, 1, 1)
+
+
+# ================= STEP FUNCTION =================
+class CostSchedule:
+    """Daily amount over time: amounts[i] applies from starts[i] until starts[i + 1]."""
+
+    __slots__ = ("starts", "amounts", "cumulative")
+
+    def __init__(self, steps: list[tuple[int, int]]):
+        # steps: (day ordinal, daily amount from that day on), sorted by day
+        self.starts = [day for day, _ in steps]
+        self.amounts = [amount for _, amount in steps]
+        self.cumulative = [0]
+        for i in range(1, len(steps)):
+            self.cumulative.append(
+                self.cumulative[-1] + (self.starts[i] - self.starts[i - 1]) * self.amounts[i - 1]
+            )
+
+    def _before(self, day: int) -> int:
+        """Total cost of every day before `day`."""
+        i = bisect_right(self.starts, day) - 1
+        if i < 0:
+            return 0
+        return self.cumulative[i] + (day - self.starts[i]) * self.amounts[i]
+
+    def total(self, start: date, end: date) -> int:
+        return self._before(end.toordinal() + 1) - self._before(start.toordinal())
+
+    def on(self, day: date) -> int:
+        i = bisect_right(self.starts, day.toordinal()) - 1
+        return self.amounts[i] if i >= 0 else 0
+
+
+def _steps(rows: list[FixedCost]) -> list[tuple[int, int]]:
+    steps: dict[int, int] = {}
+    for row in sorted(rows, key=lambda r: r.valid_from):
+        steps[row.valid_from.toordinal()] = row.amount
+        if row.valid_to:
+            # Gap after a closed interval costs nothing unless a later row starts there
+            steps.setdefault(row.valid_to.toordinal() + 1, 0)
+    return sorted(steps.items())
+
+
+# ================= INDEX =================
+class FixedCostIndex:
+    def __init__(self):
+        self._schedules: dict[tuple[str, str], CostSchedule] = {}
+        self._stale = True
+        self._lock = threading.Lock()
+        bus.subscribe(FIXED_COST_CHANNEL, self.invalidate)
+
+    def invalidate(self, payload: str = ""):
+        self._stale = True
+
+    def load(self, db: Session):
+        rows: dict[tuple[str, str], list[FixedCost]] = {}
+        for row in db.query(FixedCost).all():
+            rows.setdefault((row.sbu_id, row.cost_type), []).append(row)
+
+        with self._lock:
+            self._stale = False
+            self._schedules = {key: CostSchedule(_steps(r)) for key, r in rows.items()}
+
+    def _schedule(self, db: Session, sbu: SBUEntry, cost_type: str) -> CostSchedule:
+        if self._stale:
+            self.load(db)
+        schedule = self._schedules.get((sbu.id, cost_type))
+        if schedule is None:
+            # No history recorded: the current column applies to every date
+            schedule = CostSchedule([(1, getattr(sbu, cost_type) or 0)])
+        return schedule
+
+    def total(self, db: Session, sbu: SBUEntry, start: date, end: date) -> int:
+        """Fixed cost of an SBU over start..end inclusive."""
+        return sum(self._schedule(db, sbu, t).total(start, end) for t in COST_TYPES)
+
+    def on(self, db: Session, sbu: SBUEntry, day: date) -> dict[str, int]:
+        """Each cost type's daily amount on one day."""
+        return {t: self._schedule(db, sbu, t).on(day) for t in COST_TYPES}
+
+    def bump(self, db: Session):
+        bus.publish(FIXED_COST_CHANNEL)
+        self.load(db)
+
+
+fixed_cost_index = FixedCostIndex()
+
+
+# ================= WRITES =================
+def schedule_change(db: Session, sbu: SBU, cost_type: str, amount: int, valid_from: date):
+    """
+    Make `amount` the daily cost of `cost_type` from `valid_from` on.
+    Later entries are superseded; committed with the caller's transaction.
+    """
+    rows = (
+        db.query(FixedCost)
+        .filter(FixedCost.sbu_id == sbu.id, FixedCost.cost_type == cost_type)
+        .all()
+    )
+
+    if not rows and valid_from > BEGINNING:
+        # Keep the old column value for everything before the first change
+        db.add(FixedCost(
+            id=new_id(),
+            sbu_id=sbu.id,
+            cost_type=cost_type,
+            amount=getattr(sbu, cost_type) or 0,
+            valid_from=BEGINNING,
+            valid_to=valid_from - timedelta(days=1)
+        ))
+
+    current = None
+    for row in rows:
+        if row.valid_from == valid_from:
+            # Same start date: overwrite in place (unique on sbu, type, valid_from)
+            current = row
+        elif row.valid_from > valid_from:
+            db.delete(row)
+        elif row.valid_to is None or row.valid_to >= valid_from:
+            row.valid_to = valid_from - timedelta(days=1)
+
+    if current is None:
+        current = FixedCost(id=new_id(), sbu_id=sbu.id, cost_type=cost_type, valid_from=valid_from)
+        db.add(current)
+    current.amount = amount
+    current.valid_to = None
+
+    after_commit(db, lambda: fixed_cost_index.bump(db))
@@ -0,0 +1,106 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Any
+
+from fastapi import HTTPException
+import orjson
+from fastapi.responses import Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import commit
+from models import IdempotencyKey
+from periodic import run_every
+from responses import dumps
+
+# ================= CONFIG =================
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "3600"))
+MAX_KEY_LENGTH = 64
+
+
+# ================= LOOKUP / STORE =================
+def fingerprint(route: str, request: Any) -> str:
+    """Hash of the route and request body a key was first used with."""
+    body = orjson.dumps(request, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(route.encode() + b"\n" + body).hexdigest()
+
+
+def lookup(db: Session, user_id: str, key: str | None, route: str, request: Any) -> Response | None:
+    """
+    Return the stored response for a replayed key (one PK read). A key
+    reused for a different route or body is rejected with 422.
+    """
+    if not key:
+        return None
+
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+
+    record = db.get(IdempotencyKey, (user_id, key))
+    if not record or record.expires_at < datetime.utcnow():
+        return None
+
+    if record.request_hash != fingerprint(route, request):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    return Response(
+        content=record.response_body,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def store(db: Session, user_id: str, key: str | None, route: str, request: Any, body: Any, status_code: int = 200):
+    """Stage the response in the same transaction as the write it belongs to."""
+    if not key:
+        return
+
+    # An expired row for the same key would collide on the primary key
+    stale = db.get(IdempotencyKey, (user_id, key))
+    if stale:
+        db.delete(stale)
+        db.flush()
+
+    db.add(IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        route=route,
+        request_hash=fingerprint(route, request),
+        status_code=status_code,
+        response_body=dumps(body).decode(),
+        expires_at=datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    ))
+
+
+def commit_or_replay(db: Session, user_id: str, key: str | None, route: str, request: Any) -> Response | None:
+    """
+    Commit the request's writes. If a concurrent retry with the same key
+    committed first, roll back and hand back its stored response.
+    """
+    try:
+        commit(db)
+    except IntegrityError:
+        db.rollback()
+        replay = lookup(db, user_id, key, route, request)
+        if replay is None:
+            raise
+        return replay
+    return None
+
+
+# ================= PURGE =================
+def purge_expired(db: Session) -> int:
+    deleted = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.expires_at < datetime.utcnow())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def purge_loop():
+    return run_every(IDEMPOTENCY_PURGE_SECONDS, purge_expired, "Idempotency purge")
@@ -0,0 +1,393 @@
+"""
+Background jobs for long exports and recomputations.
+
+Jobs are rows in the jobs table: the API inserts them (POST /admin/jobs)
+and worker processes claim them with a conditional UPDATE, so any number
+of workers on any host can share one queue. Handlers report progress on
+the row as they go and write their result to JOB_RESULTS_DIR, from where
+GET /admin/jobs/{id}/result serves it.
+
+    python jobs.py                   # one worker process per available core
+    python jobs.py --processes 2
+
+Set JOB_RUNNER=1 to also run a single in-process worker inside each app
+worker instead (small deployments without a separate worker service).
+With several hosts, JOB_RESULTS_DIR must be shared storage.
+"""
+import argparse
+import asyncio
+import csv
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from archive import sales_source, expenses_source
+from bus import bus
+from catalog import sbu_catalog
+from database import SessionLocal
+from fixed_costs import fixed_cost_index
+from models import Job
+from schemas import SBUReportRangeJobParams, TransactionsExportJobParams, SnapshotRebuildJobParams
+import snapshots
+
+# ================= CONFIG =================
+JOB_RUNNER = os.getenv("JOB_RUNNER") == "1"
+JOB_RESULTS_DIR = os.getenv("JOB_RESULTS_DIR", os.path.join(tempfile.gettempdir(), "drphysiq_jobs"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job whose worker stopped reporting for this long is requeued
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+PROGRESS_INTERVAL_SECONDS = 1.0
+# Lease renewal while a handler is busy, well inside JOB_STALE_SECONDS
+HEARTBEAT_SECONDS = max(JOB_STALE_SECONDS / 4, 1)
+
+
+# ================= REGISTRY =================
+class JobKind:
+    __slots__ = ("params", "run")
+
+    def __init__(self, params: type[BaseModel], run: Callable):
+        self.params = params
+        self.run = run
+
+
+KINDS: dict[str, JobKind] = {}
+
+
+def job(kind: str, params: type[BaseModel]):
+    """Register a handler: run(db, params, progress, path) -> (filename, media_type)."""
+    def register(fn):
+        KINDS[kind] = JobKind(params, fn)
+        return fn
+    return register
+
+
+def result_path(job_id: str) -> str:
+    return os.path.join(JOB_RESULTS_DIR, job_id)
+
+
+def _beat(job_id: str, **values):
+    """Renew a running job's lease (plus any progress values); own session, own commit."""
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == job_id).values(heartbeat_at=datetime.utcnow(), **values))
+        db.commit()
+    finally:
+        db.close()
+
+
+class Progress:
+    """Throttled progress writer."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, fraction: float, message: str | None = None):
+        now = time.monotonic()
+        if now - self._last < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last = now
+        _beat(self.job_id, progress=round(min(max(fraction, 0), 1) * 100, 1), message=message)
+
+
+class Heartbeat:
+    """
+    Renews the lease every HEARTBEAT_SECONDS from its own thread, so a
+    handler blocked in one long query is not requeued and run twice.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                _beat(self.job_id)
+            except Exception as e:
+                print("Job heartbeat failed:", e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _months(start: date, end: date):
+    """Consecutive (first, last) day windows covering start..end, split on month boundaries."""
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        last = min(end, next_month - timedelta(days=1))
+        yield current, last
+        current = last + timedelta(days=1)
+
+
+# ================= HANDLERS =================
+@job("sbu_report_range", SBUReportRangeJobParams)
+def sbu_report_range(db: Session, params: SBUReportRangeJobParams, progress: Progress, path: str):
+    """admin_sbu_report_range for long ranges, computed month by month."""
+    sbu = sbu_catalog.get(db, params.sbu_id)
+    if not sbu:
+        raise ValueError("SBU not found")
+
+    windows = list(_months(params.start_date, params.end_date))
+    months = []
+    for i, (start, end) in enumerate(windows):
+        # Closed months come straight from (or go into) the snapshot store
+        m = snapshots.measures(db, sbu.id, start, end, with_staff=False)
+        months.append({
+            "from": start,
+            "to": end,
+            "total_sales": m["total_sales"],
+            "variable_expenses": m["variable_expenses"]
+        })
+        progress((i + 1) / len(windows), f"{end:%Y-%m}")
+
+    total_sales = sum(m["total_sales"] for m in months)
+    variable_expenses = sum(m["variable_expenses"] for m in months)
+    fixed_expenses = fixed_cost_index.total(db, sbu, params.start_date, params.end_date)
+    total_expenses = fixed_expenses + variable_expenses
+
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({
+            "sbu": {"id": sbu.id, "name": sbu.name},
+            "date_range": {"from": params.start_date, "to": params.end_date},
+            "total_sales": total_sales,
+            "fixed_expenses": fixed_expenses,
+            "variable_expenses": variable_expenses,
+            "total_expenses": total_expenses,
+            "net_profit": total_sales - total_expenses,
+            "months": months
+        }))
+    return f"sbu-report-{params.start_date}-{params.end_date}.json", "application/json"
+
+
+@job("transactions_export", TransactionsExportJobParams)
+def transactions_export(db: Session, params: TransactionsExportJobParams, progress: Progress, path: str):
+    """Every sale and expense in the range (archive included) as CSV."""
+    windows = list(_months(params.start_date, params.end_date))
+    Sales = sales_source(params.start_date)
+    Expenses = expenses_source(params.start_date)
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["type", "id", "sbu_id", "date", "category", "amount", "is_cancelled", "created_by", "notes"])
+
+        for i, (start, end) in enumerate(windows):
+            sales = db.query(Sales).filter(Sales.date.between(start, end))
+            expenses = db.query(Expenses).filter(Expenses.effective_from.between(start, end))
+            if params.sbu_id:
+                sales = sales.filter(Sales.sbu_id == params.sbu_id)
+                expenses = expenses.filter(Expenses.sbu_id == params.sbu_id)
+
+            for s in sales.order_by(Sales.date).yield_per(1000):
+                writer.writerow(["sale", s.id, s.sbu_id, s.date, "", s.amount, s.is_cancelled, s.created_by, s.notes or ""])
+            for e in expenses.order_by(Expenses.effective_from).yield_per(1000):
+                writer.writerow(["expense", e.id, e.sbu_id, e.effective_from, e.category, e.amount, e.is_cancelled, e.created_by, e.notes or ""])
+
+            # Each month is read once; nothing needs to stay in the session
+            db.expunge_all()
+            progress((i + 1) / len(windows), f"{end:%Y-%m}")
+
+    return f"transactions-{params.start_date}-{params.end_date}.csv", "text/csv"
+
+
+@job("snapshot_rebuild", SnapshotRebuildJobParams)
+def snapshot_rebuild(db: Session, params: SnapshotRebuildJobParams, progress: Progress, path: str):
+    """Recompute the report snapshots for every closed day in the range."""
+    end = min(params.end_date, date.today() - timedelta(days=1))
+    days = (end - params.start_date).days + 1
+    stored = 0
+    for i in range(max(days, 0)):
+        day = params.start_date + timedelta(days=i)
+        stored += snapshots.precompute(db, day)
+        progress((i + 1) / days, day.isoformat())
+
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({"days": max(days, 0), "snapshots": stored}))
+    return "snapshot-rebuild.json", "application/json"
+
+
+# ================= QUEUE =================
+def submit(db: Session, job_id: str, kind: str, params: dict, user_id: str) -> Job:
+    """Validate and enqueue a job; committed with the caller's transaction."""
+    spec = KINDS.get(kind)
+    if not spec:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    record = Job(
+        id=job_id,
+        kind=kind,
+        params=spec.params.model_validate(params).model_dump_json(),
+        status="queued",
+        progress=0,
+        created_by=user_id
+    )
+    db.add(record)
+    return record
+
+
+def _claim(db: Session) -> Job | None:
+    for _ in range(5):
+        candidate = (
+            db.query(Job.id)
+            .filter(Job.status == "queued")
+            .order_by(Job.created_at)
+            .first()
+        )
+        if not candidate:
+            return None
+
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == candidate.id, Job.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Job, candidate.id, populate_existing=True)
+    # Lost every race; let the next poll try again
+    return None
+
+
+def _finish(job_id: str, **values):
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == job_id).values(finished_at=datetime.utcnow(), **values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_next() -> bool:
+    """Claim and run one queued job; False when the queue is empty."""
+    db = SessionLocal()
+    try:
+        record = _claim(db)
+        if not record:
+            return False
+
+        spec = KINDS[record.kind]
+        params = spec.params.model_validate_json(record.params)
+        os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+
+        try:
+            with Heartbeat(record.id):
+                filename, media_type = spec.run(db, params, Progress(record.id), result_path(record.id))
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            _finish(record.id, status="failed", error=str(e)[:2000])
+        else:
+            _finish(record.id, status="done", progress=100, message=None, result_file=filename, result_type=media_type)
+        return True
+    finally:
+        db.close()
+
+
+def requeue_stale(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    requeued = db.execute(
+        update(Job)
+        .where(Job.status == "running", Job.heartbeat_at < cutoff)
+        .values(status="queued", progress=0, message="Requeued after worker loss")
+    ).rowcount
+    db.commit()
+    return requeued
+
+
+def purge_expired(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS)
+    expired = [
+        job_id for (job_id,) in
+        db.query(Job.id).filter(Job.finished_at < cutoff)
+    ]
+    for job_id in expired:
+        try:
+            os.remove(result_path(job_id))
+        except FileNotFoundError:
+            pass
+    db.query(Job).filter(Job.id.in_(expired)).delete(synchronize_session=False)
+    db.commit()
+    return len(expired)
+
+
+def _housekeeping():
+    db = SessionLocal()
+    try:
+        requeue_stale(db)
+        purge_expired(db)
+    finally:
+        db.close()
+
+
+# ================= WORKERS =================
+def work_forever():
+    # Catalog, fixed-cost and archive caches are invalidated over the bus
+    bus.start()
+    last_housekeeping = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_housekeeping > JOB_STALE_SECONDS:
+                last_housekeeping = time.monotonic()
+                _housekeeping()
+            if run_next():
+                continue
+        except Exception as e:
+            print("Job worker error:", e)
+        time.sleep(JOB_POLL_SECONDS)
+
+
+async def runner_loop():
+    """In-process worker for JOB_RUNNER=1: runs jobs one at a time off the event loop."""
+    last_housekeeping = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_housekeeping > JOB_STALE_SECONDS:
+                last_housekeeping = time.monotonic()
+                await run_in_threadpool(_housekeeping)
+            ran = await run_in_threadpool(run_next)
+        except Exception as e:
+            print("Job runner failed:", e)
+            ran = False
+        if not ran:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--processes", type=int, default=_available_cores())
+    args = parser.parse_args()
+
+    # Nothing has touched the database yet, so each child opens its own pool
+    workers = [multiprocessing.Process(target=work_forever, daemon=True) for _ in range(args.processes)]
+    for w in workers:
+        w.start()
+    print(f"Started {len(workers)} job workers")
+    for w in workers:
+        w.join()
@@ -0,0 +1,73 @@
+"""
+Time-ordered primary keys.
+
+new_id() returns a UUIDv7 (RFC 9562): a 48-bit millisecond timestamp
+followed by random bits, so keys generated later sort later and InnoDB
+appends new rows to the right-hand edge of the clustered index instead of
+splitting random pages. Within one millisecond a counter keeps keys from a
+process strictly increasing.
+
+UUIDKey stores keys as BINARY(16) on MySQL and CHAR(36) elsewhere; the
+application and the API only ever see the canonical string form.
+"""
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import String
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeDecorator
+
+# ================= GENERATION =================
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def new_id() -> str:
+    global _last_ms, _counter
+
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF   # leave headroom in 12 bits
+        else:
+            # Same (or a backwards-stepped) millisecond: keep counting
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    value = (ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | rand_b
+    return str(uuid.UUID(int=value))
+
+
+# ================= COLUMN TYPE =================
+class UUIDKey(TypeDecorator):
+    """A UUID key: BINARY(16) on MySQL, CHAR(36) elsewhere, str in Python."""
+
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(mysql.BINARY(16))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "mysql":
+            return value
+        try:
+            return uuid.UUID(value).bytes
+        except ValueError:
+            # Not a key at all (e.g. a bad path parameter): match nothing
+            return value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, (bytes, bytearray)):
+            return str(uuid.UUID(bytes=bytes(value)))
+        return value
@@ -1,33 +1,137 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, Request
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from fastapi.openapi.utils import get_openapi
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import date, timedelta
-import uuid
-
-from database import get_db
-from models import User, Sale, Expense, SBU, AuditLog
+from sqlalchemy import func, case, extract
+from datetime import date
+from typing import Optional, Literal
+from contextlib import asynccontextmanager
+import os
+import hashlib
+import gzip
+import orjson
+import asyncio
+
+from database import get_db, SessionLocal, commit, after_commit
+from keys import new_id
+from catalog import sbu_catalog
+from bus import bus
+import idempotency
+import provisioning
+import refresh_tokens
+import outbox
+import edge
+import jobs
+import cube
+import fixed_costs
+from fixed_costs import fixed_cost_index
+from cube import report_cube
+from archive import expenses_source
+import analytics
+import alerts
+import snapshots
+from reports import period_range, dashboard_measures, staff_measures, rollup
+from singleflight import report_flight
+import ratelimit
+import deadlines
+import admission
+from alerts import alert_engine
+from responses import FastJSONResponse, model_response
+from models import (
+    User,
+    Sale,
+    Expense,
+    SBU,
+    AuditLog,
+    AlertThreshold,
+    Job,
+    FixedCost,
+    BudgetAlert,
+    EXPENSE_CATEGORIES
+)
 from auth import verify_password, create_access_token, get_current_user, hash_password
 from schemas import (
     CreateStaffSchema,
     CreateSBUSchema,
+    UpdateSBUSchema,
+    AlertThresholdSchema,
+    FixedCostChangeSchema,
     LoginSchema,
+    RefreshTokenSchema,
     SaleCreateSchema,
     StaffExpenseSchema,
     StaffDashboardResponse,
     ChartResponse,
     SBUReportWithStaffSchema,
     ChangePasswordSchema,
-    CreateAdminSchema
+    CreateAdminSchema,
+    JobCreateSchema,
+    EdgeBatchSchema
 )
 
+# ---------------- LIFESPAN ----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    bus.start()
+    alert_engine.start()
+    db = SessionLocal()
+    try:
+        sbu_catalog.load(db)
+    finally:
+        db.close()
+    cube.load()
+    admission.size_threadpool()
+    tasks = [
+        asyncio.create_task(idempotency.purge_loop()),
+        asyncio.create_task(refresh_tokens.purge_loop())
+    ]
+    if edge.EDGE_MODE:
+        # The sync loop compacts the outbox itself, behind its push watermark
+        tasks.append(asyncio.create_task(edge.sync_loop()))
+    else:
+        tasks.append(asyncio.create_task(outbox.compact_loop()))
+    if snapshots.REPORT_SCHEDULER:
+        tasks.append(asyncio.create_task(snapshots.scheduler_loop()))
+    if cube.CUBE_MONTHS:
+        tasks.append(asyncio.create_task(cube.maintain_loop()))
+    if jobs.JOB_RUNNER:
+        tasks.append(asyncio.create_task(jobs.runner_loop()))
+    yield
+    for task in tasks:
+        task.cancel()
+    alert_engine.stop()
+    bus.stop()
+
+
 # ---------------- APP ----------------
 app = FastAPI(
+    lifespan=lifespan,
     title="DrPhysiQ Inventory API",
-    swagger_ui_parameters={"persistAuthorization": True}
+    swagger_ui_parameters={"persistAuthorization": True},
+    default_response_class=FastJSONResponse
 )
 
+# ---------------- ADMISSION CONTROL ----------------
+# Registered first so it runs innermost: rate-limited requests never take
+# a slot, and shed 503s still pass through CORS
+app.add_middleware(admission.AdmissionMiddleware)
+
+# ---------------- RATE LIMITING ----------------
+# Registered before CORS so 429 responses still carry CORS headers
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    retry_after = await ratelimit.check(request)
+    if retry_after is not None:
+        return FastJSONResponse(
+            {"detail": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": str(retry_after)}
+        )
+    return await call_next(request)
+
 # ---------------- CORS ----------------
 app.add_middleware(
     CORSMiddleware,
@@ -40,8 +144,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "Retry-After"],
 )
 
+# ---------------- QUERY DEADLINES ----------------
+# Outermost, so it sees client disconnects for the whole request
+app.add_middleware(deadlines.DeadlineMiddleware)
+
+
+@app.exception_handler(deadlines.QueryDeadlineExceeded)
+async def query_deadline_exceeded(request: Request, exc: deadlines.QueryDeadlineExceeded):
+    return FastJSONResponse(
+        {"detail": "Report query took too long; narrow the range or submit it as a background job"},
+        status_code=504,
+        headers={"Retry-After": str(deadlines.RETRY_AFTER_SECONDS)}
+    )
+
+
+@app.exception_handler(deadlines.QueryCancelled)
+async def query_cancelled(request: Request, exc: deadlines.QueryCancelled):
+    # The client is gone; this only reaches logs and proxies
+    return FastJSONResponse({"detail": "Request cancelled"}, status_code=503)
+
+
+@app.get("/admin/workloads")
+async def admission_status(current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    return admission.status()
+
 # ---------------- LOGIN ----------------
 @app.post("/login")
 def login(payload: LoginSchema, db: Session = Depends(get_db)):
@@ -54,16 +186,30 @@ def login(payload: LoginSchema, db: Session = Depends(get_db)):
     if not user.is_active:
             raise HTTPException(status_code=403, detail="Account is deactivated")
 
-    token = create_access_token({"sub": user.id, "role": user.role})
+    refresh_token = refresh_tokens.issue(db, user.id)
+    commit(db)
+
+    return _token_response(user, refresh_token)
+
 
+def _token_response(user: User, refresh_token: str) -> dict:
     return {
-        "access_token": token,
+        "access_token": create_access_token({"sub": user.id, "role": user.role}),
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "role": user.role,
         "username": user.username,
         "must_change_password": user.must_change_password 
     }
 
+# ---------------- TOKEN REFRESH ----------------
+@app.post("/token/refresh")
+def refresh_access_token(payload: RefreshTokenSchema, db: Session = Depends(get_db)):
+    user, refresh_token = refresh_tokens.rotate(db, payload.refresh_token)
+    commit(db)
+
+    return _token_response(user, refresh_token)
+
 # ---------------- ADMIN: CREATE STAFF ----------------
 @app.post("/admin/create-staff")
 def create_staff(
@@ -81,7 +227,7 @@ def create_staff(
 
     # Create staff user
     user = User(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         full_name=payload.full_name,
         username=payload.username,
         password_hash=hash_password(payload.password),
@@ -90,22 +236,14 @@ def create_staff(
     )
 
     db.add(user)
-    db.commit()          # ✅ commit staff first
-    db.refresh(user)
-
-    # Audit log (failsafe)
-    try:
-        db.add(AuditLog(
-            id=str(uuid.uuid4()),
-            user_id=current_user.id,
-            action=f"Created staff {payload.username}",
-            entity="staff"
-        ))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print("Audit log failed:", e)
+    db.add(AuditLog(
+        id=new_id(),
+        user_id=current_user.id,
+        action=f"Created staff {payload.username}",
+        entity="staff"
+    ))
 
+    commit(db)
     return {"message": "Staff created successfully"}
 
 # ---------------- ADMIN: CREATE SBU ----------------
@@ -120,7 +258,7 @@ def create_sbu(
 
 
     sbu = SBU(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         name=payload.name,
         department=payload.department,
         daily_budget=payload.daily_budget,
@@ -132,13 +270,182 @@ def create_sbu(
 
 
     db.add(sbu)
-    db.commit()
+    after_commit(db, lambda: sbu_catalog.bump(db))
+    commit(db)
     return {"message": "SBU created successfully"}
 
+# ---------------- ADMIN: UPDATE SBU ----------------
+@app.patch("/admin/sbus/{sbu_id}")
+def update_sbu(
+    sbu_id: str,
+    payload: UpdateSBUSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Operations admin only")
+
+    sbu = db.query(SBU).filter(SBU.id == sbu_id).first()
+    if not sbu:
+        raise HTTPException(status_code=404, detail="SBU not found")
+
+    today = date.today()
+    current = fixed_cost_index.on(db, sbu, today)
+    # A change scheduled for a later date is superseded by the edit too
+    final = fixed_cost_index.on(db, sbu, date.max)
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        if field in fixed_costs.COST_TYPES:
+            # Cost edits take effect today; past reports keep the old amount
+            if value != current[field] or value != final[field]:
+                fixed_costs.schedule_change(db, sbu, field, value, today)
+        else:
+            setattr(sbu, field, value)
+
+    db.add(AuditLog(
+        id=new_id(),
+        user_id=current_user.id,
+        action=f"Updated SBU {sbu.name}",
+        entity="sbu"
+    ))
+
+    after_commit(db, lambda: sbu_catalog.bump(db))
+    commit(db)
+    return {"message": "SBU updated successfully"}
+
+# ---------------- ADMIN: BULK IMPORT ----------------
+async def _run_import(request: Request, importer, db: Session, current_user: User):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Operations admin only")
+
+    body = await request.body()
+    try:
+        rows = provisioning.parse_rows(body, request.headers.get("content-type"))
+        # Hashing and inserts block; keep them off the event loop
+        return await run_in_threadpool(importer, db, rows, current_user)
+    except provisioning.ImportRejected as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+
+
+@app.post("/admin/import/staff")
+async def import_staff(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create staff from a CSV (text/csv) or JSON array of create-staff rows."""
+    return await _run_import(request, provisioning.import_staff, db, current_user)
+
+
+@app.post("/admin/import/sbus")
+async def import_sbus(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create SBUs from a CSV (text/csv) or JSON array of create-sbu rows."""
+    return await _run_import(request, provisioning.import_sbus, db, current_user)
+
+# ---------------- ADMIN: FIXED COST SCHEDULE ----------------
+@app.get("/admin/sbus/{sbu_id}/fixed-costs")
+def list_fixed_costs(
+    sbu_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    sbu = sbu_catalog.get(db, sbu_id)
+    if not sbu:
+        raise HTTPException(status_code=404, detail="SBU not found")
+
+    rows = (
+        db.query(FixedCost)
+        .filter(FixedCost.sbu_id == sbu_id)
+        .order_by(FixedCost.cost_type, FixedCost.valid_from)
+        .all()
+    )
+
+    return {
+        "current": fixed_cost_index.on(db, sbu, date.today()),
+        "schedule": [
+            {
+                "cost_type": r.cost_type,
+                "amount": r.amount,
+                "valid_from": r.valid_from,
+                "valid_to": r.valid_to
+            }
+            for r in rows
+        ]
+    }
+
+
+@app.put("/admin/sbus/{sbu_id}/fixed-costs")
+def change_fixed_cost(
+    sbu_id: str,
+    payload: FixedCostChangeSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Operations admin only")
+
+    sbu = db.query(SBU).filter(SBU.id == sbu_id).first()
+    if not sbu:
+        raise HTTPException(status_code=404, detail="SBU not found")
+
+    if payload.valid_from < fixed_costs.BEGINNING:
+        raise HTTPException(status_code=400, detail="valid_from is too early")
+
+    fixed_costs.schedule_change(db, sbu, payload.cost_type, payload.amount, payload.valid_from)
+
+    db.add(AuditLog(
+        id=new_id(),
+        user_id=current_user.id,
+        action=f"Set {payload.cost_type} of {sbu.name} to ₦{payload.amount}/day from {payload.valid_from}",
+        entity="sbu"
+    ))
+
+    after_commit(db, lambda: sbu_catalog.bump(db))
+    commit(db)
+    return {"message": "Fixed cost scheduled"}
+
+# ---------------- ADMIN: ALERT THRESHOLDS ----------------
+@app.put("/admin/sbus/{sbu_id}/alert-thresholds")
+def set_alert_thresholds(
+    sbu_id: str,
+    payload: AlertThresholdSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Operations admin only")
+
+    if not sbu_catalog.get(db, sbu_id):
+        raise HTTPException(status_code=404, detail="SBU not found")
+
+    if payload.warning_percent > payload.excellent_percent:
+        raise HTTPException(status_code=400, detail="Warning threshold must not exceed excellent threshold")
+
+    threshold = db.get(AlertThreshold, sbu_id)
+    if not threshold:
+        threshold = AlertThreshold(sbu_id=sbu_id)
+        db.add(threshold)
+
+    threshold.excellent_percent = payload.excellent_percent
+    threshold.warning_percent = payload.warning_percent
+
+    after_commit(db, lambda: bus.publish(alerts.THRESHOLD_CHANNEL))
+    after_commit(db, lambda: alert_engine.submit(sbu_id, date.today()))
+    commit(db)
+
+    return {"message": "Alert thresholds updated"}
+
 # ---------------- STAFF: SALES ----------------
 @app.post("/staff/sales")
 def create_or_update_sales(
     payload: SaleCreateSchema,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -148,6 +455,12 @@ def create_or_update_sales(
     if not current_user.is_active:
         raise HTTPException(status_code=403, detail="Account inactive")
 
+    # 🔁 RETRY OF AN ALREADY APPLIED REQUEST
+    request = payload.model_dump(mode="json")
+    replay = idempotency.lookup(db, current_user.id, idempotency_key, "/staff/sales", request)
+    if replay:
+        return replay
+
     sale = (
         db.query(Sale)
         .filter(Sale.sbu_id == current_user.sbu_id, Sale.date == payload.sale_date)
@@ -155,11 +468,14 @@ def create_or_update_sales(
     )
 
     if sale:
+        # Upsert replaces the day's amount; the cube only needs the difference
+        delta = {"cancelled_sales" if sale.is_cancelled else "sales": payload.amount - sale.amount}
         sale.amount = payload.amount
         sale.notes = payload.notes
     else:
+        delta = {"sales": payload.amount}
         sale = Sale(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             sbu_id=current_user.sbu_id,
             amount=payload.amount,
             date=payload.sale_date,
@@ -169,19 +485,27 @@ def create_or_update_sales(
         db.add(sale)
 
     db.add(AuditLog(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         user_id=current_user.id,
         action=f"Recorded sale ₦{payload.amount}",
         entity="sale"
     ))
 
-    db.commit()
-    return {"message": "Sales saved successfully"}
+    snapshots.invalidate(db, current_user.sbu_id, payload.sale_date)
+
+    response = {"message": "Sales saved successfully"}
+    idempotency.store(db, current_user.id, idempotency_key, "/staff/sales", request, response)
+    after_commit(db, lambda: alert_engine.submit(current_user.sbu_id, payload.sale_date))
+    after_commit(db, lambda: report_cube.publish(current_user.sbu_id, payload.sale_date, delta, outbox.committed_seq(db)))
+
+    replay = idempotency.commit_or_replay(db, current_user.id, idempotency_key, "/staff/sales", request)
+    return replay or response
 
 # ---------------- STAFF: EXPENSE ----------------
 @app.post("/staff/expenses")
 def create_or_update_staff_expense(
     payload: StaffExpenseSchema,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -191,6 +515,12 @@ def create_or_update_staff_expense(
     if not current_user.is_active:
         raise HTTPException(status_code=403, detail="Account inactive")
 
+    # 🔁 RETRY OF AN ALREADY APPLIED REQUEST (amount += must not run twice)
+    request = payload.model_dump(mode="json")
+    replay = idempotency.lookup(db, current_user.id, idempotency_key, "/staff/expenses", request)
+    if replay:
+        return replay
+
 
     # 🔎 Check if expense already exists for same day + category
     expense = (
@@ -211,7 +541,7 @@ def create_or_update_staff_expense(
     else:
         # ✅ CREATE new expense
         expense = Expense(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             sbu_id=current_user.sbu_id,
             category=payload.category,
             amount=payload.amount,
@@ -223,14 +553,23 @@ def create_or_update_staff_expense(
 
     # 🧾 AUDIT LOG
     db.add(AuditLog(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         user_id=current_user.id,
         action=f"Recorded expense ₦{payload.amount} ({payload.category})",
         entity="expense"
     ))
 
-    db.commit()
-    return {"message": "Expense saved successfully"}
+    snapshots.invalidate(db, current_user.sbu_id, payload.date)
+
+    response = {"message": "Expense saved successfully"}
+    idempotency.store(db, current_user.id, idempotency_key, "/staff/expenses", request, response)
+    after_commit(db, lambda: alert_engine.submit(current_user.sbu_id, payload.date))
+    after_commit(db, lambda: report_cube.publish(
+        current_user.sbu_id, payload.date, {payload.category: payload.amount}, outbox.committed_seq(db)
+    ))
+
+    replay = idempotency.commit_or_replay(db, current_user.id, idempotency_key, "/staff/expenses", request)
+    return replay or response
 
 @app.get("/admin/sbus")
 def list_sbus(
@@ -240,7 +579,7 @@ def list_sbus(
     if current_user.role not in ["ops_admin", "super_admin"]:
         raise HTTPException(status_code=403)
 
-    sbus = db.query(SBU).all()
+    sbus = sbu_catalog.all(db)
 
     return [
         {
@@ -263,35 +602,19 @@ def admin_sbu_report_range(
         raise HTTPException(status_code=403, detail="Not authorized to view reports")
 
 
-    sbu = db.query(SBU).filter(SBU.id == sbu_id).first()
+    sbu = sbu_catalog.get(db, sbu_id)
     if not sbu:
         raise HTTPException(status_code=404)
 
-    total_sales = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date.between(start_date, end_date),
-            Sale.is_cancelled == False
-        )
-        .scalar()
-    )
-
-    variable_expenses = (
-        db.query(func.coalesce(func.sum(Expense.amount), 0))
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from.between(start_date, end_date),
-            Expense.is_cancelled == False
-        )
-        .scalar()
+    # 📦 SNAPSHOT FOR CLOSED RANGES, LIVE FOR THE OPEN DAY
+    measures = report_flight.do(
+        ("sbu-range", sbu.id, start_date, end_date),
+        lambda: snapshots.measures(db, sbu.id, start_date, end_date, with_staff=False)
     )
+    total_sales = measures["total_sales"]
+    variable_expenses = measures["variable_expenses"]
 
-    fixed_expenses = (
-        (sbu.personnel_cost or 0) +
-        (sbu.rent or 0) +
-        (sbu.electricity or 0)
-    )
+    fixed_expenses = fixed_cost_index.total(db, sbu, start_date, end_date)
 
     total_expenses = fixed_expenses + variable_expenses
     net_profit = total_sales - total_expenses
@@ -350,52 +673,22 @@ def staff_dashboard(
         )
 
     # 🔎 Fetch SBU
-    sbu = db.query(SBU).filter(SBU.id == current_user.sbu_id).first()
+    sbu = sbu_catalog.get(db, current_user.sbu_id)
     if not sbu:
         raise HTTPException(status_code=404, detail="Assigned SBU not found")
 
     today = date.today()
 
-    # 💰 SALES TODAY
-    sales_today = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date == today
-        )
-        .scalar()
+    # 💰 SALES + 📦 VARIABLE EXPENSES (shared by concurrent identical requests)
+    measures = report_flight.do(
+        ("dashboard", sbu.id, today),
+        lambda: dashboard_measures(db, sbu.id, today)
     )
+    sales_today = measures["sales_today"]
+    variable_costs = dict(measures["variable_costs"])
 
-    # 📦 VARIABLE EXPENSES (GROUPED BY CATEGORY)
-    expense_rows = (
-        db.query(
-            Expense.category,
-            func.coalesce(func.sum(Expense.amount), 0)
-        )
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from == today
-        )
-        .group_by(Expense.category)
-        .all()
-    )
-
-    variable_costs = {
-        "consumables": 0,
-        "general_expenses": 0,
-        "utilities": 0,
-        "miscellaneous": 0
-    }
-
-    for category, amount in expense_rows:
-        variable_costs[category] = amount
-
-    # 📉 FIXED COSTS
-    fixed_costs = {
-        "personnel_cost": sbu.personnel_cost or 0,
-        "rent": sbu.rent or 0,
-        "electricity": sbu.electricity or 0,
-    }
+    # 📉 FIXED COSTS (as scheduled for today)
+    fixed_costs = fixed_cost_index.on(db, sbu, today)
 
     fixed_total = sum(fixed_costs.values())
     variable_total = sum(variable_costs.values())
@@ -411,16 +704,10 @@ def staff_dashboard(
         else 0
     )
 
-    performance_status = (
-        "Excellent"
-        if performance_percent >= 100
-        else "warning"
-        if performance_percent >= 80
-        else "Critical"
-    )
+    performance_status = alerts.classify(db, sbu.id, performance_percent)
 
     # ✅ FINAL RESPONSE (MATCHES staff.js EXACTLY)
-    return {
+    return model_response(StaffDashboardResponse, {
         "sbu": {
             "id": sbu.id,
             "name": sbu.name,
@@ -436,7 +723,7 @@ def staff_dashboard(
         "net_profit": net_profit,
         "performance_percent": performance_percent,
         "performance_status": performance_status
-    }
+    })
 
         
 # ---------------- ADMIN SBU REPORT (WITH STAFF BREAKDOWN) ----------------
@@ -452,122 +739,39 @@ def admin_sbu_report(
         raise HTTPException(status_code=403, detail="Not authorized to view reports")
 
 
-    sbu = db.query(SBU).filter(
-        SBU.id == sbu_id,
-        SBU.is_active == True
-    ).first()
+    sbu = sbu_catalog.get(db, sbu_id)
 
-    if not sbu:
+    if not sbu or not sbu.is_active:
         raise HTTPException(status_code=404, detail="SBU not found or inactive")
 
     # 📆 DATE RANGE
-    if period == "daily":
-        start = report_date
-        end = report_date
-    elif period == "weekly":
-        start = report_date - timedelta(days=6)
-        end = report_date
-    elif period == "monthly":
-        start = report_date.replace(day=1)
-        end = report_date
-    else:
+    date_range = period_range(period, report_date)
+    if not date_range:
         raise HTTPException(status_code=400, detail="Invalid period")
 
+    start, end = date_range
     days_count = (end - start).days + 1
 
-    # 💰 TOTAL SALES (exclude cancelled)
-    total_sales = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date.between(start, end),
-            Sale.is_cancelled == False
-        )
-        .scalar()
+    # 📦 SNAPSHOT FOR CLOSED RANGES, LIVE FOR THE OPEN DAY
+    measures = report_flight.do(
+        ("sbu-report", sbu.id, start, end),
+        lambda: snapshots.measures(db, sbu.id, start, end)
     )
+    total_sales = measures["total_sales"]
+    variable_expenses = measures["variable_expenses"]
 
-    # 💸 VARIABLE EXPENSES (exclude cancelled)
-    variable_expenses = (
-        db.query(func.coalesce(func.sum(Expense.amount), 0))
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from.between(start, end),
-            Expense.is_cancelled == False
-        )
-        .scalar()
-    )
-
-    # 🧾 FIXED EXPENSES (scaled by period)
-    daily_fixed = (
-        (sbu.personnel_cost or 0) +
-        (sbu.rent or 0) +
-        (sbu.electricity or 0)
-    )
-
-    fixed_expenses = daily_fixed * days_count
+    # 🧾 FIXED EXPENSES (as scheduled over the period)
+    fixed_expenses = fixed_cost_index.total(db, sbu, start, end)
     total_expenses = fixed_expenses + variable_expenses
     net_profit = total_sales - total_expenses
 
-    # 👥 STAFF BREAKDOWN (date-aware)
-    sales_subq = (
-        db.query(
-            Sale.created_by.label("staff_id"),
-            func.coalesce(func.sum(Sale.amount), 0).label("sales")
-        )
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date.between(start, end),
-            Sale.is_cancelled == False
-        )
-        .group_by(Sale.created_by)
-        .subquery()
-    )
-
-    expense_subq = (
-        db.query(
-            Expense.created_by.label("staff_id"),
-            func.coalesce(func.sum(Expense.amount), 0).label("expenses")
-        )
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from.between(start, end),
-            Expense.is_cancelled == False
-        )
-        .group_by(Expense.created_by)
-        .subquery()
-    )
-
-    staff_rows = (
-        db.query(
-            User.id,
-            User.full_name,
-            func.coalesce(sales_subq.c.sales, 0),
-            func.coalesce(expense_subq.c.expenses, 0)
-        )
-        .outerjoin(sales_subq, sales_subq.c.staff_id == User.id)
-        .outerjoin(expense_subq, expense_subq.c.staff_id == User.id)
-        .filter(User.sbu_id == sbu.id)
-        .all()
-    )
-
-    staff_breakdown = [
-        {
-            "staff_id": s.id,
-            "staff_name": s.full_name,
-            "total_sales": s[2],
-            "total_expenses": s[3],
-            "net_profit": s[2] - s[3]
-        }
-        for s in staff_rows
-    ]
-
     performance = (
         round((total_sales / (sbu.daily_budget * days_count)) * 100, 2)
         if sbu.daily_budget and sbu.daily_budget > 0
         else 0
     )
 
-    return {
+    return model_response(SBUReportWithStaffSchema, {
         "period": period,
         "date_range": {"from": start, "to": end},
         "total_sales": total_sales,
@@ -576,9 +780,118 @@ def admin_sbu_report(
         "total_expenses": total_expenses,
         "net_profit": net_profit,
         "performance_percent": performance,
-        "staff_breakdown": staff_breakdown
+        "staff_breakdown": measures["staff_breakdown"]
+    })
+
+# ---------------- ADMIN: DEPARTMENT ROLLUPS ----------------
+@app.get("/admin/department-report")
+def admin_department_report(
+    period: str,
+    report_date: date,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    date_range = period_range(period, report_date)
+    if not date_range:
+        raise HTTPException(status_code=400, detail="Invalid period")
+
+    start, end = date_range
+    return {
+        "period": period,
+        **report_flight.do(("department-report", start, end), lambda: rollup(db, start, end, depth="department"))
     }
 
+
+@app.get("/admin/company-report")
+def admin_company_report(
+    start_date: date,
+    end_date: date,
+    depth: Literal["department", "sbu", "staff"] = "sbu",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Company -> department -> SBU -> staff drill-down; `depth` sets the lowest level."""
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    return report_flight.do(
+        ("company-report", start_date, end_date, depth),
+        lambda: rollup(db, start_date, end_date, depth)
+    )
+
+# ---------------- ADMIN ANALYTICS ----------------
+@app.get("/admin/analytics/trends")
+def admin_analytics_trends(
+    end_date: Optional[date] = None,
+    days: int = Query(30, ge=7, le=366),
+    window: int = Query(7, ge=1, le=90),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    return FastJSONResponse(analytics.trends(db, end_date or date.today(), days, window))
+
+
+@app.get("/admin/analytics/forecast")
+def admin_analytics_forecast(
+    start_date: Optional[date] = None,
+    horizon: int = Query(7, ge=1, le=90),
+    history_weeks: int = Query(8, ge=1, le=52),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    return FastJSONResponse(
+        analytics.forecast(db, start_date or date.today(), horizon, history_weeks)
+    )
+
+# ---------------- ADMIN: BUDGET ALERTS ----------------
+@app.get("/admin/alerts")
+def list_budget_alerts(
+    alert_date: Optional[date] = None,
+    status: Optional[Literal["Excellent", "warning", "Critical"]] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view reports")
+
+    query = db.query(BudgetAlert).filter(BudgetAlert.alert_date == (alert_date or date.today()))
+
+    # Default view: everything that needs attention
+    if status:
+        query = query.filter(BudgetAlert.status == status)
+    else:
+        query = query.filter(BudgetAlert.status != "Excellent")
+
+    rows = query.order_by(BudgetAlert.performance_percent).all()
+    names = {sbu.id: sbu.name for sbu in sbu_catalog.all(db)}
+
+    return FastJSONResponse([
+        {
+            "sbu_id": a.sbu_id,
+            "sbu_name": names.get(a.sbu_id),
+            "date": a.alert_date,
+            "status": a.status,
+            "performance_percent": a.performance_percent,
+            "sales": a.sales,
+            "expenses": a.expenses,
+            "daily_budget": a.daily_budget,
+            "updated_at": a.updated_at
+        }
+        for a in rows
+    ])
+
 # ---------------- AUDIT LOGS ----------------
 @app.get("/admin/audit-logs")
 def get_audit_logs(
@@ -595,14 +908,14 @@ def get_audit_logs(
         .all()
     )
 
-    return [
+    return FastJSONResponse([
         {
             "staff": l.user.full_name if l.user else "System",
             "action": l.action,
             "time": l.created_at
         }
         for l in logs
-    ]
+    ])
 
 @app.get("/admin/staff/{staff_id}/sbu-report")
 def admin_staff_sbu_report(
@@ -626,44 +939,21 @@ def admin_staff_sbu_report(
     if not staff.sbu_id:
         raise HTTPException(status_code=400, detail="Staff not assigned to SBU")
 
-    sbu = db.query(SBU).filter(SBU.id == staff.sbu_id).first()
+    sbu = sbu_catalog.get(db, staff.sbu_id)
     if not sbu:
         raise HTTPException(status_code=404, detail="SBU not found")
 
     # ---- DATE RANGE ----
-    if period == "daily":
-        start = report_date
-        end = report_date
-    elif period == "weekly":
-        start = report_date - timedelta(days=6)
-        end = report_date
-    elif period == "monthly":
-        start = report_date.replace(day=1)
-        end = report_date
-    else:
+    date_range = period_range(period, report_date)
+    if not date_range:
         raise HTTPException(status_code=400, detail="Invalid period")
 
-    # ---- SALES ----
-    total_sales = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date >= start,
-            Sale.date <= end
-        )
-        .scalar()
-    )
+    start, end = date_range
 
-    # ---- EXPENSES ----
-    total_expenses = (
-        db.query(func.coalesce(func.sum(Expense.amount), 0))
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from >= start,
-            Expense.effective_from <= end
-        )
-        .scalar()
-    )
+    # ---- SALES + EXPENSES (one statement) ----
+    measures = snapshots.measures(db, sbu.id, start, end, with_staff=False)
+    total_sales = measures["total_sales"]
+    total_expenses = measures["variable_expenses"]
 
     net_profit = total_sales - total_expenses
 
@@ -699,27 +989,10 @@ def admin_staff_report_range(
     if not staff:
         raise HTTPException(status_code=404, detail="Staff not found")
 
-    # SALES
-    total_sales = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.created_by == staff.id,
-            Sale.date.between(start_date, end_date),
-            Sale.is_cancelled == False
-        )
-        .scalar()
-    )
-
-    # EXPENSES
-    total_expenses = (
-        db.query(func.coalesce(func.sum(Expense.amount), 0))
-        .filter(
-            Expense.created_by == staff.id,
-            Expense.effective_from.between(start_date, end_date),
-            Expense.is_cancelled == False
-        )
-        .scalar()
-    )
+    # SALES + EXPENSES (one statement)
+    measures = staff_measures(db, staff.id, start_date, end_date)
+    total_sales = measures["total_sales"]
+    total_expenses = measures["total_expenses"]
 
     return {
         "staff": {"id": staff.id, "name": staff.full_name},
@@ -732,6 +1005,11 @@ def admin_staff_report_range(
 
 @app.get("/staff/expenses/history")
 def get_staff_expense_history(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    before: Optional[date] = None,
+    limit: int = Query(31, ge=1, le=366),
+    granularity: Literal["daily", "monthly"] = "daily",
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -741,34 +1019,67 @@ def get_staff_expense_history(
     if not current_user.sbu_id:
         raise HTTPException(status_code=400, detail="Staff not assigned to SBU")
 
-    rows = (
-        db.query(
-            Expense.effective_from,
-            Expense.category,
-            func.coalesce(func.sum(Expense.amount), 0)
+    # 🗄️ LIVE TABLES, PLUS THE ARCHIVE WHEN THE RANGE REACHES IT
+    Expenses = expenses_source(start_date)
+
+    filters = [
+        Expenses.sbu_id == current_user.sbu_id,
+        Expenses.is_cancelled == False
+    ]
+    if start_date:
+        filters.append(Expenses.effective_from >= start_date)
+    if end_date:
+        filters.append(Expenses.effective_from <= end_date)
+
+    # 🔑 KEYSET CURSOR (bucket start of the last row on the previous page)
+    if before:
+        filters.append(Expenses.effective_from < before)
+
+    if granularity == "monthly":
+        year = extract("year", Expenses.effective_from)
+        month = extract("month", Expenses.effective_from)
+        buckets = [year, month]
+    else:
+        buckets = [Expenses.effective_from]
+
+    # 📊 CATEGORIES PIVOTED INTO COLUMNS
+    columns = [
+        func.coalesce(
+            func.sum(case((Expenses.category == category, Expenses.amount), else_=0)),
+            0
         )
-        .filter(Expense.sbu_id == current_user.sbu_id)
-        .group_by(Expense.effective_from, Expense.category)
-        .order_by(Expense.effective_from.desc())
+        for category in EXPENSE_CATEGORIES
+    ]
+
+    rows = (
+        db.query(*buckets, *columns)
+        .filter(*filters)
+        .group_by(*buckets)
+        .order_by(*[b.desc() for b in buckets])
+        .limit(limit + 1)
         .all()
     )
 
     history = {}
+    cursor = None
 
-    for day, category, amount in rows:
-        day_str = day.isoformat()
+    for row in rows[:limit]:
+        if granularity == "monthly":
+            cursor = date(int(row[0]), int(row[1]), 1)
+            key = cursor.strftime("%Y-%m")
+            amounts = row[2:]
+        else:
+            cursor = row[0]
+            key = cursor.isoformat()
+            amounts = row[1:]
 
-        if day_str not in history:
-            history[day_str] = {
-                "consumables": 0,
-                "general_expenses": 0,
-                "utilities": 0,
-                "miscellaneous": 0
-            }
+        history[key] = dict(zip(EXPENSE_CATEGORIES, amounts))
 
-        history[day_str][category] = amount
+    headers = {}
+    if len(rows) > limit:
+        headers["X-Next-Cursor"] = cursor.isoformat()
 
-    return history
+    return FastJSONResponse(history, headers=headers)
 
 # ---------------- ADMIN: DEACTIVATE STAFF ----------------
 @app.patch("/admin/staff/{staff_id}/deactivate")
@@ -791,7 +1102,8 @@ def deactivate_staff(
         raise HTTPException(status_code=404, detail="Staff not found")
 
     staff.is_active = False
-    db.commit()
+    refresh_tokens.revoke_all(db, staff.id)
+    commit(db)
 
     return {"message": "Staff deactivated successfully"}
 
@@ -816,7 +1128,7 @@ def activate_staff(
         raise HTTPException(status_code=404, detail="Staff not found")
 
     staff.is_active = True
-    db.commit()
+    commit(db)
 
     return {"message": "Staff activated successfully"}
 
@@ -838,8 +1150,9 @@ def delete_staff(
     if not staff:
         raise HTTPException(status_code=404, detail="Staff not found")
 
+    refresh_tokens.revoke_all(db, staff.id)
     db.delete(staff)
-    db.commit()
+    commit(db)
 
     return {"message": "Staff deleted successfully"}
 
@@ -863,7 +1176,8 @@ def change_password(
     # ✅ ADD THIS
     current_user.must_change_password = False
 
-    db.commit()
+    refresh_tokens.revoke_all(db, current_user.id)
+    commit(db)
 
     return {"message": "Password updated successfully"}
 
@@ -882,53 +1196,24 @@ def staff_sbu_report(
         raise HTTPException(status_code=403, detail="Account inactive")
 
     # 🔎 Get staff SBU
-    sbu = db.query(SBU).filter(SBU.id == current_user.sbu_id).first()
+    sbu = sbu_catalog.get(db, current_user.sbu_id)
     if not sbu:
         raise HTTPException(status_code=404, detail="SBU not found")
 
     # 📆 DATE RANGE
-    if period == "daily":
-        start = report_date
-        end = report_date
-    elif period == "weekly":
-        start = report_date - timedelta(days=6)
-        end = report_date
-    elif period == "monthly":
-        start = report_date.replace(day=1)
-        end = report_date
-    else:
+    date_range = period_range(period, report_date)
+    if not date_range:
         raise HTTPException(status_code=400, detail="Invalid period")
 
-    # 💰 TOTAL SALES (exclude cancelled)
-    total_sales = (
-        db.query(func.coalesce(func.sum(Sale.amount), 0))
-        .filter(
-            Sale.sbu_id == sbu.id,
-            Sale.date >= start,
-            Sale.date <= end,
-            Sale.is_cancelled == False
-        )
-        .scalar()
-    )
+    start, end = date_range
 
-    # 💸 VARIABLE EXPENSES (exclude cancelled)
-    variable_expenses = (
-        db.query(func.coalesce(func.sum(Expense.amount), 0))
-        .filter(
-            Expense.sbu_id == sbu.id,
-            Expense.effective_from >= start,
-            Expense.effective_from <= end,
-            Expense.is_cancelled == False
-        )
-        .scalar()
-    )
+    # 💰 SALES + 💸 VARIABLE EXPENSES (exclude cancelled, one statement)
+    measures = snapshots.measures(db, sbu.id, start, end, with_staff=False)
+    total_sales = measures["total_sales"]
+    variable_expenses = measures["variable_expenses"]
 
-    # 🧾 FIXED EXPENSES (from SBU)
-    fixed_expenses = (
-        (sbu.personnel_cost or 0) +
-        (sbu.rent or 0) +
-        (sbu.electricity or 0)
-    )
+    # 🧾 FIXED EXPENSES (as scheduled over the period)
+    fixed_expenses = fixed_cost_index.total(db, sbu, start, end)
 
     # 📉 TOTAL EXPENSES
     total_expenses = fixed_expenses + variable_expenses
@@ -968,10 +1253,10 @@ def staff_audit_logs(
         .all()
     )
 
-    return [
+    return FastJSONResponse([
         {"action": l.action, "time": l.created_at}
         for l in logs
-    ]
+    ])
 
 
 @app.patch("/admin/sales/{sale_id}/cancel")
@@ -988,16 +1273,20 @@ def cancel_sale(
     if not sale:
         raise HTTPException(status_code=404)
 
+    delta = {} if sale.is_cancelled else {"sales": -sale.amount, "cancelled_sales": sale.amount}
     sale.is_cancelled = True
+    snapshots.invalidate(db, sale.sbu_id, sale.date)
 
     db.add(AuditLog(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         user_id=current_user.id,
         action=f"Cancelled sale {sale_id}",
         entity="sale"
     ))
 
-    db.commit()
+    after_commit(db, lambda: alert_engine.submit(sale.sbu_id, sale.date))
+    after_commit(db, lambda: report_cube.publish(sale.sbu_id, sale.date, delta, outbox.committed_seq(db)))
+    commit(db)
     return {"message": "Sale cancelled"}
     
 
@@ -1015,16 +1304,20 @@ def cancel_expense(
     if not expense:
         raise HTTPException(status_code=404)
 
+    delta = {} if expense.is_cancelled else {expense.category: -expense.amount, "cancelled_expenses": expense.amount}
     expense.is_cancelled = True
+    snapshots.invalidate(db, expense.sbu_id, expense.effective_from)
 
     db.add(AuditLog(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         user_id=current_user.id,
         action=f"Cancelled expense {expense_id}",
         entity="expense"
     ))
 
-    db.commit()
+    after_commit(db, lambda: alert_engine.submit(expense.sbu_id, expense.effective_from))
+    after_commit(db, lambda: report_cube.publish(expense.sbu_id, expense.effective_from, delta, outbox.committed_seq(db)))
+    commit(db)
     return {"message": "Expense cancelled"}
 
 
@@ -1045,7 +1338,8 @@ def reset_staff_password(
     staff.password_hash = hash_password(new_password)
     staff.must_change_password = True
 
-    db.commit()
+    refresh_tokens.revoke_all(db, staff.id)
+    commit(db)
 
     return {
         "message": "Password reset successfully",
@@ -1064,7 +1358,7 @@ def create_admin_user(
     temp_password = "Admin@1234"
 
     user = User(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         full_name=payload.full_name,
         username=payload.username,
         password_hash=hash_password(temp_password),
@@ -1073,7 +1367,7 @@ def create_admin_user(
     )
 
     db.add(user)
-    db.commit()
+    commit(db)
 
     return {
         "message": "Admin created",
@@ -1083,9 +1377,19 @@ def create_admin_user(
 
 
 # ---------------- SWAGGER AUTH ----------------
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OPENAPI_CACHE_FILE = os.getenv("OPENAPI_CACHE_FILE", os.path.join(BASE_DIR, "openapi.json"))
+
+
+def _openapi_source_hash() -> str:
+    digest = hashlib.sha1()
+    for name in ("main.py", "schemas.py"):
+        with open(os.path.join(BASE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_openapi() -> dict:
     schema = get_openapi(
         title="DrPhysiQ Inventory API",
         version="1.0.0",
@@ -1095,7 +1399,215 @@ def custom_openapi():
         "BearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}
     }
     schema["security"] = [{"BearerAuth": []}]
-    app.openapi_schema = schema
+    schema["x-source-hash"] = _openapi_source_hash()
+    return schema
+
+
+def write_openapi_cache(path: str = OPENAPI_CACHE_FILE):
+    """Build-time step: python -c "import main; main.write_openapi_cache()" """
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(build_openapi()))
+
+
+def custom_openapi():
+    if app.openapi_schema:
+        return app.openapi_schema
+
+    # Use the build-time cache unless the routes or schemas changed since
+    try:
+        with open(OPENAPI_CACHE_FILE, "rb") as f:
+            cached = orjson.loads(f.read())
+        if cached.get("x-source-hash") == _openapi_source_hash():
+            app.openapi_schema = cached
+            return app.openapi_schema
+    except (OSError, ValueError):
+        pass
+
+    app.openapi_schema = build_openapi()
     return app.openapi_schema
 
 app.openapi = custom_openapi
+
+
+# ---------------- ADMIN: BACKGROUND JOBS ----------------
+JOB_ROLES = ["accountant_admin", "ops_admin", "super_admin"]
+
+
+def _job_view(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result_url": f"/admin/jobs/{job.id}/result" if job.status == "done" else None
+    }
+
+
+def _get_job(db: Session, job_id: str, current_user: User) -> Job:
+    if current_user.role not in JOB_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized to run jobs")
+
+    job = db.get(Job, job_id)
+    if not job or (job.created_by != current_user.id and current_user.role != "super_admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/admin/jobs", status_code=202)
+def submit_job(
+    payload: JobCreateSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in JOB_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized to run jobs")
+
+    try:
+        job = jobs.submit(db, new_id(), payload.kind, payload.params, current_user.id)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    commit(db)
+    return _job_view(job)
+
+
+@app.get("/admin/jobs")
+def list_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in JOB_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized to run jobs")
+
+    query = db.query(Job)
+    if current_user.role != "super_admin":
+        query = query.filter(Job.created_by == current_user.id)
+
+    return [_job_view(j) for j in query.order_by(Job.created_at.desc()).limit(limit)]
+
+
+@app.get("/admin/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return _job_view(_get_job(db, job_id, current_user))
+
+
+@app.get("/admin/jobs/{job_id}/result")
+def download_job_result(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    job = _get_job(db, job_id, current_user)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    path = jobs.result_path(job.id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Job result expired")
+
+    return FileResponse(path, media_type=job.result_type, filename=job.result_file)
+
+
+# ---------------- ADMIN: CHANGE FEED ----------------
+@app.get("/admin/changes")
+async def change_feed(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    wait: float = Query(25, ge=0, le=60),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["accountant_admin", "ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to read changes")
+
+    # Long-polls until there is at least one event or `wait` runs out
+    events = await outbox.wait_for_changes(db, since, limit, wait)
+    cursor = events[-1].seq if events else since
+
+    return FastJSONResponse(
+        [outbox.event_view(e) for e in events],
+        headers={"X-Next-Cursor": str(cursor)}
+    )
+
+
+# ---------------- ADMIN: EDGE SYNC ----------------
+def _edge_sbu(db: Session, current_user: User, sbu_id: str):
+    if current_user.role not in ["ops_admin", "super_admin"]:
+        raise HTTPException(status_code=403, detail="Operations admin only")
+    if not sbu_catalog.get(db, sbu_id):
+        raise HTTPException(status_code=404, detail="SBU not found")
+
+
+def _apply_edge_push(db: Session, current_user: User, sbu_id: str, batch: dict, idempotency_key: Optional[str]):
+    _edge_sbu(db, current_user, sbu_id)
+
+    # Entries are only ever recorded by the SBU's own members
+    creators = {
+        entry["created_by"]
+        for entry in batch.get("sales", []) + batch.get("expenses", [])
+        if entry["created_by"] is not None
+    }
+    members = (
+        db.query(func.count(User.id)).filter(User.id.in_(creators), User.sbu_id == sbu_id).scalar()
+        if creators else 0
+    )
+    if members != len(creators):
+        raise HTTPException(status_code=400, detail="Invalid batch: created_by is not a member of this SBU")
+
+    route = f"/admin/edge/push?sbu_id={sbu_id}"
+    replay = idempotency.lookup(db, current_user.id, idempotency_key, route, batch)
+    if replay:
+        return replay
+
+    response = edge.apply_push(db, sbu_id, batch)
+    idempotency.store(db, current_user.id, idempotency_key, route, batch, response)
+
+    replay = idempotency.commit_or_replay(db, current_user.id, idempotency_key, route, batch)
+    return replay or response
+
+
+@app.post("/admin/edge/push")
+async def edge_push(
+    request: Request,
+    sbu_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Apply a batch of sales, expenses and audit logs recorded on an edge install."""
+    body = await request.body()
+    try:
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        # Checked as sent; apply_push works on the plain dict
+        EdgeBatchSchema.model_validate_json(body)
+        batch = orjson.loads(body)
+    except (OSError, ValidationError):
+        raise HTTPException(status_code=400, detail="Invalid batch")
+
+    return await run_in_threadpool(_apply_edge_push, db, current_user, sbu_id, batch, idempotency_key)
+
+
+@app.get("/admin/edge/pull")
+def edge_pull(
+    sbu_id: str,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """SBU and user changes for an edge install; no cursor returns a full snapshot."""
+    _edge_sbu(db, current_user, sbu_id)
+    return edge.pull(db, sbu_id, since, limit)
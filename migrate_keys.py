@@ -0,0 +1,153 @@
+"""
+Convert CHAR(36) / VARCHAR keys to BINARY(16) on MySQL.
+
+    python migrate_keys.py                      # every UUIDKey column in models.py
+    python migrate_keys.py --batch-size 5000
+    python migrate_keys.py --dry-run            # print the plan only
+
+For each table the key columns are first widened to VARBINARY(36) (a
+lossless copy of the text), then rewritten in batches of --batch-size
+rows with UNHEX(REPLACE(col, '-', '')), and finally narrowed to
+BINARY(16). The conversion is deterministic, so primary keys and the
+foreign keys pointing at them stay consistent without a mapping table;
+foreign key constraints are dropped first and recreated at the end.
+
+Existing rows keep their (random) UUIDv4 values; only rows created after
+the migration get time-ordered keys from keys.new_id(). Rerunning the
+tool skips columns that are already BINARY(16); the foreign keys are
+printed before they are dropped, so an interrupted run can have them
+recreated by hand. Stop the app while it runs.
+"""
+import argparse
+
+from sqlalchemy import text
+
+from database import Base, get_engine
+from keys import UUIDKey
+import models  # noqa: F401  (registers every table on Base.metadata)
+
+
+# ================= PLAN =================
+def key_columns() -> dict[str, list]:
+    """table -> UUIDKey columns, in dependency order."""
+    return {
+        table.name: [c for c in table.columns if isinstance(c.type, UUIDKey)]
+        for table in Base.metadata.sorted_tables
+        if any(isinstance(c.type, UUIDKey) for c in table.columns)
+    }
+
+
+def _column_type(conn, table: str, column: str) -> str | None:
+    return conn.execute(
+        text(
+            "SELECT COLUMN_TYPE FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND COLUMN_NAME = :c"
+        ),
+        {"t": table, "c": column}
+    ).scalar()
+
+
+def _foreign_keys(conn, tables: list[str]) -> list[dict]:
+    rows = conn.execute(
+        text(
+            "SELECT k.TABLE_NAME, k.CONSTRAINT_NAME, k.COLUMN_NAME, "
+            "k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, r.DELETE_RULE "
+            "FROM information_schema.KEY_COLUMN_USAGE k "
+            "JOIN information_schema.REFERENTIAL_CONSTRAINTS r "
+            "ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME "
+            "WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL"
+        )
+    ).mappings()
+    return [dict(row) for row in rows if row["TABLE_NAME"] in tables]
+
+
+# ================= MIGRATION =================
+def _rewrite_in_batches(engine, table: str, column: str, batch_size: int) -> int:
+    total = 0
+    while True:
+        # One short transaction per batch keeps locks and undo small
+        with engine.begin() as conn:
+            moved = conn.execute(
+                text(
+                    f"UPDATE `{table}` SET `{column}` = UNHEX(REPLACE(`{column}`, '-', '')) "
+                    f"WHERE LENGTH(`{column}`) = 36 LIMIT {batch_size}"
+                )
+            ).rowcount
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def _convert_table(engine, table: str, columns: list, batch_size: int, dry_run: bool):
+    with engine.connect() as conn:
+        pending = [c for c in columns if (_column_type(conn, table, c.name) or "").lower() != "binary(16)"]
+
+    if not pending:
+        print(f"{table}: already converted")
+        return
+
+    widen = ", ".join(f"MODIFY `{c.name}` VARBINARY(36)" for c in pending)
+    narrow = ", ".join(
+        f"MODIFY `{c.name}` BINARY(16){'' if c.nullable else ' NOT NULL'}" for c in pending
+    )
+
+    if dry_run:
+        print(f"{table}: {', '.join(c.name for c in pending)}")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE `{table}` {widen}"))
+
+    for c in pending:
+        moved = _rewrite_in_batches(engine, table, c.name, batch_size)
+        print(f"{table}.{c.name}: rewrote {moved} keys")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE `{table}` {narrow}"))
+
+
+def migrate(batch_size: int, dry_run: bool):
+    engine = get_engine()
+    if engine.dialect.name != "mysql":
+        raise SystemExit("Key conversion is only needed on MySQL; other databases keep CHAR(36)")
+
+    plan = key_columns()
+
+    with engine.connect() as conn:
+        foreign_keys = _foreign_keys(conn, list(plan))
+
+    if dry_run:
+        print(f"Would drop and recreate {len(foreign_keys)} foreign keys")
+    else:
+        with engine.begin() as conn:
+            for fk in foreign_keys:
+                print(
+                    f"Dropping {fk['TABLE_NAME']}.{fk['CONSTRAINT_NAME']}: "
+                    f"{fk['COLUMN_NAME']} -> {fk['REFERENCED_TABLE_NAME']}.{fk['REFERENCED_COLUMN_NAME']}"
+                )
+                conn.execute(text(f"ALTER TABLE `{fk['TABLE_NAME']}` DROP FOREIGN KEY `{fk['CONSTRAINT_NAME']}`"))
+
+    for table, columns in plan.items():
+        _convert_table(engine, table, columns, batch_size, dry_run)
+
+    if dry_run:
+        return
+
+    with engine.begin() as conn:
+        for fk in foreign_keys:
+            conn.execute(text(
+                f"ALTER TABLE `{fk['TABLE_NAME']}` ADD CONSTRAINT `{fk['CONSTRAINT_NAME']}` "
+                f"FOREIGN KEY (`{fk['COLUMN_NAME']}`) "
+                f"REFERENCES `{fk['REFERENCED_TABLE_NAME']}` (`{fk['REFERENCED_COLUMN_NAME']}`) "
+                f"ON DELETE {fk['DELETE_RULE']}"
+            ))
+    print(f"Recreated {len(foreign_keys)} foreign keys")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert UUID keys to BINARY(16)")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    migrate(args.batch_size, args.dry_run)
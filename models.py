@@ -2,23 +2,36 @@ from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
+    Float,
     Date,
     DateTime,
     ForeignKey,
     Text,
     Boolean,
+    Index,
     func
 )
 from sqlalchemy.orm import relationship
 from database import Base
+from keys import UUIDKey
 from datetime import datetime
 
 
+# Variable expense categories recorded by staff
+EXPENSE_CATEGORIES = (
+    "consumables",
+    "general_expenses",
+    "utilities",
+    "miscellaneous"
+)
+
+
 # ================= USER =================
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String(36), primary_key=True)
+    id = Column(UUIDKey, primary_key=True)
     full_name = Column(String(150), nullable=False)
     username = Column(String(100), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
@@ -27,7 +40,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     must_change_password = Column(Boolean, default=True)
 
-    sbu_id = Column(String, ForeignKey("sbus.id"), nullable=True)
+    sbu_id = Column(UUIDKey, ForeignKey("sbus.id"), nullable=True)
     sbu = relationship("SBU", back_populates="staff")
 
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -37,7 +50,7 @@ class User(Base):
 class SBU(Base):
     __tablename__ = "sbus"
 
-    id = Column(String, primary_key=True)
+    id = Column(UUIDKey, primary_key=True)
     name = Column(String, nullable=False)
     department = Column(String, nullable=False)
     daily_budget = Column(Integer, nullable=False)
@@ -56,19 +69,38 @@ class SBU(Base):
     expenses = relationship("Expense", back_populates="sbu", cascade="all,delete")
 
 
+# ================= FIXED COST SCHEDULE =================
+# Daily fixed costs per SBU with validity intervals (valid_to inclusive,
+# NULL = open-ended); see fixed_costs.py
+class FixedCost(Base):
+    __tablename__ = "fixed_costs"
+
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, ForeignKey("sbus.id"), nullable=False)
+    cost_type = Column(String(20), nullable=False)
+    amount = Column(Integer, nullable=False)
+    valid_from = Column(Date, nullable=False)
+    valid_to = Column(Date)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_fixed_costs_sbu_type_from", "sbu_id", "cost_type", "valid_from", unique=True),
+    )
+
+
 # ================= SALE =================
 class Sale(Base):
     __tablename__ = "sales"
 
-    id = Column(String, primary_key=True)
-    sbu_id = Column(String, ForeignKey("sbus.id"), nullable=False)
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, ForeignKey("sbus.id"), nullable=False)
     amount = Column(Integer, nullable=False)
     date = Column(Date, nullable=False)
     notes = Column(Text)
 
     is_cancelled = Column(Boolean, default=False)  # ✅ ADD THIS
 
-    created_by = Column(String, ForeignKey("users.id"))
+    created_by = Column(UUIDKey, ForeignKey("users.id"))
     created_at = Column(DateTime, server_default=func.now())
 
     sbu = relationship("SBU", back_populates="sales")
@@ -79,8 +111,8 @@ class Sale(Base):
 class Expense(Base):
     __tablename__ = "expenses"
 
-    id = Column(String, primary_key=True)
-    sbu_id = Column(String, ForeignKey("sbus.id"), nullable=False)
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, ForeignKey("sbus.id"), nullable=False)
     category = Column(String, nullable=False)
     amount = Column(Integer, nullable=False)
     effective_from = Column(Date, nullable=False)
@@ -88,21 +120,225 @@ class Expense(Base):
 
     is_cancelled = Column(Boolean, default=False)  # ✅ ADD THIS
 
-    created_by = Column(String, ForeignKey("users.id"))
+    created_by = Column(UUIDKey, ForeignKey("users.id"))
     created_at = Column(DateTime, server_default=func.now())
 
     sbu = relationship("SBU", back_populates="expenses")
     staff = relationship("User")
 
+    __table_args__ = (
+        Index("ix_expenses_sbu_effective_from", "sbu_id", "effective_from"),
+    )
+
 
 # ================= AUDIT LOG =================
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
-    id = Column(String(36), primary_key=True)
-    user_id = Column(String(36), ForeignKey("users.id"))
+    id = Column(UUIDKey, primary_key=True)
+    user_id = Column(UUIDKey, ForeignKey("users.id"))
     action = Column(String(255), nullable=False)
     entity = Column(String(50))
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User")
+
+
+# ================= IDEMPOTENCY KEY =================
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(UUIDKey, primary_key=True)
+    key = Column(String(64), primary_key=True)
+    route = Column(String(100), nullable=False)
+    # SHA-256 of route + body; a key reused for another request is rejected
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# ================= REFRESH TOKEN =================
+# Opaque rotating refresh tokens, stored as a keyed SHA-256 of the token.
+# A token that is presented again after rotation revokes its whole family.
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(UUIDKey, ForeignKey("users.id"), nullable=False, index=True)
+    family_id = Column(UUIDKey, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    rotated_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ================= JOBS =================
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(UUIDKey, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")   # queued / running / done / failed
+    progress = Column(Float, nullable=False, default=0)
+    message = Column(String(255))
+    error = Column(Text)
+    result_file = Column(String(255))
+    result_type = Column(String(100))
+    created_by = Column(UUIDKey)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime, index=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        Index("ix_jobs_created_by_created_at", "created_by", "created_at"),
+    )
+
+
+# ================= CHANGE OUTBOX =================
+# One row per Sale / Expense / SBU / User change, written in the same
+# transaction as the change and served in seq order by GET /admin/changes
+class ChangeEvent(Base):
+    __tablename__ = "change_events"
+
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)      # sale / expense / sbu / user
+    entity_id = Column(UUIDKey, nullable=False)
+    op = Column(String(10), nullable=False)          # insert / update / delete
+    sbu_id = Column(UUIDKey)
+    payload = Column(Text, nullable=False)
+    previous = Column(Text)                          # updates: old values of the changed columns
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_change_events_entity_seq", "entity", "entity_id", "seq"),
+    )
+
+
+# Single row (id 1) holding the last allocated ChangeEvent.seq. Writers
+# lock it from allocation until commit, so seqs commit in order.
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(BigInteger().with_variant(Integer, "sqlite"), nullable=False)
+
+
+# ================= EDGE SYNC =================
+# How far an edge install (edge.py) has pushed its own changes upstream
+# and pulled head-office changes down
+class SyncWatermark(Base):
+    __tablename__ = "sync_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(String(64), nullable=False)
+
+
+# ================= ARCHIVE =================
+# Closed fiscal years are moved here by archive.py; same columns as the
+# live tables, compressed and without foreign keys.
+class SaleArchive(Base):
+    __tablename__ = "sales_archive"
+
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, nullable=False)
+    amount = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    notes = Column(Text)
+    is_cancelled = Column(Boolean, default=False)
+    created_by = Column(UUIDKey)
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_sales_archive_sbu_date", "sbu_id", "date"),
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+
+class ExpenseArchive(Base):
+    __tablename__ = "expenses_archive"
+
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, nullable=False)
+    category = Column(String(50), nullable=False)
+    amount = Column(Integer, nullable=False)
+    effective_from = Column(Date, nullable=False)
+    notes = Column(Text)
+    is_cancelled = Column(Boolean, default=False)
+    created_by = Column(UUIDKey)
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_expenses_archive_sbu_effective_from", "sbu_id", "effective_from"),
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+
+class AuditLogArchive(Base):
+    __tablename__ = "audit_logs_archive"
+
+    id = Column(UUIDKey, primary_key=True)
+    user_id = Column(UUIDKey)
+    action = Column(String(255), nullable=False)
+    entity = Column(String(50))
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+
+class ArchiveWatermark(Base):
+    __tablename__ = "archive_watermarks"
+
+    table_name = Column(String(50), primary_key=True)
+    archived_before = Column(Date, nullable=False)
+
+
+# ================= BUDGET ALERTS =================
+class AlertThreshold(Base):
+    __tablename__ = "alert_thresholds"
+
+    sbu_id = Column(UUIDKey, primary_key=True)
+    excellent_percent = Column(Integer, nullable=False, default=100)
+    warning_percent = Column(Integer, nullable=False, default=80)
+
+
+class BudgetAlert(Base):
+    __tablename__ = "budget_alerts"
+
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, nullable=False)
+    alert_date = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False)
+    performance_percent = Column(Float, nullable=False)
+    sales = Column(Integer, nullable=False)
+    expenses = Column(Integer, nullable=False)
+    daily_budget = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_budget_alerts_sbu_date", "sbu_id", "alert_date", unique=True),
+        Index("ix_budget_alerts_date_status", "alert_date", "status"),
+    )
+
+
+# ================= REPORT SNAPSHOT =================
+class ReportSnapshot(Base):
+    __tablename__ = "report_snapshots"
+
+    id = Column(UUIDKey, primary_key=True)
+    sbu_id = Column(UUIDKey, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    total_sales = Column(Integer, nullable=False)
+    variable_expenses = Column(Integer, nullable=False)
+    staff_breakdown = Column(Text, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_report_snapshots_range", "sbu_id", "start_date", "end_date", unique=True),
+    )
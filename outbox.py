@@ -0,0 +1,299 @@
+"""
+Transactional outbox and change feed.
+
+Every flush that inserts, updates or deletes a Sale, Expense, SBU or User
+stages a change event, and the events are written to change_events in
+the same transaction right before it commits, so an event exists exactly
+when its change committed. Update events also carry the old values of
+the changed columns (`previous`). Bulk Core inserts bypass the ORM and
+call record() themselves (see provisioning.py). The listeners are
+registered on import: any process that writes these models must import
+this module. Sessions flagged with info["replicated"] (rows copied from
+another database by edge.py) are not recorded.
+
+Seqs come from the change_sequence row, which the committing transaction
+keeps locked until its commit, so the next writer only gets its seqs once
+the previous one is visible: seq order is commit order and the feed has
+no gaps to wait out.
+
+GET /admin/changes?since=<cursor> returns events after the cursor in seq
+order and long-polls while there are none.
+
+Compaction keeps the feed proportional to recent changes: past
+OUTBOX_COMPACT_AFTER_HOURS only each entity's latest event is kept, and
+delete events go after OUTBOX_TOMBSTONE_DAYS. A consumer replaying from
+any cursor still ends up with every entity's latest state.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, exists, func, insert, select, delete, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from bus import bus
+from database import after_commit
+from models import Sale, Expense, SBU, User, ChangeEvent, ChangeSequence
+from periodic import run_every
+
+# ================= CONFIG =================
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_COMPACT_AFTER_HOURS = int(os.getenv("OUTBOX_COMPACT_AFTER_HOURS", "24"))
+OUTBOX_TOMBSTONE_DAYS = int(os.getenv("OUTBOX_TOMBSTONE_DAYS", "30"))
+OUTBOX_COMPACT_SECONDS = int(os.getenv("OUTBOX_COMPACT_SECONDS", "3600"))
+COMPACT_BATCH_SIZE = 1000
+OUTBOX_CHANNEL = "changes"
+
+ENTITIES = {Sale: "sale", Expense: "expense", SBU: "sbu", User: "user"}
+# Never leaves the database
+EXCLUDED_FIELDS = {"password_hash"}
+
+
+# ================= RECORDING =================
+def _sbu_id(entity: str, data: dict) -> str | None:
+    return data.get("id") if entity == "sbu" else data.get("sbu_id")
+
+
+def _row(entity: str, op: str, data: dict, previous: dict | None = None) -> dict:
+    data = {k: v for k, v in data.items() if k not in EXCLUDED_FIELDS}
+    if previous is not None:
+        previous = {k: v for k, v in previous.items() if k not in EXCLUDED_FIELDS}
+    return {
+        "entity": entity,
+        "entity_id": data["id"],
+        "op": op,
+        "sbu_id": _sbu_id(entity, data),
+        "payload": orjson.dumps(data).decode(),
+        "previous": orjson.dumps(previous).decode() if previous is not None else None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _snapshot(obj) -> dict:
+    # Loaded column values only: reading an expired attribute here would
+    # cost a SELECT per row (server defaults such as created_at)
+    state = inspect(obj)
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _previous(obj) -> dict:
+    # Attribute history is still intact in after_flush
+    state = inspect(obj)
+    previous = {}
+    for attr in state.mapper.column_attrs:
+        deleted = state.attrs[attr.key].history.deleted
+        if deleted:
+            previous[attr.key] = deleted[0]
+    return previous
+
+
+def _notify_on_commit(db: Session):
+    if not db.info.get("outbox_notify"):
+        db.info["outbox_notify"] = True
+
+        def notify():
+            db.info.pop("outbox_notify", None)
+            bus.publish(OUTBOX_CHANNEL)
+
+        after_commit(db, notify)
+
+
+def _stage(session: Session, rows: list[dict]):
+    session.info.setdefault("outbox_rows", []).extend(rows)
+    _notify_on_commit(session)
+
+
+def record(db: Session, entity: str, op: str, rows: list[dict]):
+    """Write events for changes made outside the ORM (bulk inserts); same transaction."""
+    if rows:
+        _stage(db, [_row(entity, op, r) for r in rows])
+
+
+@event.listens_for(Session, "after_flush")
+def _capture(session: Session, flush_context):
+    if session.info.get("replicated"):
+        return
+
+    rows = []
+    for obj in session.new:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            rows.append(_row(entity, "insert", _snapshot(obj)))
+    for obj in session.dirty:
+        entity = ENTITIES.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            rows.append(_row(entity, "update", _snapshot(obj), _previous(obj)))
+    for obj in session.deleted:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            rows.append(_row(entity, "delete", _snapshot(obj)))
+
+    if rows:
+        _stage(session, rows)
+
+
+def _allocate(conn, count: int) -> int:
+    """First of `count` new seqs; the counter row stays locked until commit."""
+    bump = (
+        update(ChangeSequence)
+        .where(ChangeSequence.id == 1)
+        .values(last_seq=ChangeSequence.last_seq + count)
+    )
+    if not conn.execute(bump).rowcount:
+        # First event on this database: continue after any existing ones
+        last = conn.execute(select(func.coalesce(func.max(ChangeEvent.seq), 0))).scalar()
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(ChangeSequence).values(id=1, last_seq=last + count))
+        except IntegrityError:
+            # Created concurrently
+            conn.execute(bump)
+
+    last = conn.execute(select(ChangeSequence.last_seq).where(ChangeSequence.id == 1)).scalar()
+    return last - count + 1
+
+
+@event.listens_for(Session, "before_commit")
+def _write(session: Session):
+    session.info.pop("outbox_seq", None)
+    # Changes still pending are flushed after this hook; stage them now
+    session.flush()
+    rows = session.info.pop("outbox_rows", None)
+    if not rows:
+        return
+
+    conn = session.connection()
+    first = _allocate(conn, len(rows))
+    for i, row in enumerate(rows):
+        row["seq"] = first + i
+    conn.execute(insert(ChangeEvent.__table__), rows)
+    session.info["outbox_seq"] = first + len(rows) - 1
+
+
+def committed_seq(db: Session) -> int | None:
+    """Last seq written by the session's latest commit (for after-commit hooks)."""
+    return db.info.get("outbox_seq")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session):
+    session.info.pop("outbox_rows", None)
+
+
+# ================= FEED =================
+def read(db: Session, since: int, limit: int) -> list[ChangeEvent]:
+    """Committed events after `since`, in seq order."""
+    return (
+        db.query(ChangeEvent)
+        .filter(ChangeEvent.seq > since)
+        .order_by(ChangeEvent.seq)
+        .limit(limit)
+        .all()
+    )
+
+
+def _read_and_release(db: Session, since: int, limit: int) -> list[ChangeEvent]:
+    try:
+        return read(db, since, limit)
+    finally:
+        # Give the connection back while the caller waits
+        db.close()
+
+
+# Bumped by local and bus-delivered commit notices; wakes waiting polls early
+_version = 0
+
+
+def _on_change(payload: str = ""):
+    global _version
+    _version += 1
+
+
+bus.subscribe(OUTBOX_CHANNEL, _on_change)
+
+
+async def wait_for_changes(db: Session, since: int, limit: int, wait: float) -> list[ChangeEvent]:
+    """read(), waiting up to `wait` seconds for the first event."""
+    deadline = time.monotonic() + wait
+    while True:
+        seen = _version
+        events = await run_in_threadpool(_read_and_release, db, since, limit)
+        if events or time.monotonic() >= deadline:
+            return events
+
+        # Other hosts do not share the bus, so re-read periodically regardless
+        next_read = min(deadline, time.monotonic() + OUTBOX_POLL_SECONDS)
+        while _version == seen and time.monotonic() < next_read:
+            await asyncio.sleep(0.05)
+
+
+def event_view(e: ChangeEvent) -> dict:
+    return {
+        "seq": e.seq,
+        "entity": e.entity,
+        "id": e.entity_id,
+        "op": e.op,
+        "sbu_id": e.sbu_id,
+        "at": e.created_at,
+        "data": orjson.loads(e.payload),
+        "previous": orjson.loads(e.previous) if e.previous else None,
+    }
+
+
+# ================= COMPACTION =================
+def compact(db: Session, through_seq: int | None = None) -> int:
+    """
+    Drop superseded events past the compaction horizon and expired
+    tombstones. `through_seq` protects everything after it (events an
+    edge install has not pushed yet).
+    """
+    now = datetime.utcnow()
+    horizon = now - timedelta(hours=OUTBOX_COMPACT_AFTER_HOURS)
+    later = aliased(ChangeEvent)
+
+    superseded = (
+        select(ChangeEvent.seq)
+        .where(
+            ChangeEvent.created_at < horizon,
+            exists().where(
+                later.entity == ChangeEvent.entity,
+                later.entity_id == ChangeEvent.entity_id,
+                later.seq > ChangeEvent.seq
+            )
+        )
+        .limit(COMPACT_BATCH_SIZE)
+    )
+    tombstones = (
+        select(ChangeEvent.seq)
+        .where(ChangeEvent.op == "delete", ChangeEvent.created_at < now - timedelta(days=OUTBOX_TOMBSTONE_DAYS))
+        .limit(COMPACT_BATCH_SIZE)
+    )
+
+    if through_seq is not None:
+        superseded = superseded.where(ChangeEvent.seq <= through_seq)
+        tombstones = tombstones.where(ChangeEvent.seq <= through_seq)
+
+    removed = 0
+    for query in (superseded, tombstones):
+        # Small batches keep row locks short; MySQL cannot delete from a
+        # table it selects from in a subquery anyway
+        while True:
+            seqs = db.execute(query).scalars().all()
+            if not seqs:
+                break
+            db.execute(delete(ChangeEvent).where(ChangeEvent.seq.in_(seqs)))
+            db.commit()
+            removed += len(seqs)
+    return removed
+
+
+def compact_loop():
+    return run_every(OUTBOX_COMPACT_SECONDS, compact, "Outbox compaction")
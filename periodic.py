@@ -0,0 +1,30 @@
+"""
+Periodic database maintenance run inside each app worker.
+
+run_every() sleeps, runs the task with a fresh session in the threadpool,
+and logs failures without stopping the loop. Tasks commit themselves.
+"""
+import asyncio
+from typing import Any, Callable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+
+
+def _run_once(task: Callable[[Session], Any]):
+    db = SessionLocal()
+    try:
+        task(db)
+    finally:
+        db.close()
+
+
+async def run_every(seconds: float, task: Callable[[Session], Any], label: str):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await run_in_threadpool(_run_once, task)
+        except Exception as e:
+            print(f"{label} failed:", e)
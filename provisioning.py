@@ -0,0 +1,174 @@
+"""
+Bulk staff and SBU import.
+
+Rows arrive as CSV (header row) or a JSON array of objects, use the same
+fields as /admin/create-staff and /admin/create-sbu, and are loaded all
+or nothing: any invalid row rejects the whole import.
+"""
+import csv
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from auth import hash_password
+from database import after_commit, commit
+from keys import new_id
+from catalog import sbu_catalog
+from models import User, SBU, AuditLog
+import outbox
+from schemas import CreateStaffSchema, CreateSBUSchema
+
+# ================= CONFIG =================
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "10000"))
+INSERT_BATCH_SIZE = 1000
+
+
+class ImportRejected(Exception):
+    """An import was rejected; `errors` lists the offending rows."""
+
+    def __init__(self, errors: list[dict]):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+# ================= PARSING =================
+def parse_rows(body: bytes, content_type: str | None) -> list[dict]:
+    """Rows from a CSV or JSON request body."""
+    try:
+        if content_type and "csv" in content_type:
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            # Empty CSV cells mean "use the default", not an empty string
+            rows = [{k.strip(): v for k, v in row.items() if k and v not in (None, "")} for row in reader]
+        else:
+            rows = orjson.loads(body)
+    except (UnicodeDecodeError, csv.Error, orjson.JSONDecodeError) as e:
+        raise ImportRejected([{"row": None, "error": f"Unreadable import file: {e}"}])
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ImportRejected([{"row": None, "error": "Expected a JSON array of objects"}])
+
+    if not rows:
+        raise ImportRejected([{"row": None, "error": "No rows to import"}])
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ImportRejected([{"row": None, "error": f"At most {MAX_IMPORT_ROWS} rows per import"}])
+    return rows
+
+
+def _validate(rows: list[dict], schema) -> list:
+    records, errors = [], []
+    for i, row in enumerate(rows, start=1):
+        try:
+            records.append(schema.model_validate(row))
+        except ValidationError as e:
+            errors.append({"row": i, "error": "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+            )})
+    if errors:
+        raise ImportRejected(errors)
+    return records
+
+
+# ================= HASHING =================
+def _hash_workers() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    # bcrypt releases the GIL, so threads hash on every core
+    with ThreadPoolExecutor(max_workers=_hash_workers()) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def _insert_batched(db: Session, model, values: list[dict]):
+    for i in range(0, len(values), INSERT_BATCH_SIZE):
+        batch = values[i:i + INSERT_BATCH_SIZE]
+        db.execute(insert(model), batch)
+        # Core inserts skip the flush listener; write their change events here
+        outbox.record(db, outbox.ENTITIES[model], "insert", batch)
+
+
+# ================= STAFF =================
+def import_staff(db: Session, rows: list[dict], actor: User) -> dict:
+    records = _validate(rows, CreateStaffSchema)
+
+    errors = []
+    seen = set()
+    for i, r in enumerate(records, start=1):
+        if r.username in seen:
+            errors.append({"row": i, "error": f"Duplicate username {r.username} in import"})
+        seen.add(r.username)
+
+    # One IN query for every username in the file
+    existing = {
+        username for (username,) in
+        db.query(User.username).filter(User.username.in_(seen))
+    }
+    sbu_ids = {r.sbu_id for r in records}
+    known_sbus = {sbu_id for (sbu_id,) in db.query(SBU.id).filter(SBU.id.in_(sbu_ids))}
+
+    for i, r in enumerate(records, start=1):
+        if r.username in existing:
+            errors.append({"row": i, "error": f"User {r.username} already exists"})
+        if r.sbu_id not in known_sbus:
+            errors.append({"row": i, "error": f"SBU {r.sbu_id} not found"})
+    if errors:
+        raise ImportRejected(errors)
+
+    hashes = hash_passwords([r.password for r in records])
+
+    _insert_batched(db, User, [
+        {
+            "id": new_id(),
+            "full_name": r.full_name,
+            "username": r.username,
+            "password_hash": password_hash,
+            "role": "staff",
+            "sbu_id": r.sbu_id,
+            "is_active": True,
+            "must_change_password": True
+        }
+        for r, password_hash in zip(records, hashes)
+    ])
+
+    db.add(AuditLog(
+        id=new_id(),
+        user_id=actor.id,
+        action=f"Imported {len(records)} staff into {len(sbu_ids)} SBUs",
+        entity="staff"
+    ))
+
+    commit(db)
+    return {"imported": len(records)}
+
+
+# ================= SBUS =================
+def import_sbus(db: Session, rows: list[dict], actor: User) -> dict:
+    records = _validate(rows, CreateSBUSchema)
+
+    values = [
+        {"id": new_id(), "is_active": True, **r.model_dump()}
+        for r in records
+    ]
+    _insert_batched(db, SBU, values)
+
+    db.add(AuditLog(
+        id=new_id(),
+        user_id=actor.id,
+        action=f"Imported {len(records)} SBUs",
+        entity="sbu"
+    ))
+
+    after_commit(db, lambda: sbu_catalog.bump(db))
+    commit(db)
+    return {
+        "imported": len(records),
+        "sbus": [{"id": v["id"], "name": v["name"]} for v in values]
+    }
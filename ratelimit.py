@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+from auth import SECRET_KEY, ALGORITHM
+
+# ================= CONFIG =================
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+# memory: per worker process; sqlite: shared by every worker on the host
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv(
+    "RATE_LIMIT_PATH",
+    os.path.join(tempfile.gettempdir(), "drphysiq_ratelimit.sqlite3")
+)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY") == "1"
+
+# "METHOD path" -> requests allowed per `per` seconds, bucket size, and
+# whether the bucket is per client IP or per bearer token (principal).
+# Override with RATE_LIMITS='{"POST /login": {"rate": 10, "per": 60, ...}}'
+DEFAULT_RULES = {
+    "POST /login": {"rate": 20, "per": 60, "burst": 20, "scope": "ip"},
+    "POST /token/refresh": {"rate": 30, "per": 60, "burst": 30, "scope": "ip"},
+    "GET /staff/my-sbu": {"rate": 1, "per": 2, "burst": 5, "scope": "principal"},
+    "POST /staff/change-password": {"rate": 5, "per": 300, "burst": 3, "scope": "principal"},
+}
+
+
+class RateRule:
+    __slots__ = ("rate", "burst", "scope")
+
+    def __init__(self, rate: float, per: float, burst: int, scope: str):
+        self.rate = rate / per          # tokens per second
+        self.burst = burst
+        self.scope = scope
+
+
+def _load_rules() -> dict[str, RateRule]:
+    rules = dict(DEFAULT_RULES)
+    rules.update(json.loads(os.getenv("RATE_LIMITS", "{}")))
+    return {route: RateRule(**rule) for route, rule in rules.items()}
+
+
+RULES = _load_rules()
+
+
+# ================= BACKENDS =================
+def _refill(tokens: float, updated: float, now: float, rule: RateRule) -> float:
+    return min(rule.burst, tokens + (now - updated) * rule.rate)
+
+
+MAX_MEMORY_BUCKETS = 50_000
+IDLE_BUCKET_SECONDS = 3600
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        # Idle buckets have refilled anyway; forgetting them changes nothing
+        self._buckets = {
+            key: state for key, state in self._buckets.items()
+            if now - state[1] < IDLE_BUCKET_SECONDS
+        }
+
+    def take(self, key: str, rule: RateRule) -> float:
+        """Consume one token; return 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > MAX_MEMORY_BUCKETS:
+                self._prune(now)
+            tokens, updated = self._buckets.get(key, (rule.burst, now))
+            tokens = _refill(tokens, updated, now, rule)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rule.rate
+
+
+class SQLiteBackend:
+    """Buckets in a local SQLite file so all workers share one budget."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rule: RateRule) -> float:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(*row, now, rule) if row else rule.burst
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0 if allowed else (1 - tokens) / rule.rate
+
+
+backend = SQLiteBackend(RATE_LIMIT_PATH) if RATE_LIMIT_BACKEND == "sqlite" else MemoryBackend()
+
+
+# ================= REQUEST CHECK =================
+def _client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _principal(request: Request) -> str:
+    # Keyed on the verified subject (an HMAC check, no DB lookup), so
+    # rotating made-up tokens does not buy a fresh bucket; anything that
+    # does not verify counts against the client IP
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.startswith("Bearer "):
+        from jose import JWTError, jwt
+        try:
+            subject = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return "u:" + str(subject)
+    return "ip:" + _client_ip(request)
+
+
+async def check(request: Request) -> int | None:
+    """Retry-After seconds if the request is over its limit, else None."""
+    if not RATE_LIMIT_ENABLED:
+        return None
+
+    route = f"{request.method} {request.url.path}"
+    rule = RULES.get(route)
+    if not rule:
+        return None
+
+    who = _client_ip(request) if rule.scope == "ip" else _principal(request)
+    if isinstance(backend, SQLiteBackend):
+        # BEGIN IMMEDIATE can wait on the file lock; keep it off the event loop
+        wait = await run_in_threadpool(backend.take, f"{route}|{who}", rule)
+    else:
+        wait = backend.take(f"{route}|{who}", rule)
+    return math.ceil(wait) if wait > 0 else None
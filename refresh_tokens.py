@@ -0,0 +1,102 @@
+"""
+Rotating refresh tokens.
+
+/login returns an opaque refresh token next to the access token, and
+POST /token/refresh trades it for a new pair: one indexed lookup and one
+JWT signature instead of a bcrypt verify. Tokens are stored as an
+HMAC-SHA256 keyed with REFRESH_TOKEN_KEY (default SECRET_KEY), which is
+enough for 256-bit random values and costs microseconds.
+
+Each refresh marks the presented token as rotated. Presenting a rotated
+token again means it was copied, so the whole family (every token
+descended from the same login) is revoked.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from auth import SECRET_KEY
+from database import commit
+from keys import new_id
+from models import RefreshToken, User
+from periodic import run_every
+
+# ================= CONFIG =================
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REFRESH_TOKEN_PURGE_SECONDS = int(os.getenv("REFRESH_TOKEN_PURGE_SECONDS", "3600"))
+REFRESH_TOKEN_KEY = os.getenv("REFRESH_TOKEN_KEY")
+
+
+def _hash(token: str) -> str:
+    key = (REFRESH_TOKEN_KEY or SECRET_KEY or "").encode()
+    return hmac.new(key, token.encode(), hashlib.sha256).hexdigest()
+
+
+# ================= ISSUE / ROTATE =================
+def issue(db: Session, user_id: str, family_id: str | None = None) -> str:
+    """Add a new refresh token for the user; committed with the caller's transaction."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=_hash(token),
+        user_id=user_id,
+        family_id=family_id or new_id(),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+
+def rotate(db: Session, token: str) -> tuple[User, str]:
+    """Consume a refresh token and return its user with a replacement token."""
+    now = datetime.utcnow()
+    record = db.get(RefreshToken, _hash(token))
+    if not record or record.expires_at < now:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    # Conditional update so two concurrent refreshes cannot both win
+    claimed = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == record.token_hash, RefreshToken.rotated_at.is_(None))
+        .values(rotated_at=now)
+    ).rowcount
+
+    if not claimed:
+        revoke_family(db, record.family_id)
+        commit(db)
+        raise HTTPException(status_code=401, detail="Refresh token reused; please log in again")
+
+    user = db.get(User, record.user_id)
+    if not user or not user.is_active:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    return user, issue(db, user.id, record.family_id)
+
+
+# ================= REVOCATION =================
+def revoke_family(db: Session, family_id: str):
+    db.query(RefreshToken).filter(RefreshToken.family_id == family_id).delete(synchronize_session=False)
+
+
+def revoke_all(db: Session, user_id: str):
+    """Drop every refresh token of a user (deactivation, deletion, password change)."""
+    db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete(synchronize_session=False)
+
+
+# ================= PURGE =================
+def purge_expired(db: Session) -> int:
+    deleted = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.expires_at < datetime.utcnow())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def purge_loop():
+    return run_every(REFRESH_TOKEN_PURGE_SECONDS, purge_expired, "Refresh token purge")
@@ -0,0 +1,175 @@
+from datetime import date, timedelta
+
+from sqlalchemy.orm import Session
+
+from aggregation import aggregate, totals
+from catalog import sbu_catalog
+from cube import report_cube, sales_of, expenses_of, M
+from fixed_costs import fixed_cost_index
+from models import EXPENSE_CATEGORIES
+
+
+# ================= PERIODS =================
+def period_range(period: str, report_date: date) -> tuple[date, date] | None:
+    """(start, end) of a daily / weekly / monthly report ending on report_date."""
+    if period == "daily":
+        return report_date, report_date
+    if period == "weekly":
+        return report_date - timedelta(days=6), report_date
+    if period == "monthly":
+        return report_date.replace(day=1), report_date
+    return None
+
+
+# ================= SBU MEASURES =================
+def sbu_measures(db: Session, sbu_id: str, start: date, end: date, with_staff: bool = True) -> dict:
+    """Sales, variable expenses and per-staff breakdown for one SBU and range."""
+    if not with_staff:
+        total_sales, variable_expenses = totals(aggregate(db, "sbu", sbu_id, start, end))
+        return {
+            "total_sales": total_sales,
+            "variable_expenses": variable_expenses,
+            "staff_breakdown": []
+        }
+
+    # One statement: per-creator totals plus zero rows for idle SBU members
+    rows = aggregate(db, "sbu", sbu_id, start, end, group_by="staff")
+    total_sales, variable_expenses = totals(rows)
+
+    return {
+        "total_sales": total_sales,
+        "variable_expenses": variable_expenses,
+        "staff_breakdown": [
+            {
+                "staff_id": r["key"],
+                "staff_name": r["staff_name"],
+                "total_sales": r["sales"],
+                "total_expenses": r["expenses"],
+                "net_profit": r["sales"] - r["expenses"]
+            }
+            for r in rows
+            if r["is_member"]
+        ]
+    }
+
+
+def staff_measures(db: Session, staff_id: str, start: date, end: date) -> dict:
+    """Sales and expenses recorded by one staff member in a range."""
+    total_sales, total_expenses = totals(aggregate(db, "staff", staff_id, start, end))
+    return {"total_sales": total_sales, "total_expenses": total_expenses}
+
+
+# ================= DASHBOARD MEASURES =================
+def dashboard_measures(db: Session, sbu_id: str, day: date) -> dict:
+    """One day's sales and per-category variable expenses for an SBU."""
+    cached = report_cube.totals(sbu_id, day, day)
+    if cached is not None:
+        return {
+            "sales_today": sales_of(cached),
+            "variable_costs": {c: int(cached[M[c]]) for c in EXPENSE_CATEGORIES}
+        }
+
+    rows = aggregate(db, "sbu", sbu_id, day, day, group_by="category")
+
+    variable_costs = dict.fromkeys(EXPENSE_CATEGORIES, 0)
+    sales_today = 0
+
+    # Sales carry no category, so they land in the NULL group
+    for r in rows:
+        if r["key"] is None:
+            sales_today += r["sales"]
+        else:
+            variable_costs[r["key"]] = r["expenses"]
+
+    return {
+        "sales_today": sales_today,
+        "variable_costs": variable_costs
+    }
+
+
+# ================= DEPARTMENT ROLLUPS =================
+ROLLUP_DEPTHS = ("department", "sbu", "staff")
+
+
+def _level(total_sales: int, variable_expenses: int, fixed_expenses: int, budget: int) -> dict:
+    total_expenses = fixed_expenses + variable_expenses
+    return {
+        "total_sales": total_sales,
+        "fixed_expenses": fixed_expenses,
+        "variable_expenses": variable_expenses,
+        "total_expenses": total_expenses,
+        "net_profit": total_sales - total_expenses,
+        "budget": budget,
+        "performance_percent": round(total_sales / budget * 100, 2) if budget > 0 else 0
+    }
+
+
+def rollup(db: Session, start: date, end: date, depth: str = "sbu") -> dict:
+    """
+    Company -> department -> SBU (-> staff) totals for active SBUs.
+
+    Every level is summed from one grouped query, or from the cube when
+    it covers the range and no staff level is asked for. Fixed costs come
+    from each SBU's schedule over the range and budgets are daily_budget
+    times the days; both are summed upwards.
+    """
+    days = (end - start).days + 1
+    sbus = sorted((s for s in sbu_catalog.all(db) if s.is_active), key=lambda s: (s.department, s.name))
+
+    per_sbu: dict[str, list[int]] = {s.id: [0, 0] for s in sbus}
+    per_staff: dict[str, list[dict]] = {s.id: [] for s in sbus}
+
+    if depth == "staff":
+        for r in aggregate(db, "portfolio", None, start, end, group_by="sbu_staff"):
+            if r["sbu_id"] not in per_sbu:
+                continue
+            per_sbu[r["sbu_id"]][0] += r["sales"]
+            per_sbu[r["sbu_id"]][1] += r["expenses"]
+            per_staff[r["sbu_id"]].append({
+                "staff_id": r["key"],
+                "staff_name": r["staff_name"] or "Unassigned",
+                "total_sales": r["sales"],
+                "total_expenses": r["expenses"],
+                "net_profit": r["sales"] - r["expenses"]
+            })
+    else:
+        cached = report_cube.portfolio(start, end)
+        if cached is not None:
+            sums = {sbu_id: (sales_of(v), expenses_of(v)) for sbu_id, v in cached.items()}
+        else:
+            sums = {r["key"]: (r["sales"], r["expenses"]) for r in aggregate(db, "portfolio", None, start, end, group_by="sbu")}
+        for sbu_id, (sales, expenses) in sums.items():
+            if sbu_id in per_sbu:
+                per_sbu[sbu_id] = [sales, expenses]
+
+    departments = []
+    company = [0, 0, 0, 0]   # sales, variable, fixed, budget
+    for department in dict.fromkeys(s.department for s in sbus):
+        members = [s for s in sbus if s.department == department]
+        dept = [0, 0, 0, 0]
+        children = []
+        for sbu in members:
+            sales, expenses = per_sbu[sbu.id]
+            fixed = fixed_cost_index.total(db, sbu, start, end)
+            budget = (sbu.daily_budget or 0) * days
+            for i, value in enumerate((sales, expenses, fixed, budget)):
+                dept[i] += value
+            if depth != "department":
+                node = {"sbu_id": sbu.id, "sbu_name": sbu.name, **_level(sales, expenses, fixed, budget)}
+                if depth == "staff":
+                    node["staff"] = sorted(per_staff[sbu.id], key=lambda r: -r["total_sales"])
+                children.append(node)
+
+        for i, value in enumerate(dept):
+            company[i] += value
+        node = {"department": department, "sbu_count": len(members), **_level(*dept)}
+        if depth != "department":
+            node["sbus"] = children
+        departments.append(node)
+
+    return {
+        "date_range": {"from": start, "to": end},
+        "days": days,
+        **_level(*company),
+        "departments": departments
+    }
@@ -0,0 +1,51 @@
+from decimal import Decimal
+from typing import Any, Type
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+
+# ================= ENCODING =================
+def _default(obj: Any):
+    # MySQL returns SUM() over integer columns as Decimal
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_NON_STR_KEYS
+    )
+
+
+# ================= RESPONSES =================
+class FastJSONResponse(JSONResponse):
+    """
+    App-wide default response class.
+
+    Returning an instance directly from a handler skips FastAPI's
+    jsonable_encoder pass entirely; plain dicts still go through it
+    but are rendered with orjson instead of the stdlib encoder.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_response(model: Type[BaseModel], data: Any) -> Response:
+    """
+    Validate `data` against a response model once and serialize it
+    straight to bytes with pydantic-core.
+    """
+    obj = model.model_validate(data)
+    return Response(
+        content=obj.__pydantic_serializer__.to_json(obj),
+        media_type="application/json"
+    )
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import date
-from typing import Optional, Dict, List, Literal
+from typing import Any, Optional, Dict, List, Literal
 
 
 
@@ -10,6 +10,10 @@ class LoginSchema(BaseModel):
     password: str
 
 
+class RefreshTokenSchema(BaseModel):
+    refresh_token: str
+
+
 # ================= USER =================
 class CreateStaffSchema(BaseModel):
     full_name: str
@@ -29,6 +33,38 @@ class CreateSBUSchema(BaseModel):
     description: Optional[str] = None
 
 
+class UpdateSBUSchema(BaseModel):
+    name: Optional[str] = None
+    department: Optional[str] = None
+    daily_budget: Optional[int] = None
+    personnel_cost: Optional[int] = None
+    rent: Optional[int] = None
+    electricity: Optional[int] = None
+    description: Optional[str] = None
+    is_active: Optional[bool] = None
+
+    # Fields may be left out, but not sent as null onto NOT NULL columns
+    @field_validator(
+        "name", "department", "daily_budget", "personnel_cost", "rent", "electricity", "is_active"
+    )
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+
+class FixedCostChangeSchema(BaseModel):
+    cost_type: Literal["personnel_cost", "rent", "electricity"]
+    amount: int = Field(..., ge=0, description="Daily amount")
+    valid_from: date
+
+
+class AlertThresholdSchema(BaseModel):
+    excellent_percent: int = Field(100, gt=0)
+    warning_percent: int = Field(80, ge=0)
+
+
 # ================= SALES =================
 class SaleCreateSchema(BaseModel):
     amount: int = Field(..., gt=0, description="Sale amount")
@@ -133,3 +169,62 @@ class CreateAdminSchema(BaseModel):
     role: Literal["ops_admin", "accountant_admin"]
 
 
+# ================= JOBS =================
+class JobCreateSchema(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+
+
+class SBUReportRangeJobParams(BaseModel):
+    sbu_id: str
+    start_date: date
+    end_date: date
+
+
+class TransactionsExportJobParams(BaseModel):
+    sbu_id: Optional[str] = None
+    start_date: date
+    end_date: date
+
+
+class SnapshotRebuildJobParams(BaseModel):
+    start_date: date
+    end_date: date
+
+
+# ================= EDGE =================
+# Strict: a batch is checked as sent, not coerced
+class EdgeSaleSchema(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    seq: int
+    id: str
+    date: date
+    amount: int = Field(..., ge=0)
+    notes: Optional[str]
+    created_by: Optional[str]
+    is_cancelled: bool
+
+
+class EdgeExpenseSchema(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    seq: int
+    id: str
+    date: date
+    category: str
+    # Per-event delta: an edit that lowers an entry sends a negative amount
+    amount: int
+    notes: Optional[str]
+    created_by: Optional[str]
+    cancelled: bool
+
+
+class EdgeBatchSchema(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    install: str = Field(..., max_length=45)
+    through: int
+    sales: List[EdgeSaleSchema] = []
+    expenses: List[EdgeExpenseSchema] = []
+    audit_logs: List[Dict[str, Any]] = []
@@ -0,0 +1,71 @@
+"""
+Multi-worker launcher.
+
+    python serve.py                  # one worker per available core
+    WEB_WORKERS=4 python serve.py    # explicit worker count
+
+The app is imported once in the master and forked into the workers
+(preload), so every worker shares the imported modules copy-on-write.
+In-process caches stay coherent through the event bus in bus.py.
+"""
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+def available_cores() -> int:
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    # Containers: honour the cgroup v2 CPU quota
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+
+    return cores
+
+
+def post_fork(server, worker):
+    # Never share pooled DB sockets inherited from the master
+    import database
+    for engine in database.engines():
+        engine.dispose(close=False)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+
+def main():
+    host = os.getenv("HOST", "0.0.0.0")
+    port = os.getenv("PORT", "8000")
+    workers = int(os.getenv("WEB_WORKERS", "0")) or available_cores()
+
+    Server({
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "post_fork": post_fork,
+        "timeout": int(os.getenv("WEB_TIMEOUT", "120")),
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+from typing import Any, Callable, Hashable
+
+from deadlines import QueryCancelled, QueryDeadlineExceeded
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical computations into one.
+
+    The first caller for a key runs `fn`; callers arriving while it is
+    in flight block and receive the same result (or exception). Nothing
+    is cached once the call finishes. Results are shared between
+    callers and must be treated as read-only.
+
+    Exceptions of a `local_errors` type belong to the leader's own
+    request (its client left, its deadline ran out): waiting callers do
+    not receive them but run the call again, one of them as the new
+    leader.
+    """
+
+    def __init__(self, local_errors: tuple[type[BaseException], ...] = ()):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._local_errors = local_errors
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+
+            if leader:
+                break
+
+            call.done.wait()
+            if call.error is None:
+                return call.result
+            if not isinstance(call.error, self._local_errors):
+                raise call.error
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+report_flight = SingleFlight(local_errors=(QueryCancelled, QueryDeadlineExceeded))
@@ -0,0 +1,233 @@
+"""
+Precomputed SBU report snapshots.
+
+After a day closes, the daily, weekly and monthly windows ending on it
+are computed once per active SBU and stored in report_snapshots. Report
+endpoints serve those windows from the store once closed; other ranges
+and the current open day are computed live.
+
+A write to a closed day marks the snapshots covering it stale by bumping
+their version. A compute claims its row and reads the version first, and
+only stores if the version is unchanged, so a result computed from data
+that changed underneath it is never kept.
+
+    python snapshots.py                    # precompute for yesterday (cron target)
+    python snapshots.py --date 2026-01-31  # precompute for a given closed day
+
+Set REPORT_SCHEDULER=1 to run the same job in-process instead; use one
+or the other, and with several workers prefer cron.
+"""
+import argparse
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from catalog import sbu_catalog
+from cube import report_cube, sales_of, expenses_of
+from database import SessionLocal, after_commit
+from keys import new_id
+from models import ReportSnapshot
+from reports import period_range, sbu_measures
+
+# ================= CONFIG =================
+REPORT_SCHEDULER = os.getenv("REPORT_SCHEDULER") == "1"
+REPORT_CLOSE_TIME = time.fromisoformat(os.getenv("REPORT_CLOSE_TIME", "00:05"))
+PERIODS = ("daily", "weekly", "monthly")
+
+
+# ================= STORE =================
+def _to_measures(snapshot: ReportSnapshot) -> dict:
+    return {
+        "total_sales": snapshot.total_sales,
+        "variable_expenses": snapshot.variable_expenses,
+        "staff_breakdown": orjson.loads(snapshot.staff_breakdown)
+    }
+
+
+def _window(db: Session, sbu_id: str, start: date, end: date):
+    return db.query(ReportSnapshot).filter(
+        ReportSnapshot.sbu_id == sbu_id,
+        ReportSnapshot.start_date == start,
+        ReportSnapshot.end_date == end
+    )
+
+
+def canonical(start: date, end: date) -> bool:
+    """Whether start..end is one of the PERIODS windows; only those are stored."""
+    return any(period_range(period, end) == (start, end) for period in PERIODS)
+
+
+def lookup(db: Session, sbu_id: str, start: date, end: date) -> dict | None:
+    snapshot = _window(db, sbu_id, start, end).first()
+    return _to_measures(snapshot) if snapshot and snapshot.computed_at else None
+
+
+def claim(db: Session, sbu_id: str, start: date, end: date) -> int:
+    """
+    Version of a window's snapshot row, creating an empty one first, so
+    an invalidation that lands while the caller computes always has a
+    row to bump. Read it before computing and pass it to store().
+    """
+    snapshot = _window(db, sbu_id, start, end).first()
+    if snapshot is None:
+        try:
+            db.add(ReportSnapshot(
+                id=new_id(),
+                sbu_id=sbu_id,
+                start_date=start,
+                end_date=end,
+                version=1,
+                total_sales=0,
+                variable_expenses=0,
+                staff_breakdown="[]",
+                computed_at=None
+            ))
+            db.commit()
+        except IntegrityError:
+            # Claimed concurrently by another request
+            db.rollback()
+        snapshot = _window(db, sbu_id, start, end).first()
+    return snapshot.version
+
+
+def store(db: Session, sbu_id: str, start: date, end: date, measures: dict, version: int) -> bool:
+    """Fill a claimed snapshot, unless it was invalidated after `version` was read."""
+    updated = (
+        _window(db, sbu_id, start, end)
+        .filter(ReportSnapshot.version == version)
+        .update({
+            "version": ReportSnapshot.version + 1,
+            "total_sales": measures["total_sales"],
+            "variable_expenses": measures["variable_expenses"],
+            "staff_breakdown": orjson.dumps(measures["staff_breakdown"]).decode(),
+            "computed_at": datetime.utcnow()
+        }, synchronize_session=False)
+    )
+    return updated == 1
+
+
+def _mark_stale(db: Session, sbu_id: str, day: date):
+    (
+        db.query(ReportSnapshot)
+        .filter(
+            ReportSnapshot.sbu_id == sbu_id,
+            ReportSnapshot.start_date <= day,
+            ReportSnapshot.end_date >= day
+        )
+        .update({"version": ReportSnapshot.version + 1, "computed_at": None}, synchronize_session=False)
+    )
+
+
+def invalidate(db: Session, sbu_id: str | None, day: date):
+    """Mark snapshots covering a day that was written after it closed as stale."""
+    if not sbu_id or day >= date.today():
+        return
+
+    _mark_stale(db, sbu_id, day)
+
+    def after():
+        # A compute that read the data before this commit may have stored
+        # since the mark above; its claimed row exists by now, so this
+        # bump stales its result or fails its store()
+        _mark_stale(db, sbu_id, day)
+        db.commit()
+
+    after_commit(db, after)
+
+
+def compute(db: Session, sbu_id: str, start: date, end: date) -> dict:
+    """Compute a closed canonical window and store it unless invalidated meanwhile."""
+    version = claim(db, sbu_id, start, end)
+    result = sbu_measures(db, sbu_id, start, end)
+    if store(db, sbu_id, start, end, result, version):
+        db.commit()
+    else:
+        db.rollback()
+    return result
+
+
+def measures(db: Session, sbu_id: str, start: date, end: date, with_staff: bool = True) -> dict:
+    """
+    Report measures for a range: from the in-memory cube when it covers
+    the range and no staff breakdown is needed, else from the snapshot
+    store for closed daily/weekly/monthly windows (computing and storing
+    on a staff-breakdown miss), live otherwise.
+    """
+    if not with_staff:
+        # Recent ranges without a staff breakdown are array slices
+        totals = report_cube.totals(sbu_id, start, end)
+        if totals is not None:
+            return {
+                "total_sales": sales_of(totals),
+                "variable_expenses": expenses_of(totals),
+                "staff_breakdown": []
+            }
+
+    if end >= date.today() or not canonical(start, end):
+        return sbu_measures(db, sbu_id, start, end, with_staff)
+
+    cached = lookup(db, sbu_id, start, end)
+    if cached:
+        return cached
+
+    if not with_staff:
+        # A snapshot needs the breakdown; totals alone are cheap enough live
+        return sbu_measures(db, sbu_id, start, end, with_staff=False)
+
+    return compute(db, sbu_id, start, end)
+
+
+# ================= PRECOMPUTE =================
+def precompute(db: Session, day: date) -> int:
+    """Compute every period window ending on `day` for all active SBUs."""
+    count = 0
+    for sbu in sbu_catalog.all(db):
+        if not sbu.is_active:
+            continue
+        for period in PERIODS:
+            start, end = period_range(period, day)
+            compute(db, sbu.id, start, end)
+            count += 1
+    return count
+
+
+def _precompute_closed_day():
+    db = SessionLocal()
+    try:
+        precompute(db, date.today() - timedelta(days=1))
+    finally:
+        db.close()
+
+
+async def scheduler_loop():
+    while True:
+        now = datetime.now()
+        run_at = datetime.combine(now.date(), REPORT_CLOSE_TIME)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        await asyncio.sleep((run_at - now).total_seconds())
+
+        try:
+            await run_in_threadpool(_precompute_closed_day)
+        except Exception as e:
+            print("Report precompute failed:", e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute SBU report snapshots")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today() - timedelta(days=1))
+    args = parser.parse_args()
+
+    if args.date >= date.today():
+        raise SystemExit("Only closed days can be precomputed")
+
+    db = SessionLocal()
+    try:
+        print(f"Stored {precompute(db, args.date)} snapshots for {args.date}")
+    finally:
+        db.close()
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time
+_tmp = tempfile.mkdtemp(prefix="drphysiq-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("APP_BUS_PATH", os.path.join(_tmp, "bus.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402  (registers the tables)
+from database import Base, SessionLocal, get_engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    engine = get_engine()
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
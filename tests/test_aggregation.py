@@ -0,0 +1,224 @@
+"""
+aggregate() against the per-endpoint SUM queries it replaced.
+
+Each reference query below is the shape the report endpoints ran before
+the aggregation engine: one SUM per measure, filtered on scope, date
+range and is_cancelled.
+"""
+import random
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func
+
+from aggregation import aggregate, totals
+from keys import new_id
+from models import SBU, User, Sale, Expense, EXPENSE_CATEGORIES
+from reports import dashboard_measures, sbu_measures, staff_measures
+
+START = date(2026, 3, 1)
+DAYS = 40
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def seeded(db):
+    """Two SBUs with random sales and expenses, some cancelled, and one idle member."""
+    rng = random.Random(38)
+    sbus = [
+        SBU(id=new_id(), name=f"SBU {i}", department="Clinic", daily_budget=1000)
+        for i in range(2)
+    ]
+    db.add_all(sbus)
+    db.flush()
+
+    staff = {}
+    for sbu in sbus:
+        staff[sbu.id] = [
+            User(
+                id=new_id(),
+                full_name=f"{sbu.name} staff {j}",
+                username=f"{sbu.id}-{j}",
+                password_hash="x",
+                role="staff",
+                sbu_id=sbu.id
+            )
+            for j in range(3)
+        ]
+        db.add_all(staff[sbu.id])
+    db.flush()
+
+    for sbu in sbus:
+        # The last member never records anything
+        active = staff[sbu.id][:-1]
+        for _ in range(120):
+            day = START + timedelta(days=rng.randrange(DAYS))
+            db.add(Sale(
+                id=new_id(),
+                sbu_id=sbu.id,
+                amount=rng.randrange(1, 5000),
+                date=day,
+                is_cancelled=rng.random() < 0.2,
+                created_by=rng.choice(active).id
+            ))
+            db.add(Expense(
+                id=new_id(),
+                sbu_id=sbu.id,
+                category=rng.choice(EXPENSE_CATEGORIES),
+                amount=rng.randrange(1, 2000),
+                effective_from=day,
+                is_cancelled=rng.random() < 0.2,
+                created_by=rng.choice(active).id
+            ))
+    db.commit()
+    return sbus, staff
+
+
+RANGES = [
+    (START, START),
+    (START + timedelta(days=3), START + timedelta(days=9)),
+    (START, START + timedelta(days=DAYS - 1)),
+    # Past the seeded data on both ends
+    (START - timedelta(days=10), START + timedelta(days=DAYS + 10)),
+]
+
+
+# ================= REFERENCE QUERIES =================
+def _sales_sum(db, start, end, *filters):
+    return int(
+        db.query(func.coalesce(func.sum(Sale.amount), 0))
+        .filter(Sale.date.between(start, end), Sale.is_cancelled == False, *filters)
+        .scalar()
+    )
+
+
+def _expenses_sum(db, start, end, *filters):
+    return int(
+        db.query(func.coalesce(func.sum(Expense.amount), 0))
+        .filter(Expense.effective_from.between(start, end), Expense.is_cancelled == False, *filters)
+        .scalar()
+    )
+
+
+# ================= TESTS =================
+@pytest.mark.parametrize("start,end", RANGES)
+def test_sbu_totals_match_sum_queries(db, seeded, start, end):
+    sbus, _ = seeded
+    for sbu in sbus:
+        assert totals(aggregate(db, "sbu", sbu.id, start, end)) == (
+            _sales_sum(db, start, end, Sale.sbu_id == sbu.id),
+            _expenses_sum(db, start, end, Expense.sbu_id == sbu.id),
+        )
+
+
+@pytest.mark.parametrize("start,end", RANGES)
+def test_staff_breakdown_matches_sum_queries(db, seeded, start, end):
+    sbus, staff = seeded
+    for sbu in sbus:
+        measures = sbu_measures(db, sbu.id, start, end)
+        breakdown = {s["staff_id"]: s for s in measures["staff_breakdown"]}
+
+        # Every member is listed, including the one with no rows at all
+        assert set(breakdown) == {u.id for u in staff[sbu.id]}
+        for user in staff[sbu.id]:
+            sales = _sales_sum(db, start, end, Sale.sbu_id == sbu.id, Sale.created_by == user.id)
+            expenses = _expenses_sum(db, start, end, Expense.sbu_id == sbu.id, Expense.created_by == user.id)
+            row = breakdown[user.id]
+            assert (row["staff_name"], row["total_sales"], row["total_expenses"]) == (user.full_name, sales, expenses)
+            assert row["net_profit"] == sales - expenses
+
+        idle = breakdown[staff[sbu.id][-1].id]
+        assert (idle["total_sales"], idle["total_expenses"]) == (0, 0)
+        assert measures["total_sales"] == _sales_sum(db, start, end, Sale.sbu_id == sbu.id)
+
+
+@pytest.mark.parametrize("start,end", RANGES)
+def test_staff_scope_matches_sum_queries(db, seeded, start, end):
+    _, staff = seeded
+    for members in staff.values():
+        for user in members:
+            assert staff_measures(db, user.id, start, end) == {
+                "total_sales": _sales_sum(db, start, end, Sale.created_by == user.id),
+                "total_expenses": _expenses_sum(db, start, end, Expense.created_by == user.id),
+            }
+
+
+def test_day_grouping_matches_grouped_sums(db, seeded):
+    _, staff = seeded
+    start, end = START, START + timedelta(days=DAYS - 1)
+    user = next(iter(staff.values()))[0]
+
+    expected = {}
+    for day, amount in (
+        db.query(Sale.date, func.sum(Sale.amount))
+        .filter(Sale.created_by == user.id, Sale.date.between(start, end), Sale.is_cancelled == False)
+        .group_by(Sale.date)
+    ):
+        expected.setdefault(day, [0, 0])[0] = int(amount)
+    for day, amount in (
+        db.query(Expense.effective_from, func.sum(Expense.amount))
+        .filter(Expense.created_by == user.id, Expense.effective_from.between(start, end), Expense.is_cancelled == False)
+        .group_by(Expense.effective_from)
+    ):
+        expected.setdefault(day, [0, 0])[1] = int(amount)
+
+    rows = aggregate(db, "staff", user.id, start, end, group_by="day")
+    assert [r["key"] for r in rows] == sorted(expected)
+    assert {r["key"]: [r["sales"], r["expenses"]] for r in rows} == expected
+
+
+def test_category_grouping_matches_dashboard_sums(db, seeded):
+    sbus, _ = seeded
+    for sbu in sbus:
+        for offset in range(0, DAYS, 7):
+            day = START + timedelta(days=offset)
+            expected = dict.fromkeys(EXPENSE_CATEGORIES, 0)
+            for category, amount in (
+                db.query(Expense.category, func.sum(Expense.amount))
+                .filter(Expense.sbu_id == sbu.id, Expense.effective_from == day, Expense.is_cancelled == False)
+                .group_by(Expense.category)
+            ):
+                expected[category] = int(amount)
+
+            assert dashboard_measures(db, sbu.id, day) == {
+                "sales_today": _sales_sum(db, day, day, Sale.sbu_id == sbu.id),
+                "variable_costs": expected,
+            }
+
+
+def test_portfolio_by_sbu_matches_sum_queries(db, seeded):
+    sbus, _ = seeded
+    start, end = RANGES[1]
+    rows = {r["key"]: (r["sales"], r["expenses"]) for r in aggregate(db, "portfolio", None, start, end, group_by="sbu")}
+    assert rows == {
+        sbu.id: (
+            _sales_sum(db, start, end, Sale.sbu_id == sbu.id),
+            _expenses_sum(db, start, end, Expense.sbu_id == sbu.id),
+        )
+        for sbu in sbus
+    }
+
+
+def test_cancelled_rows_are_excluded(db):
+    sbu = SBU(id=new_id(), name="Solo", department="Clinic", daily_budget=0)
+    user = User(id=new_id(), full_name="Solo staff", username="solo", password_hash="x", role="staff", sbu_id=sbu.id)
+    db.add_all([sbu, user])
+    db.flush()
+    db.add_all([
+        Sale(id=new_id(), sbu_id=sbu.id, amount=100, date=START, is_cancelled=False, created_by=user.id),
+        Sale(id=new_id(), sbu_id=sbu.id, amount=900, date=START, is_cancelled=True, created_by=user.id),
+        Expense(id=new_id(), sbu_id=sbu.id, category="utilities", amount=30, effective_from=START,
+                is_cancelled=False, created_by=user.id),
+        Expense(id=new_id(), sbu_id=sbu.id, category="utilities", amount=70, effective_from=START,
+                is_cancelled=True, created_by=user.id),
+    ])
+    db.commit()
+
+    assert totals(aggregate(db, "sbu", sbu.id, START, START)) == (100, 30)
+    assert dashboard_measures(db, sbu.id, START)["variable_costs"]["utilities"] == 30
+    assert sbu_measures(db, sbu.id, START, START)["staff_breakdown"][0]["net_profit"] == 70
+
+
+def test_unknown_grouping_is_rejected(db):
+    with pytest.raises(ValueError):
+        aggregate(db, "sbu", new_id(), START, START, group_by="week")
@@ -0,0 +1,136 @@
+"""
+edge.apply_push against retried and overlapping batches.
+
+An edge resends a batch whenever the response is lost, and the retry
+may carry more entries than the first try. Head office skips every
+entry at or below the last seq it applied for the install.
+"""
+from datetime import date
+
+import orjson
+import pytest
+from pydantic import ValidationError
+
+import edge
+from database import commit
+from keys import new_id
+from models import SBU, User, Sale, Expense
+from schemas import EdgeBatchSchema
+
+DAY = date(2026, 3, 2)
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def member(db):
+    sbu = SBU(id=new_id(), name="Edge", department="Clinic", daily_budget=0)
+    user = User(id=new_id(), full_name="Edge staff", username="edge", password_hash="x", role="staff", sbu_id=sbu.id)
+    db.add_all([sbu, user])
+    db.commit()
+    return sbu, user
+
+
+def _sale(seq, user, amount, is_cancelled=False):
+    return {
+        "seq": seq,
+        "id": str(new_id()),
+        "date": DAY.isoformat(),
+        "amount": amount,
+        "notes": None,
+        "created_by": user.id,
+        "is_cancelled": is_cancelled,
+    }
+
+
+def _expense(seq, user, amount, cancelled=False):
+    return {
+        "seq": seq,
+        "id": str(new_id()),
+        "date": DAY.isoformat(),
+        "category": "utilities",
+        "amount": amount,
+        "notes": None,
+        "created_by": user.id,
+        "cancelled": cancelled,
+    }
+
+
+def _push(db, sbu, batch):
+    response = edge.apply_push(db, sbu.id, batch)
+    commit(db)
+    return response
+
+
+def _state(db, sbu):
+    """(sale amount, sale cancelled, open utilities total) for DAY."""
+    sale = db.query(Sale).filter(Sale.sbu_id == sbu.id, Sale.date == DAY).one()
+    expenses = sum(
+        e.amount for e in
+        db.query(Expense).filter(Expense.sbu_id == sbu.id, Expense.effective_from == DAY, Expense.is_cancelled == False)
+    )
+    return sale.amount, sale.is_cancelled, expenses
+
+
+# ================= TESTS =================
+def test_replayed_batch_is_a_no_op(db, member):
+    sbu, user = member
+    batch = {
+        "install": "edge-a",
+        "through": 3,
+        "sales": [_sale(1, user, 500)],
+        "expenses": [_expense(2, user, 40), _expense(3, user, 10)],
+    }
+    assert _push(db, sbu, batch) == {"sales": 1, "expenses": 2, "audit_logs": 0}
+    assert _state(db, sbu) == (500, False, 50)
+
+    assert _push(db, sbu, batch) == {"sales": 0, "expenses": 0, "audit_logs": 0}
+    assert _state(db, sbu) == (500, False, 50)
+
+
+def test_partial_batch_can_be_resent_longer(db, member):
+    sbu, user = member
+    first = [_sale(1, user, 500), _expense(2, user, 40)]
+    _push(db, sbu, {"install": "edge-a", "through": 2, "sales": [first[0]], "expenses": [first[1]]})
+
+    # The response was lost; the retry also carries what was written since
+    _push(db, sbu, {
+        "install": "edge-a",
+        "through": 4,
+        "sales": [_sale(3, user, 800)],
+        "expenses": [first[1], _expense(4, user, 25)],
+    })
+    assert _state(db, sbu) == (800, False, 65)
+
+    # Seqs are per install: another edge's seq 2 still applies
+    _push(db, sbu, {"install": "edge-b", "through": 2, "sales": [], "expenses": [_expense(2, user, 5)]})
+    assert _state(db, sbu) == (800, False, 70)
+
+
+def test_head_office_cancel_survives_a_later_edge_push(db, member):
+    sbu, user = member
+    _push(db, sbu, {"install": "edge-a", "through": 1, "sales": [_sale(1, user, 500)], "expenses": []})
+
+    sale = db.query(Sale).filter(Sale.sbu_id == sbu.id, Sale.date == DAY).one()
+    sale.is_cancelled = True
+    commit(db)
+
+    # The edge never saw the cancel and edits the day's amount
+    _push(db, sbu, {"install": "edge-a", "through": 2, "sales": [_sale(2, user, 650)], "expenses": []})
+    assert _state(db, sbu) == (650, True, 0)
+
+
+@pytest.mark.parametrize("field", ["seq", "date", "amount", "notes", "created_by", "is_cancelled"])
+def test_sale_entry_missing_a_field_is_rejected(member, field):
+    _, user = member
+    entry = _sale(1, user, 500)
+    del entry[field]
+    with pytest.raises(ValidationError):
+        EdgeBatchSchema.model_validate_json(orjson.dumps({"install": "edge-a", "through": 1, "sales": [entry]}))
+
+
+def test_bad_date_and_loose_types_are_rejected(member):
+    _, user = member
+    for change in ({"date": "2026-02-30"}, {"amount": "500"}, {"seq": 1.5}, {"is_cancelled": 1}):
+        entry = {**_sale(1, user, 500), **change}
+        with pytest.raises(ValidationError):
+            EdgeBatchSchema.model_validate_json(orjson.dumps({"install": "edge-a", "through": 1, "sales": [entry]}))
@@ -0,0 +1,170 @@
+"""
+Fixed-cost schedules against a naive per-day sum.
+
+The reference keeps every change as (valid_from, amount), drops the ones
+a later change supersedes, and adds up each day's amount one day at a
+time: what the reports summed before the step function existed.
+"""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import main
+from database import commit
+from fixed_costs import BEGINNING, COST_TYPES, CostSchedule, fixed_cost_index, schedule_change
+from keys import new_id
+from models import SBU, User, FixedCost
+from schemas import UpdateSBUSchema
+
+START = date(2026, 1, 1)
+DAYS = 60
+
+
+# ================= REFERENCE =================
+class NaiveCosts:
+    """Daily amount per cost type, looked up change by change."""
+
+    def __init__(self, sbu: SBU):
+        self.initial = {t: getattr(sbu, t) or 0 for t in COST_TYPES}
+        self.changes = {t: [] for t in COST_TYPES}
+
+    def change(self, cost_type: str, amount: int, valid_from: date):
+        # A change supersedes everything dated on or after it
+        kept = [c for c in self.changes[cost_type] if c[0] < valid_from]
+        self.changes[cost_type] = kept + [(valid_from, amount)]
+
+    def on(self, cost_type: str, day: date) -> int:
+        amount = self.initial[cost_type]
+        for valid_from, value in self.changes[cost_type]:
+            if valid_from <= day:
+                amount = value
+        return amount
+
+    def total(self, start: date, end: date) -> int:
+        days = (end - start).days + 1
+        return sum(self.on(t, start + timedelta(days=i)) for t in COST_TYPES for i in range(days))
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def sbu(db):
+    sbu = SBU(
+        id=new_id(), name="Costs", department="Clinic", daily_budget=0,
+        personnel_cost=30, rent=12, electricity=5
+    )
+    db.add(sbu)
+    db.commit()
+    return sbu
+
+
+RANGES = [
+    (START, START),
+    (START + timedelta(days=5), START + timedelta(days=25)),
+    (START, START + timedelta(days=DAYS - 1)),
+    # Reaches back past every change, into the seeded BEGINNING row
+    (START - timedelta(days=400), START + timedelta(days=10)),
+]
+
+
+# ================= STEP FUNCTION =================
+def test_cost_schedule_matches_per_day_sum():
+    rng = random.Random(46)
+    for _ in range(50):
+        days = sorted(rng.sample(range(DAYS), rng.randrange(1, 8)))
+        steps = [(START.toordinal() + d, rng.randrange(0, 100)) for d in days]
+        schedule = CostSchedule(steps)
+
+        def on(day):
+            amount = 0
+            for start, value in steps:
+                if start <= day.toordinal():
+                    amount = value
+            return amount
+
+        for _ in range(20):
+            a, b = sorted(rng.randrange(-5, DAYS + 5) for _ in range(2))
+            start, end = START + timedelta(days=a), START + timedelta(days=b)
+            expected = sum(on(start + timedelta(days=i)) for i in range((end - start).days + 1))
+            assert schedule.total(start, end) == expected
+            assert schedule.on(start) == on(start)
+
+
+# ================= SCHEDULE CHANGES =================
+def test_first_change_seeds_the_column_value_from_beginning(db, sbu):
+    schedule_change(db, sbu, "rent", 20, START + timedelta(days=10))
+    commit(db)
+
+    rows = db.query(FixedCost).filter(FixedCost.sbu_id == sbu.id).order_by(FixedCost.valid_from).all()
+    assert [(r.valid_from, r.valid_to, r.amount) for r in rows] == [
+        (BEGINNING, START + timedelta(days=9), 12),
+        (START + timedelta(days=10), None, 20),
+    ]
+    assert fixed_cost_index.on(db, sbu, BEGINNING)["rent"] == 12
+    assert fixed_cost_index.on(db, sbu, date.max)["rent"] == 20
+
+
+def test_same_day_re_edit_overwrites(db, sbu):
+    day = START + timedelta(days=3)
+    naive = NaiveCosts(sbu)
+    for amount in (50, 70, 0, 45):
+        schedule_change(db, sbu, "electricity", amount, day)
+        naive.change("electricity", amount, day)
+        commit(db)
+
+    assert db.query(FixedCost).filter(FixedCost.sbu_id == sbu.id, FixedCost.valid_from == day).count() == 1
+    for start, end in RANGES:
+        assert fixed_cost_index.total(db, sbu, start, end) == naive.total(start, end)
+
+
+def test_random_changes_match_per_day_sum(db, sbu):
+    rng = random.Random(460)
+    naive = NaiveCosts(sbu)
+    for _ in range(40):
+        cost_type = rng.choice(COST_TYPES)
+        amount = rng.randrange(0, 100)
+        valid_from = START + timedelta(days=rng.randrange(DAYS))
+        schedule_change(db, sbu, cost_type, amount, valid_from)
+        naive.change(cost_type, amount, valid_from)
+        commit(db)
+
+        for start, end in RANGES:
+            assert fixed_cost_index.total(db, sbu, start, end) == naive.total(start, end)
+
+
+# ================= UPDATE SBU =================
+@pytest.fixture
+def admin(db):
+    admin = User(id=new_id(), full_name="Ops", username="ops", password_hash="x", role="ops_admin")
+    db.add(admin)
+    db.commit()
+    return admin
+
+
+def test_update_sbu_schedules_edits_from_today(db, sbu, admin):
+    def _update(**fields):
+        main.update_sbu(sbu.id, UpdateSBUSchema(**fields), db, admin)
+
+    today = date.today()
+    naive = NaiveCosts(sbu)
+    ranges = [(today - timedelta(days=30), today + timedelta(days=30)), (today, today)]
+
+    _update(rent=25)
+    naive.change("rent", 25, today)
+    # Unchanged amounts leave the schedule alone
+    _update(rent=25, electricity=5)
+    assert db.query(FixedCost).filter(FixedCost.sbu_id == sbu.id).count() == 2
+
+    # A change already scheduled for later is superseded by an edit back to today's amount
+    later = today + timedelta(days=10)
+    schedule_change(db, sbu, "rent", 40, later)
+    naive.change("rent", 40, later)
+    commit(db)
+    assert fixed_cost_index.total(db, sbu, *ranges[0]) == naive.total(*ranges[0])
+
+    _update(rent=25)
+    naive.change("rent", 25, today)
+    for start, end in ranges:
+        assert fixed_cost_index.total(db, sbu, start, end) == naive.total(start, end)
+    assert fixed_cost_index.on(db, sbu, date.max) == {"personnel_cost": 30, "rent": 25, "electricity": 5}
+    assert fixed_cost_index.on(db, sbu, today - timedelta(days=1))["rent"] == 12
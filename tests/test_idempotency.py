@@ -0,0 +1,72 @@
+"""
+Idempotency-Key replays on the staff write endpoints.
+
+A retry with the same key and body gets the stored response back and
+writes nothing; the same key with a different body is a client bug and
+is rejected.
+"""
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from auth import get_current_user
+from keys import new_id
+from models import SBU, User, Sale, Expense, AuditLog
+
+DAY = date(2026, 3, 2)
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def client(db):
+    sbu = SBU(id=new_id(), name="Idem", department="Clinic", daily_budget=0)
+    user = User(id=new_id(), full_name="Idem staff", username="idem", password_hash="x", role="staff", sbu_id=sbu.id)
+    db.add_all([sbu, user])
+    db.commit()
+
+    # No lifespan: the background loops are not needed here
+    main.app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+SALE = {"amount": 500, "sale_date": DAY.isoformat()}
+EXPENSE = {"category": "utilities", "amount": 40, "date": DAY.isoformat()}
+
+
+# ================= TESTS =================
+@pytest.mark.parametrize("path,body,model", [("/staff/sales", SALE, Sale), ("/staff/expenses", EXPENSE, Expense)])
+def test_replay_returns_the_stored_response(db, client, path, body, model):
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post(path, json=body, headers=headers)
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+
+    replay = client.post(path, json=body, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == first.json()
+
+    # Written once: an expense retry would otherwise add to the open entry again
+    assert db.query(model).count() == 1
+    assert sum(row.amount for row in db.query(model)) == body["amount"]
+    assert db.query(AuditLog).count() == 1
+
+
+def test_same_key_with_a_different_body_is_rejected(db, client):
+    headers = {"Idempotency-Key": "retry-2"}
+    assert client.post("/staff/sales", json=SALE, headers=headers).status_code == 200
+
+    response = client.post("/staff/sales", json={**SALE, "amount": 900}, headers=headers)
+    assert response.status_code == 422
+    assert db.query(Sale).one().amount == 500
+
+
+def test_requests_without_a_key_are_applied_every_time(db, client):
+    for _ in range(2):
+        assert client.post("/staff/expenses", json=EXPENSE).status_code == 200
+    assert db.query(Expense).one().amount == 80
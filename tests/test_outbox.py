@@ -0,0 +1,135 @@
+"""
+Outbox seqs against commit order, and compaction against its cursor.
+
+A reader that has seen seq N must never be handed an event below N
+later on, so seqs are allocated when a transaction commits, not when it
+first writes. Compaction may drop superseded history, but nothing an
+edge install has not pushed yet (after through_seq).
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import outbox
+from database import SessionLocal, commit
+from keys import new_id
+from models import SBU, Sale, ChangeEvent
+
+DAY = date(2026, 3, 2)
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def sbu(db):
+    sbu = SBU(id=new_id(), name="Outbox", department="Clinic", daily_budget=0)
+    db.add(sbu)
+    commit(db)
+    return sbu
+
+
+@pytest.fixture
+def other(db):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _sale(sbu, amount, day=DAY):
+    return Sale(id=new_id(), sbu_id=sbu.id, amount=amount, date=day, is_cancelled=False)
+
+
+def _seqs(db, entity_id):
+    return [e.seq for e in db.query(ChangeEvent).filter(ChangeEvent.entity_id == entity_id).order_by(ChangeEvent.seq)]
+
+
+# ================= SEQ ORDER =================
+def test_interleaved_transactions_get_seqs_in_commit_order(db, other, sbu):
+    cursor = outbox.committed_seq(db)
+
+    # A starts first and stages its sale, B starts later but commits first
+    first = _sale(sbu, 100)
+    db.query(SBU).filter(SBU.id == sbu.id).one()
+    db.add(first)
+
+    second = _sale(sbu, 200, DAY + timedelta(days=1))
+    other.add(second)
+    commit(other)
+    second_seq = outbox.committed_seq(other)
+
+    # A reader polling between the two commits sees only B and moves its cursor past it
+    assert [e.entity_id for e in outbox.read(other, cursor, 100)] == [second.id]
+
+    commit(db)
+    first_seq = outbox.committed_seq(db)
+    assert first_seq > second_seq
+    assert [e.entity_id for e in outbox.read(other, second_seq, 100)] == [first.id]
+
+
+def test_one_commit_gets_consecutive_seqs(db, sbu):
+    sales = [_sale(sbu, amount, DAY + timedelta(days=i)) for i, amount in enumerate((10, 20, 30))]
+    db.add_all(sales)
+    commit(db)
+
+    seqs = [_seqs(db, s.id)[0] for s in sales]
+    last = outbox.committed_seq(db)
+    assert sorted(seqs) == list(range(last - 2, last + 1))
+
+
+def test_rolled_back_changes_leave_no_events(db, sbu):
+    before = outbox.committed_seq(db)
+    sale = _sale(sbu, 100)
+    db.add(sale)
+    db.flush()
+    db.rollback()
+
+    db.add(_sale(sbu, 50, DAY + timedelta(days=1)))
+    commit(db)
+    assert _seqs(db, sale.id) == []
+    assert outbox.committed_seq(db) == before + 1
+
+
+# ================= COMPACTION =================
+def _age(db, days):
+    db.query(ChangeEvent).update({ChangeEvent.created_at: datetime.utcnow() - timedelta(days=days)})
+    db.commit()
+
+
+def test_compaction_keeps_everything_after_through_seq(db, sbu):
+    sale = _sale(sbu, 1)
+    db.add(sale)
+    commit(db)
+    for amount in range(2, 12):
+        sale.amount = amount
+        commit(db)
+    _age(db, 2)
+
+    seqs = _seqs(db, sale.id)
+    through = seqs[4]
+    outbox.compact(db, through_seq=through)
+
+    # Superseded events up to the cursor go; every event after it stays
+    assert _seqs(db, sale.id) == [s for s in seqs if s > through]
+
+    outbox.compact(db)
+    assert _seqs(db, sale.id) == [seqs[-1]]
+
+
+def test_compaction_keeps_tombstones_after_through_seq(db, sbu):
+    sales = [_sale(sbu, 1, DAY + timedelta(days=i)) for i in range(2)]
+    db.add_all(sales)
+    commit(db)
+    for sale in sales:
+        db.delete(sale)
+        commit(db)
+    _age(db, outbox.OUTBOX_TOMBSTONE_DAYS + 1)
+
+    through = _seqs(db, sales[0].id)[-1]
+    after = [e.seq for e in db.query(ChangeEvent).filter(ChangeEvent.seq > through)]
+    outbox.compact(db, through_seq=through)
+
+    # The first sale's tombstone is expired and pushed; the second's is not
+    assert _seqs(db, sales[0].id) == []
+    assert _seqs(db, sales[1].id) == after
+    assert [e.seq for e in db.query(ChangeEvent).filter(ChangeEvent.seq > through)] == after
@@ -0,0 +1,81 @@
+"""
+Refresh token rotation and reuse detection over POST /token/refresh.
+
+Every refresh hands out a new token and retires the presented one. A
+retired token coming back means it was copied, so the whole family
+(every token descended from the same login) stops working.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import main
+import refresh_tokens
+from database import commit
+from keys import new_id
+from models import User, RefreshToken
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth, "SECRET_KEY", "test-secret")
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def user(db):
+    user = User(id=new_id(), full_name="Token user", username="token", password_hash="x", role="staff")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _login(db, user):
+    """A refresh token as /login issues it, in a family of its own."""
+    token = refresh_tokens.issue(db, user.id)
+    commit(db)
+    return token
+
+
+def _refresh(client, token):
+    return client.post("/token/refresh", json={"refresh_token": token})
+
+
+# ================= TESTS =================
+def test_refresh_rotates_the_token(db, client, user):
+    token = _login(db, user)
+    response = _refresh(client, token)
+    assert response.status_code == 200
+    successor = response.json()["refresh_token"]
+    assert successor != token
+
+    assert _refresh(client, successor).status_code == 200
+
+
+def test_second_refresh_with_the_same_token_is_reuse(db, client, user):
+    token = _login(db, user)
+    successor = _refresh(client, token).json()["refresh_token"]
+
+    reused = _refresh(client, token)
+    assert reused.status_code == 401
+    assert "reused" in reused.json()["detail"]
+
+    # The rest of the family is revoked with it, including the live successor
+    assert _refresh(client, successor).status_code == 401
+    assert db.query(RefreshToken).count() == 0
+
+
+def test_reuse_leaves_other_logins_alone(db, client, user):
+    token = _login(db, user)
+    other = _login(db, user)
+    _refresh(client, token)
+    assert _refresh(client, token).status_code == 401
+
+    assert _refresh(client, other).status_code == 200
+
+
+def test_unknown_token_is_rejected(client, user):
+    response = _refresh(client, "not-a-token")
+    assert response.status_code == 401
+    assert "reused" not in response.json()["detail"]
@@ -0,0 +1,87 @@
+"""
+Snapshot versions against invalidations that race a compute.
+
+A compute claims its window's version before reading; a write to a day
+in the window bumps the version, so the compute's store() must fail and
+the stale result never reaches the store.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import snapshots
+from database import SessionLocal, commit
+from keys import new_id
+from models import SBU, User, Sale
+from reports import period_range, sbu_measures
+
+DAY = date.today() - timedelta(days=3)
+
+
+# ================= FIXTURES =================
+@pytest.fixture
+def member(db):
+    sbu = SBU(id=new_id(), name="Snap", department="Clinic", daily_budget=0)
+    user = User(id=new_id(), full_name="Snap staff", username="snap", password_hash="x", role="staff", sbu_id=sbu.id)
+    db.add_all([sbu, user])
+    db.add(Sale(id=new_id(), sbu_id=sbu.id, amount=100, date=DAY, is_cancelled=False, created_by=user.id))
+    db.commit()
+    return sbu, user
+
+
+@pytest.fixture
+def writer(db):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _write(session, sbu, user, amount):
+    """A late write to DAY, committed the way the sale endpoints do it."""
+    session.add(Sale(id=new_id(), sbu_id=sbu.id, amount=amount, date=DAY, is_cancelled=False, created_by=user.id))
+    snapshots.invalidate(session, sbu.id, DAY)
+    commit(session)
+
+
+# ================= TESTS =================
+def test_store_with_an_older_version_is_rejected_after_invalidate(db, writer, member):
+    sbu, user = member
+    start, end = period_range("weekly", DAY)
+
+    version = snapshots.claim(db, sbu.id, start, end)
+    result = sbu_measures(db, sbu.id, start, end)
+
+    # The write lands between the compute's read and its store
+    _write(writer, sbu, user, 50)
+
+    assert not snapshots.store(db, sbu.id, start, end, result, version)
+    db.rollback()
+    assert snapshots.lookup(db, sbu.id, start, end) is None
+
+
+def test_invalidate_after_store_marks_the_snapshot_stale(db, writer, member):
+    sbu, user = member
+    start, end = period_range("daily", DAY)
+
+    assert snapshots.compute(db, sbu.id, start, end)["total_sales"] == 100
+    assert snapshots.lookup(db, sbu.id, start, end)["total_sales"] == 100
+
+    _write(writer, sbu, user, 50)
+    assert snapshots.lookup(db, sbu.id, start, end) is None
+    assert snapshots.measures(db, sbu.id, start, end)["total_sales"] == 150
+    assert snapshots.lookup(db, sbu.id, start, end)["total_sales"] == 150
+
+
+def test_write_to_another_day_keeps_the_snapshot(db, writer, member):
+    sbu, user = member
+    start, end = period_range("daily", DAY)
+    snapshots.compute(db, sbu.id, start, end)
+
+    writer.add(Sale(
+        id=new_id(), sbu_id=sbu.id, amount=70, date=DAY - timedelta(days=1), is_cancelled=False, created_by=user.id
+    ))
+    snapshots.invalidate(writer, sbu.id, DAY - timedelta(days=1))
+    commit(writer)
+    assert snapshots.lookup(db, sbu.id, start, end)["total_sales"] == 100